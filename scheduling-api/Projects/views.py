@@ -3,17 +3,122 @@ from flask import Blueprint, request, jsonify
 from datetime import datetime, timedelta
 import re
 import pytz
-from createandget import _now, create_project, create_project_update, create_task, generate_unique_id, get_project_by_company_and_name
-from createandget import get_project_tasks, get_task_state, get_task_by_name
-from helpers import format_duration
+from createandget import _now, create_project, create_project_update, create_task, generate_unique_id, get_project_by_company_and_name, lookup_key
+from createandget import get_project_tasks, get_project_task_states, get_task_by_name, get_company_projects
+from helpers import decode_cursor, encode_cursor, format_duration, parse_fields, parse_time
+from etags import etag_digest, not_modified, with_etag
+from gantt_render import render_cache
+from snapshots import project_tasks_at, take_snapshot
+from rollups import apply_rollup_delta, bump_project_version, project_totals, rollup_delta, sum_rollups
+from task_states import _as_utc, get_project_task_windows, is_task_closed, project_versions, state_cache, states_valid_until
 from db import projects_col, tasks_col, updates_col, project_updates_col, teams_col
 from flask_jwt_extended import jwt_required, get_jwt
 
 projects_bp = Blueprint('projects', __name__, url_prefix='/projects')
 
+# Output field of /projects/view -> project fields it is built from
+PROJECT_VIEW_FIELDS = {
+    "id": ["id"],
+    "name": ["name"],
+    "start_date": ["start_date", "timezone"],
+    "planned_end": ["timezone"],
+    "project_type": ["project_type"],
+    "objectives": ["objectives"],
+    "expected_duration": ["expected_duration"],
+    "duration": ["duration"],
+    "total_estimated_cost": ["rollup"],
+    "state": [],
+    "team": ["team"],
+    "timezone": ["timezone"],
+    "task_count": ["rollup"],
+    "completed_tasks": ["rollup"],
+    "tasks": ["timezone"],
+}
+
+# Task fields needed to evaluate states and resolve dependency names
+TASK_STATE_FIELDS = {
+    "_id": 0, "id": 1, "project_id": 1, "name": 1, "start_time": 1, "expected_duration": 1,
+    "latest_status": 1, "postponed": 1, "dependencies": 1
+}
+
+TASK_VIEW_FIELDS = {
+    **TASK_STATE_FIELDS, "duration": 1, "estimated_cost": 1, "members": 1, "priority": 1
+}
+
+MAX_PAGE_SIZE = 200
+
+
+def _iso(value, timezone_str):
+    """FIXED: Safe datetime -> ISO8601 conversion (naive values are read in the project's timezone)."""
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = pytz.timezone(timezone_str).localize(value)
+        return value.isoformat()
+    return value if value is None else str(value)
+
+
+def _page_args(data):
+    """
+    limit/cursor from a request body -> (limit, after); limit is None when not paginating.
+    Raises ValueError on a malformed limit or cursor.
+    """
+    limit = data.get('limit')
+    if limit is None:
+        return None, None
+    try:
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    except (TypeError, ValueError):
+        raise ValueError("limit must be a number")
+    after = decode_cursor(data['cursor']) if data.get('cursor') else None
+    return limit, after
+
+
+def _project_state(task_states):
+    if not task_states:
+        return 'tentative'
+    if all(state == 'complete' for state in task_states):
+        return 'complete'
+    if any(state in ['active', 'in progress'] for state in task_states):
+        return 'active'
+    if any(state == 'overdue' for state in task_states):
+        return 'overdue'
+    return 'tentative'
+
+
+def _task_entry(t, timezone_str, id_to_name, state_by_id):
+    # Convert dependency ids -> names when possible
+    dep_names = [id_to_name.get(dep, dep) for dep in (t.get('dependencies', []) or [])]
+
+    return {
+        "id": t.get('id'),
+        "name": t.get('name'),
+        "start_time": _iso(t.get('start_time'), timezone_str),
+        "expected_duration": format_duration(t.get('expected_duration', 0)),  # Keep formatted string for display
+        "expected_duration_minutes": t.get('expected_duration', 0),  # NEW: Raw minutes for calculations
+        **({"actual_duration": format_duration(t['duration'])} if t.get('duration', 0) > 0 else {}),
+        **({"actual_duration_minutes": t.get('duration', 0)} if t.get('duration', 0) > 0 else {}),  # NEW: If actual exists
+        "estimated_cost": t.get('estimated_cost', 0),
+        "members": t.get('members', []),
+        "dependencies": dep_names,
+        "status": state_by_id.get(t.get('id')),  # CHANGED: Rename from "state" to "status" for frontend consistency
+        "priority": t.get('priority', 'medium'),
+        "progress": t.get('latest_status', 0)  # Already good
+    }
+
+
 @projects_bp.route('/view', methods=['POST'])
 @jwt_required()  # FIXED: Add JWT protection
 def view_projects():
+    """
+    Projects of the company, ordered by (start_date, id).
+    Optional body fields:
+      fields  list (or comma-separated string) of output fields, e.g. ["id", "name", "state"];
+              leaving out "tasks" skips loading the task list
+    Projects and their tasks come from a single aggregation, however many projects there are.
+      limit   page size (max 200); the response then carries next_cursor
+      cursor  next_cursor of the previous page
+    Without limit every project is returned, as before.
+    """
     data = request.json or {}
     claims = get_jwt()
     company = claims.get('company_name')  # FIXED: Get company from JWT claims
@@ -21,103 +126,140 @@ def view_projects():
     if not company:
         return jsonify({"error": "company_name is required"}), 400
 
-    company_filter = {"company_name": {"$regex": f"^{re.escape(company)}$", "$options": "i"}}
+    fields = parse_fields(data.get('fields'))
+    unknown = fields - PROJECT_VIEW_FIELDS.keys() if fields else set()
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+    wanted = fields or set(PROJECT_VIEW_FIELDS)
+    try:
+        limit, after = _page_args(data)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Unchanged since the client's copy: answer from the project versions alone
+    versions = list(projects_col.find({"company_key": lookup_key(company)}, {"_id": 0, "id": 1, "version": 1}))
+    digest = etag_digest('projects/view', versions, [sorted(wanted), limit, data.get('cursor')])
+    cached = not_modified(digest)
+    if cached:
+        return cached
+
+    # Push the projection down: only load what the requested fields are built from
+    projection = {"_id": 0, "id": 1, "start_date": 1}
+    for field in wanted:
+        projection.update({src: 1 for src in PROJECT_VIEW_FIELDS[field]})
+
+    # Tasks are only joined when the tasks list or the derived state is asked for
+    if 'tasks' in wanted:
+        task_projection = TASK_VIEW_FIELDS
+    elif 'state' in wanted:
+        task_projection = TASK_STATE_FIELDS
+    elif 'planned_end' in wanted:
+        task_projection = {"_id": 0, "start_time": 1, "expected_duration": 1}
+    else:
+        task_projection = None
+
+    # One aggregation for the whole page, tasks included; one extra project tells whether there is a next page
+    projects = get_company_projects(company, projection, task_projection,
+                                    limit=limit + 1 if limit else None, after=after)
+    has_more = bool(limit) and len(projects) > limit
+    projects = projects[:limit] if limit else projects
 
     results = []
-    projects_cursor = projects_col.find(company_filter)
-    
-    for proj in projects_cursor:
-        # Prefer explicit 'id' if you set it; else fall back to Mongo _id
-        proj_id = proj.get('id') or (str(proj.get('_id')) if proj.get('_id') is not None else None)
-
-        # Fetch tasks via helper (Mongo-backed), then compute aggregates locally
-        tasks = get_project_tasks(proj_id) or []
-
-        # Map task id -> name for dependency name resolution
-        id_to_name = {t.get('id'): t.get('name') for t in tasks if t}
-
-        total_cost = sum((t or {}).get('estimated_cost', 0) for t in tasks)
-
-        # FIXED: Safe datetime -> ISO8601 conversion
-        start_date_val = proj.get('start_date')
-        if isinstance(start_date_val, datetime):
-            # Ensure timezone awareness
-            if start_date_val.tzinfo is None:
-                timezone_str = proj.get('timezone', 'Africa/Nairobi')
-                tz = pytz.timezone(timezone_str)
-                start_date_val = tz.localize(start_date_val)
-            start_date_iso = start_date_val.isoformat()
-        else:
-            start_date_iso = start_date_val if start_date_val is None else str(start_date_val)
-
-        # FIXED: Calculate project state based on task states
-        task_states = [get_task_state(t['id']) for t in tasks if t.get('id')]
-        if not task_states:
-            project_state = 'tentative'
-        elif all(state == 'complete' for state in task_states):
-            project_state = 'complete'
-        elif any(state in ['active', 'in progress'] for state in task_states):
-            project_state = 'active'
-        elif any(state == 'overdue' for state in task_states):
-            project_state = 'overdue'
-        else:
-            project_state = 'tentative'
+    valid_until = []
+    for proj in projects:
+        proj_id = proj.get('id')
+        timezone_str = proj.get('timezone', 'Africa/Nairobi')
+        tasks = proj.get('tasks', [])
+
+        # Evaluate every task state in one pass over the already-loaded tasks
+        windows = get_project_task_windows(tasks, versions=project_versions(versions)) if task_projection else {}
+        state_by_id = {tid: window[0] for tid, window in windows.items()}
+        valid_until.append(states_valid_until(windows))
+
+        # Totals come from the maintained rollup counters, not from the task list
+        totals = project_totals(proj)
 
         proj_info = {
             "id": proj_id,
             "name": proj.get('name'),
-            "start_date": start_date_iso,
+            "start_date": _iso(proj.get('start_date'), timezone_str),
+            "planned_end": _iso(proj.get('planned_end'), timezone_str),
             "project_type": proj.get('project_type', 'scheduled'),
             "objectives": proj.get('objectives', []),
             "expected_duration": proj.get('expected_duration'),
             **({"duration": format_duration(proj['duration'])} if proj.get('duration') else {}),
-            "total_estimated_cost": total_cost,
-            "state": project_state,  # FIXED: Use calculated state
+            "total_estimated_cost": totals['estimated_cost'],
+            "state": _project_state(list(state_by_id.values())),  # FIXED: Use calculated state
             "team": proj.get('team', []),
-            "timezone": proj.get('timezone', 'Africa/Nairobi'),  # FIXED: Include timezone
-            "task_count": len(tasks),  # FIXED: Add task count
-            "completed_tasks": len([t for t in tasks if get_task_state(t['id']) == 'complete']),  # FIXED: Add completed task count
-            "tasks": []
+            "timezone": timezone_str,  # FIXED: Include timezone
+            "task_count": totals['task_count'],  # FIXED: Add task count
+            "completed_tasks": totals['complete'],  # FIXED: Add completed task count
         }
+        if 'tasks' in wanted:
+            # Map task id -> name for dependency name resolution
+            id_to_name = {t.get('id'): t.get('name') for t in tasks if t}
+            proj_info['tasks'] = [_task_entry(t, timezone_str, id_to_name, state_by_id) for t in tasks if t]
 
-        for t in tasks:
-            if not t:
-                continue
-                
-            # FIXED: Safe datetime -> ISO8601 conversion for tasks
-            st_val = t.get('start_time')
-            if isinstance(st_val, datetime):
-                if st_val.tzinfo is None:
-                    timezone_str = proj.get('timezone', 'Africa/Nairobi')
-                    tz = pytz.timezone(timezone_str)
-                    st_val = tz.localize(st_val)
-                st_iso = st_val.isoformat()
-            else:
-                st_iso = st_val if st_val is None else str(st_val)
-
-            # Convert dependency ids -> names when possible
-            dep_names = [id_to_name.get(dep, dep) for dep in (t.get('dependencies', []) or [])]
-
-            task_entry = {
-                "id": t.get('id'),
-                "name": t.get('name'),
-                "start_time": st_iso,
-                "expected_duration": format_duration(t.get('expected_duration', 0)),  # Keep formatted string for display
-                "expected_duration_minutes": t.get('expected_duration', 0),  # NEW: Raw minutes for calculations
-                **({"actual_duration": format_duration(t['duration'])} if t.get('duration', 0) > 0 else {}),
-                **({"actual_duration_minutes": t.get('duration', 0)} if t.get('duration', 0) > 0 else {}),  # NEW: If actual exists
-                "estimated_cost": t.get('estimated_cost', 0),
-                "members": t.get('members', []),
-                "dependencies": dep_names,
-                "status": get_task_state(t['id']),  # CHANGED: Rename from "state" to "status" for frontend consistency
-                "priority": t.get('priority', 'medium'),
-                "progress": t.get('latest_status', 0)  # Already good
-            }
-            proj_info['tasks'].append(task_entry)
+        results.append({k: v for k, v in proj_info.items() if k in wanted})
+
+    response = {"projects": results}
+    if limit:
+        last = projects[-1] if projects else None
+        response["next_cursor"] = encode_cursor(last.get('start_date'), last['id']) if has_more else None
+    expiry = min((until for until in valid_until if until is not None), default=None)
+    return with_etag((jsonify(response), 200), digest, expiry)
+
+
+@projects_bp.route('/tasks', methods=['POST'])
+@jwt_required()
+def view_project_tasks():
+    """
+    One page of a project's tasks, ordered by (start_time, id).
+    Body: project_name, optional limit (default 50, max 200), cursor and fields
+    (subset of the task fields returned by /projects/view).
+    """
+    data = request.json or {}
+    claims = get_jwt()
+    company = claims.get('company_name')
+    proj_name = data.get('project_name')
+
+    if not company or not proj_name:
+        return jsonify({"error": "company_name and project_name are required"}), 400
+
+    proj = projects_col.find_one(
+        {"company_key": lookup_key(company), "name_key": lookup_key(proj_name)},
+        {"_id": 0, "id": 1, "name": 1, "timezone": 1, "version": 1}
+    )
+    if not proj:
+        return jsonify({"error": "Project not found"}), 404
+
+    try:
+        limit, after = _page_args({**data, "limit": data.get('limit') or 50})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    fields = parse_fields(data.get('fields'))
 
-        results.append(proj_info)
+    # States and dependency names need the whole project, but only its small state fields
+    state_tasks = get_project_tasks(proj['id'], TASK_STATE_FIELDS)
+    state_by_id = get_project_task_states(state_tasks, versions=project_versions([proj]))
+    id_to_name = {t.get('id'): t.get('name') for t in state_tasks}
 
-    return jsonify({"projects": results}), 200
+    page = get_project_tasks(proj['id'], TASK_VIEW_FIELDS, limit=limit + 1, after=after)
+    has_more = len(page) > limit
+    page = page[:limit]
+
+    timezone_str = proj.get('timezone', 'Africa/Nairobi')
+    tasks = []
+    for t in page:
+        entry = _task_entry(t, timezone_str, id_to_name, state_by_id)
+        tasks.append({k: v for k, v in entry.items() if k in fields} if fields else entry)
+
+    last = page[-1] if page else None
+    return jsonify({
+        "project": proj['name'],
+        "tasks": tasks,
+        "next_cursor": encode_cursor(last.get('start_time'), last['id']) if has_more else None
+    }), 200
 
 @projects_bp.route('/latest_updates', methods=['POST'])
 @jwt_required()  # FIXED: Add JWT protection
@@ -132,8 +274,8 @@ def latest_updates():
     # Filter projects
     proj_name = data.get('project_name')
     matching = list(projects_col.find({
-        "company_name": {"$regex": f"^{re.escape(company)}$", "$options": "i"},
-        **({"name": {"$regex": f"^{re.escape(proj_name)}$", "$options": "i"}} if proj_name else {})
+        "company_key": lookup_key(company),
+        **({"name_key": lookup_key(proj_name)} if proj_name else {})
     }))
     
     if proj_name and not matching:
@@ -213,12 +355,17 @@ def split_project():
         )
         new_ids.append({'id':new['id'],'name':new['name']})
         # move tasks
+        moved = []
         for tname in part.get('tasks',[]):
             task = get_task_by_name(proj['id'], tname)
             if task:
                 tasks_col.update_one({"id": task['id']}, {"$set": {"project_id": new['id']}})
                 projects_col.update_one({"id": new['id']}, {"$push": {"tasks": task['id']}})
                 projects_col.update_one({"id": proj['id']}, {"$pull": {"tasks": task['id']}})
+                moved.append(task)
+        # Carry the moved tasks' counters over to the new project
+        apply_rollup_delta(new['id'], sum_rollups(moved))
+        apply_rollup_delta(proj['id'], sum_rollups(moved, sign=-1))
         create_project_update(new['id'], f"Project split from {original}")
         if split_team:
             try:
@@ -261,6 +408,11 @@ def merge_projects():
         for tid in p.get('tasks', []):
             tasks_col.update_one({"id": tid}, {"$set": {"project_id": merged['id']}})
             projects_col.update_one({"id": merged['id']}, {"$push": {"tasks": tid}})
+        # All of the source's tasks moved, so its counters move with them
+        source_totals = project_totals(p)
+        apply_rollup_delta(merged['id'], source_totals)
+        if not delete_sources:
+            apply_rollup_delta(p['id'], {k: -v for k, v in source_totals.items()})
         if merge_teams:
             # Merge team arrays into merged project (unique)
             source_team = p.get('team', [])
@@ -325,6 +477,7 @@ def clone_project():
         old_task = tasks_col.find_one({"id": old_id})
         new_deps = [old_to_new.get(d, d) for d in old_task.get('dependencies', [])]
         tasks_col.update_one({"id": new_id}, {"$set": {"dependencies": new_deps}})
+    bump_project_version(cloned['id'])
     create_project_update(cloned['id'], f"Cloned from {original}")
     return jsonify({'cloned_project':{'id':cloned['id'],'name':cloned['name']}}),200
 
@@ -338,18 +491,14 @@ def project_states():
     if not company:
         return jsonify({"error": "company_name is required"}), 400
 
-    time_str = data.get('time')
-    now = datetime.now(pytz.UTC)
-    if time_str:
-        try:
-            now = datetime.fromisoformat(time_str)
-            if now.tzinfo is None:
-                now = pytz.UTC.localize(now)
-        except ValueError:
-            return jsonify({"error": "Invalid time format, use ISO8601"}), 400
+    try:
+        at_time = parse_time(data.get('time'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    now = at_time or datetime.now(pytz.UTC)
 
     results = []
-    projects_cursor = projects_col.find({"company_name": {"$regex": f"^{re.escape(company)}$", "$options": "i"}})
+    projects_cursor = projects_col.find({"company_key": lookup_key(company)})
     
     for proj in projects_cursor:
         # Handle project-level dependencies
@@ -366,27 +515,28 @@ def project_states():
         if delayed:
             state = 'delayed'
         else:
-            # Compute task states
-            tasks = get_project_tasks(proj['id'])
+            # Compute task states (with the progress of that time when one is given)
+            tasks = project_tasks_at(proj['id'], at_time) if at_time else get_project_tasks(proj['id'])
             if not tasks:
                 state = 'tentative'
             else:
-                states = [get_task_state(t['id'], now) for t in tasks]
+                states = list(get_project_task_states(tasks, at_time, project_versions([proj])).values())
                 # Determine project state
                 if all(s == 'tentative' for s in states):
                     state = 'tentative'
                 elif all(s == 'complete' for s in states):
                     state = 'complete'
                 elif now > max(
-                    (t['start_time'] + timedelta(minutes=t.get('expected_duration', 0)))
+                    (_as_utc(t['start_time']) + timedelta(minutes=t.get('expected_duration', 0)))
                     for t in tasks
                 ):
                     state = 'overdue'
                 else:
                     state = 'active'
 
-        # Save and append
-        projects_col.update_one({"id": proj['id']}, {"$set": {"state": state}})
+        # Save the current state (bumping the version only when it changed) and append
+        if not at_time:
+            projects_col.update_one({"id": proj['id'], "state": {"$ne": state}}, {"$set": {"state": state}, "$inc": {"version": 1}})
         results.append({
             'project_id': proj['id'],
             'project_name': proj['name'],
@@ -414,14 +564,17 @@ def restore():
         return jsonify({"error": "Task not found"}), 404
     if not task_name:
         prev_state = proj.get('state')
-        projects_col.update_one({"id": proj['id']}, {"$set": {"state": "active"}})
+        projects_col.update_one({"id": proj['id']}, {"$set": {"state": "active"}, "$inc": {"version": 1}})
         
         # restore all tasks to in progress if they were complete
-        for tid in proj.get('tasks', []):
-            task = tasks_col.find_one({"id": tid})
-            if task and get_task_state(tid) == 'complete':
-                # Reset task status by updating latest_status
-                tasks_col.update_one({"id": tid}, {"$set": {"latest_status": 90, "postponed": False}})
+        restored = [t for t in get_project_tasks(proj['id']) if is_task_closed(t)]
+        if restored:
+            # Reset task status by updating latest_status
+            tasks_col.update_many({"id": {"$in": [t['id'] for t in restored]}}, {"$set": {"latest_status": 90, "postponed": False}})
+            state_cache.invalidate([t['id'] for t in restored])
+            apply_rollup_delta(proj['id'], rollup_delta(restored, [{**t, "latest_status": 90} for t in restored]))
+            # Restores leave no update record; a snapshot keeps point-in-time views right
+            take_snapshot(proj['id'])
                 
         create_project_update(proj['id'], f"Project '{proj_name}' restored from {prev_state}")
         return jsonify({
@@ -438,13 +591,17 @@ def restore():
     if not task:
         return jsonify({"error": "Task not found"}), 404
         
-    # only restore if complete
-    if get_task_state(task['id']) != 'complete':
+    # only restore closed tasks: the ones task updates refuse (see create_task_update)
+    if not is_task_closed(task):
         return jsonify({"error": "Task is not complete and cannot be restored"}), 400
 
     # Create a project_update log and reset task
     create_project_update(proj['id'], f"Restore task '{task_name}' to in progress")
     tasks_col.update_one({"id": task['id']}, {"$set": {"latest_status": 90, "postponed": False}})
+    state_cache.invalidate(task['id'])
+    apply_rollup_delta(proj['id'], rollup_delta(task, {**task, "latest_status": 90}))
+    # Restores leave no update record; a snapshot keeps point-in-time views right
+    take_snapshot(proj['id'])
     
     return jsonify({
         "message": f"Task '{task_name}' in project '{proj_name}' restored",
@@ -476,7 +633,7 @@ def remove_allocation():
     allocations = role_allocations.get(task['id'], [])
     new_allocations = [a for a in allocations if a['member'] != member]
     role_allocations[task['id']] = new_allocations
-    projects_col.update_one({"id": proj['id']}, {"$set": {"role_allocations": role_allocations}})
+    projects_col.update_one({"id": proj['id']}, {"$set": {"role_allocations": role_allocations}, "$inc": {"version": 1}})
     return jsonify({"message": f"Allocation removed for {member}", "allocations": new_allocations}), 200
 
 @projects_bp.route('/change_allocation', methods=['POST'])
@@ -509,7 +666,7 @@ def change_allocation():
             # not found -> create a new allocation for this member
             allocations.append({"member": member, "duty": duty})
         role_allocations[task['id']] = allocations
-        projects_col.update_one({"id": proj['id']}, {"$set": {"role_allocations": role_allocations}})
+        projects_col.update_one({"id": proj['id']}, {"$set": {"role_allocations": role_allocations}, "$inc": {"version": 1}})
         return jsonify({"message": f"Role allocation updated for {member}", "allocations": allocations}), 200
     elif allocation_type == 'funds':
         amount = data.get('amount')
@@ -517,7 +674,7 @@ def change_allocation():
             return jsonify({"error": "amount is required for funds allocation"}), 400
         fund_allocations = proj.get('fund_allocations', [])
         fund_allocations.append({"member": member, "amount": amount, "task_name": task_name})
-        projects_col.update_one({"id": proj['id']}, {"$set": {"fund_allocations": fund_allocations}})
+        projects_col.update_one({"id": proj['id']}, {"$set": {"fund_allocations": fund_allocations}, "$inc": {"version": 1}})
         return jsonify({"message": f"Funds allocation updated for {member}", "fund_allocations": fund_allocations}), 200
     else:
         return jsonify({"error":"Unknown allocation_type; use 'role' or 'funds'"}), 400
@@ -541,7 +698,7 @@ def allocate_funds():
     fund_allocations = proj.get('fund_allocations', [])
     entry = {"amount": amount, "member": member, "task_name": task_name}
     fund_allocations.append(entry)
-    projects_col.update_one({"id": proj['id']}, {"$set": {"fund_allocations": fund_allocations}})
+    projects_col.update_one({"id": proj['id']}, {"$set": {"fund_allocations": fund_allocations}, "$inc": {"version": 1}})
     return jsonify({"message": "Funds allocated", "fund_allocations": fund_allocations}), 200
 
 @projects_bp.route('/create_team', methods=['POST'])
@@ -617,7 +774,7 @@ def create_team():
     # Update project's plain email team list
     proj_team = set(proj.get('team', []))
     proj_team.update(unique_emails)
-    projects_col.update_one({"id": proj['id']}, {"$set": {"team": list(proj_team)}})
+    projects_col.update_one({"id": proj['id']}, {"$set": {"team": list(proj_team)}, "$inc": {"version": 1}})
 
     # Upsert full team document (with roles) in teams_col
     now_utc = datetime.utcnow()
@@ -671,8 +828,9 @@ def delete_project(project_name):
         # Delete project updates
         project_updates_col.delete_many({"project_id": project_id})
         
-        # Delete the project
+        # Delete the project and its cached renders
         projects_col.delete_one({"id": project_id})
+        render_cache.discard(project_id)
         
         return jsonify({"message": f"Project '{project_name}' deleted successfully"}), 200
         
@@ -691,6 +849,11 @@ def get_team_members(project_name):
         project = get_project_by_company_and_name(company, project_name)
         if not project:
             return jsonify({"error": "Project not found"}), 404
+
+        digest = etag_digest('projects/team', [project], project_name)
+        cached = not_modified(digest)
+        if cached:
+            return cached
             
         team_members = project.get('team', [])
         
@@ -712,11 +875,11 @@ def get_team_members(project_name):
             }
             member_details.append(member_info)
             
-        return jsonify({
+        return with_etag((jsonify({
             "project_name": project_name,
             "team_members": member_details,
             "total_members": len(member_details)
-        }), 200
+        }), 200), digest)
         
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -754,7 +917,7 @@ def add_team_member(project_name):
         current_team.append(email)
         projects_col.update_one(
             {"id": project['id']},
-            {"$set": {"team": current_team}}
+            {"$set": {"team": current_team}, "$inc": {"version": 1}}
         )
         
         create_project_update(project['id'], f"Added team member: {email}")
@@ -804,6 +967,7 @@ def remove_team_member(project_name, member_email):
             {"project_id": project['id']},
             {"$pull": {"members": member_email}}
         )
+        bump_project_version(project['id'])
         
         create_project_update(project['id'], f"Removed team member: {member_email}")
         
@@ -832,7 +996,7 @@ def add_objective():
     objectives = proj.get('objectives', [])
     objectives.append(objective)
     
-    projects_col.update_one({"id": proj['id']}, {"$set": {"objectives": objectives}})
+    projects_col.update_one({"id": proj['id']}, {"$set": {"objectives": objectives}, "$inc": {"version": 1}})
     create_project_update(proj['id'], f"Objective added: {objective}")
     return jsonify({"message": "Objective added", "objectives": objectives}), 200
 
@@ -851,7 +1015,7 @@ def add_users():
         return jsonify({"error": "Project not found"}), 404
     team = set(proj.get('team', []))
     team.update(users)
-    projects_col.update_one({"id": proj['id']}, {"$set": {"team": list(team)}})
+    projects_col.update_one({"id": proj['id']}, {"$set": {"team": list(team)}, "$inc": {"version": 1}})
     return jsonify({
         "message": f"Users added to project '{proj_name}'",
         "team": list(team)
@@ -1,13 +1,20 @@
 """
-Reports Blueprint — summary stats, per-project analytics, and CSV export.
+Reports Blueprint — summary stats, per-project analytics, and CSV / Parquet / Arrow export.
 """
-import csv
-import io
-from flask import Blueprint, request, jsonify, Response
+import os
+from datetime import datetime, timedelta
+import pytz
+from flask import Blueprint, request, jsonify, Response, send_file, stream_with_context
 from flask_jwt_extended import jwt_required, get_jwt
 
 from db import projects_col, tasks_col, updates_col
-from createandget import get_project_tasks, get_task_state
+from createandget import get_member_assignments, get_progress_history, lookup_key
+from exports import FORMATS, TABLES, ExportUnavailable, export_filename, load_export_projects, stream_export
+from export_jobs import artifact_path, get_job, job_view, submit_job
+from etags import etag_digest, not_modified, with_etag
+from helpers import gzip_stream, parse_time
+from report_snapshots import company_version, latest_snapshot, refresh_company, refresh_project, snapshot_history
+from views import BURNDOWN_INTERVALS, DEFAULT_TIMEZONE, generate_burndown, generate_workload
 
 reports_bp = Blueprint('reports', __name__, url_prefix='/reports')
 
@@ -16,70 +23,29 @@ def _get_company() -> str:
     return get_jwt().get("company_name", "")
 
 
+def _fresh() -> bool:
+    """?fresh=1 bypasses the materialized report snapshots."""
+    return request.args.get("fresh") in ("1", "true")
+
+
 # ---------------------------------------------------------------------------
 # Summary endpoint
 # ---------------------------------------------------------------------------
 @reports_bp.route('/summary', methods=['GET'])
 @jwt_required()
 def summary():
-    """Return company-wide aggregated stats."""
+    """Return company-wide aggregated stats (from the report snapshot unless ?fresh=1)."""
     company = _get_company()
     if not company:
         return jsonify({"error": "company_name missing from token"}), 400
 
-    projects = list(projects_col.find({"company_name": company}))
-    total_projects = len(projects)
-
-    total_tasks = 0
-    completed_tasks = 0
-    overdue_tasks = 0
-    in_progress_tasks = 0
-    member_set = set()
-
-    for proj in projects:
-        proj_id = proj.get("id") or str(proj.get("_id"))
-        tasks = get_project_tasks(proj_id) or []
-        total_tasks += len(tasks)
-
-        for t in tasks:
-            if not t:
-                continue
-            state = get_task_state(t.get("id") or "")
-            if state == "complete":
-                completed_tasks += 1
-            elif state == "overdue":
-                overdue_tasks += 1
-            elif state in ("in progress", "incipient"):
-                in_progress_tasks += 1
-
-        for email in proj.get("team", []):
-            member_set.add(email)
-
-    active_projects = sum(
-        1 for p in projects
-        if any(get_task_state(t.get("id", "")) in ("in progress", "incipient")
-               for t in (get_project_tasks(p.get("id") or str(p.get("_id"))) or []) if t)
-    )
-    completed_projects = sum(
-        1 for p in projects
-        if all(get_task_state(t.get("id", "")) == "complete"
-               for t in (get_project_tasks(p.get("id") or str(p.get("_id"))) or []) if t)
-        and (get_project_tasks(p.get("id") or str(p.get("_id"))) or [])
-    )
-
-    completion_rate = round((completed_tasks / total_tasks * 100) if total_tasks else 0, 1)
-
-    return jsonify({
-        "total_projects": total_projects,
-        "active_projects": active_projects,
-        "completed_projects": completed_projects,
-        "total_tasks": total_tasks,
-        "completed_tasks": completed_tasks,
-        "overdue_tasks": overdue_tasks,
-        "in_progress_tasks": in_progress_tasks,
-        "completion_rate": completion_rate,
-        "team_members": len(member_set),
-    }), 200
+    # The snapshot is served only while it matches the company's current project versions
+    version = company_version(company)
+    snapshot = None if _fresh() else latest_snapshot("company", lookup_key(company), version)
+    if snapshot:
+        return jsonify(snapshot["report"]), 200
+    report, _ = refresh_company(company, version)
+    return jsonify(report), 200
 
 
 # ---------------------------------------------------------------------------
@@ -88,61 +54,139 @@ def summary():
 @reports_bp.route('/project/<project_name>', methods=['GET'])
 @jwt_required()
 def project_report(project_name):
-    """Return detailed stats for a single project."""
+    """Return detailed stats for a single project (from the report snapshot unless ?fresh=1)."""
+    company = _get_company()
+    proj = projects_col.find_one({
+        "company_key": lookup_key(company),
+        "name_key": lookup_key(project_name),
+    })
+    if not proj:
+        return jsonify({"error": "Project not found"}), 404
+
+    digest = etag_digest("reports/project", [proj], project_name)
+    cached = not_modified(digest)
+    if cached:
+        return cached
+
+    # The snapshot is served only while it matches the project's current version
+    snapshot = None if _fresh() else latest_snapshot("project", proj["id"], proj.get("version", 0))
+    if snapshot:
+        report, valid_until = snapshot["report"], snapshot.get("valid_until")
+    else:
+        report, valid_until = refresh_project(proj)
+
+    return with_etag((jsonify({**report, "project": project_name}), 200), digest, valid_until)
+
+
+# ---------------------------------------------------------------------------
+# Burndown
+# ---------------------------------------------------------------------------
+@reports_bp.route('/burndown/<project_name>', methods=['GET'])
+@jwt_required()
+def burndown(project_name):
+    """Planned vs actual progress per ?interval=day|week, from the task update history."""
     company = _get_company()
-    import re
+    interval = request.args.get("interval", "day")
+    if interval not in BURNDOWN_INTERVALS:
+        return jsonify({"error": "interval must be day or week"}), 400
+
     proj = projects_col.find_one({
-        "company_name": {"$regex": f"^{re.escape(company)}$", "$options": "i"},
-        "name": {"$regex": f"^{re.escape(project_name)}$", "$options": "i"},
+        "company_key": lookup_key(company),
+        "name_key": lookup_key(project_name),
     })
     if not proj:
         return jsonify({"error": "Project not found"}), 404
 
+    digest = etag_digest("reports/burndown", [proj], interval)
+    cached = not_modified(digest)
+    if cached:
+        return cached
+
     proj_id = proj.get("id") or str(proj.get("_id"))
-    tasks = get_project_tasks(proj_id) or []
-
-    task_breakdown = {"complete": 0, "in_progress": 0, "overdue": 0, "tentative": 0, "other": 0}
-    total_estimated = 0
-    total_actual = 0
-    member_contribution = {}
-
-    for t in tasks:
-        if not t:
-            continue
-        state = get_task_state(t.get("id", ""))
-        if state == "complete":
-            task_breakdown["complete"] += 1
-        elif state in ("in progress", "incipient"):
-            task_breakdown["in_progress"] += 1
-        elif state == "overdue":
-            task_breakdown["overdue"] += 1
-        elif state == "tentative":
-            task_breakdown["tentative"] += 1
-        else:
-            task_breakdown["other"] += 1
-
-        total_estimated += t.get("estimated_cost", 0) or 0
-        total_actual += t.get("duration", 0) or 0
-
-        for m in t.get("members", []):
-            if m not in member_contribution:
-                member_contribution[m] = {"assigned": 0, "completed": 0}
-            member_contribution[m]["assigned"] += 1
-            if state == "complete":
-                member_contribution[m]["completed"] += 1
-
-    total_tasks = len(tasks)
-    completed_tasks = task_breakdown["complete"]
-    completion_rate = round((completed_tasks / total_tasks * 100) if total_tasks else 0, 1)
-
-    return jsonify({
-        "project": project_name,
-        "total_tasks": total_tasks,
-        "task_breakdown": task_breakdown,
-        "completion_rate": completion_rate,
-        "total_estimated_cost": total_estimated,
-        "member_contribution": member_contribution,
-    }), 200
+    tasks = get_progress_history(proj_id, interval, proj.get("timezone", DEFAULT_TIMEZONE))
+    try:
+        data, valid_until = generate_burndown(proj, tasks, interval)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return with_etag((jsonify(data), 200), digest, valid_until)
+
+
+# ---------------------------------------------------------------------------
+# Member workload
+# ---------------------------------------------------------------------------
+WORKLOAD_DEFAULT_BUCKETS = {"day": 28, "week": 12}
+
+
+@reports_bp.route('/workload', methods=['GET'])
+@jwt_required()
+def workload():
+    """
+    Scheduled minutes per member per ?interval=day|week across all company projects,
+    with overlapping assignments and completion rates. ?from/?to (ISO8601) bound the
+    window (default: the next 28 days / 12 weeks); ?member=<email> (repeatable) filters.
+    """
+    company = _get_company()
+    interval = request.args.get("interval", "day")
+    if interval not in BURNDOWN_INTERVALS:
+        return jsonify({"error": "interval must be day or week"}), 400
+    try:
+        window_start = parse_time(request.args.get("from"))
+        window_end = parse_time(request.args.get("to"))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    if not window_start:
+        timezone = pytz.timezone(DEFAULT_TIMEZONE)
+        today = datetime.now(pytz.UTC).astimezone(timezone)
+        window_start = timezone.localize(datetime(today.year, today.month, today.day))
+        if interval == "week":
+            window_start -= timedelta(days=window_start.weekday())
+    if not window_end:
+        window_end = window_start + BURNDOWN_INTERVALS[interval] * WORKLOAD_DEFAULT_BUCKETS[interval]
+    if window_end <= window_start:
+        return jsonify({"error": "to must be after from"}), 400
+    members = request.args.getlist("member")
+
+    projects = list(projects_col.find({"company_key": lookup_key(company)}, {"_id": 0, "id": 1, "name": 1, "version": 1}))
+    digest = etag_digest("reports/workload", projects,
+                         [interval, window_start.isoformat(), window_end.isoformat(), sorted(members)])
+    cached = not_modified(digest)
+    if cached:
+        return cached
+
+    rows = get_member_assignments([p["id"] for p in projects], window_start, window_end, members)
+    try:
+        data = generate_workload(projects, rows, window_start, window_end, interval)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return with_etag((jsonify(data), 200), digest)
+
+
+# ---------------------------------------------------------------------------
+# Trends
+# ---------------------------------------------------------------------------
+@reports_bp.route('/history', methods=['GET'])
+@jwt_required()
+def history():
+    """Daily report snapshots for trend charts: ?project=<name> (else the company summary), ?days=30."""
+    company = _get_company()
+    try:
+        days = max(1, min(int(request.args.get("days", 30)), 366))
+    except ValueError:
+        return jsonify({"error": "days must be a number"}), 400
+
+    project_name = request.args.get("project")
+    if project_name:
+        proj = projects_col.find_one(
+            {"company_key": lookup_key(company), "name_key": lookup_key(project_name)}, {"_id": 0, "id": 1}
+        )
+        if not proj:
+            return jsonify({"error": "Project not found"}), 404
+        kind, key = "project", proj["id"]
+    else:
+        kind, key = "company", lookup_key(company)
+
+    return jsonify({"days": snapshot_history(kind, key, days)}), 200
 
 
 # ---------------------------------------------------------------------------
@@ -151,49 +195,79 @@ def project_report(project_name):
 @reports_bp.route('/export', methods=['GET'])
 @jwt_required()
 def export_csv():
-    """Stream a CSV of all tasks (optionally filtered by project)."""
-    company = _get_company()
-    project_filter = request.args.get("project", "")
-
-    import re
-    query = {"company_name": {"$regex": f"^{re.escape(company)}$", "$options": "i"}}
-    if project_filter:
-        query["name"] = {"$regex": f"^{re.escape(project_filter)}$", "$options": "i"}
-
-    projects = list(projects_col.find(query))
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow([
-        "Project", "Task", "Status", "Priority",
-        "Progress %", "Assigned Members", "Estimated Cost",
-        "Expected Duration (min)", "Actual Duration (min)"
-    ])
-
-    for proj in projects:
-        proj_id = proj.get("id") or str(proj.get("_id"))
-        tasks = get_project_tasks(proj_id) or []
-        for t in tasks:
-            if not t:
-                continue
-            state = get_task_state(t.get("id", ""))
-            writer.writerow([
-                proj.get("name", ""),
-                t.get("name", ""),
-                state,
-                t.get("priority", ""),
-                t.get("latest_status", 0),
-                ", ".join(t.get("members", [])),
-                t.get("estimated_cost", 0),
-                t.get("expected_duration", 0),
-                t.get("duration", 0),
-            ])
-
-    csv_data = output.getvalue()
-    output.close()
-
-    return Response(
-        csv_data,
-        mimetype="text/csv",
-        headers={"Content-Disposition": f"attachment; filename=zainpm_report.csv"}
-    )
+    """
+    Stream a CSV of all tasks (optionally filtered by project), gzipped on the fly when
+    the client accepts it. Tasks of every selected project come from one cursor.
+    ?format=parquet|arrow exports a typed table instead (?table=tasks|updates|projects).
+    Large exports should go through /reports/exports (background jobs) instead.
+    """
+    params, error = _export_params(request.args)
+    if error:
+        return jsonify({"error": error}), 400
+
+    projects = load_export_projects(_get_company(), params["project"])
+    try:
+        chunks = stream_export(projects, params["format"], params["table"])
+    except ExportUnavailable as e:
+        return jsonify({"error": str(e)}), 501
+
+    headers = {"Content-Disposition": f"attachment; filename={export_filename(params)}"}
+    if params["format"] == "csv":
+        headers["Vary"] = "Accept-Encoding"
+        if request.accept_encodings.quality("gzip") > 0:
+            headers["Content-Encoding"] = "gzip"
+            chunks = gzip_stream(chunks)
+
+    return Response(stream_with_context(chunks), mimetype=FORMATS[params["format"]], headers=headers)
+
+
+def _export_params(args):
+    """(params, error) for an export request: format, table and project."""
+    fmt = args.get("format", "csv")
+    if fmt not in FORMATS:
+        return None, "format must be csv, parquet or arrow"
+    table = args.get("table", "tasks")
+    if table not in TABLES or (fmt == "csv" and table != "tasks"):
+        return None, f"table must be one of {', '.join(TABLES)} (csv exports tasks only)"
+    return {"format": fmt, "table": table, "project": args.get("project") or None}, None
+
+
+# ---------------------------------------------------------------------------
+# Export jobs
+# ---------------------------------------------------------------------------
+@reports_bp.route('/exports', methods=['POST'])
+@jwt_required()
+def create_export_job():
+    """Queue an export for the export worker; an identical in-flight job is reused."""
+    params, error = _export_params(request.get_json(silent=True) or {})
+    if error:
+        return jsonify({"error": error}), 400
+
+    job, created = submit_job(_get_company(), params)
+    return jsonify(job_view(job)), 202 if created else 200
+
+
+@reports_bp.route('/exports/<job_id>', methods=['GET'])
+@jwt_required()
+def export_job_status(job_id):
+    """Status and progress (rows written) of an export job."""
+    job = get_job(_get_company(), job_id)
+    if not job:
+        return jsonify({"error": "Export job not found"}), 404
+    return jsonify(job_view(job)), 200
+
+
+@reports_bp.route('/exports/<job_id>/download', methods=['GET'])
+@jwt_required()
+def download_export(job_id):
+    job = get_job(_get_company(), job_id)
+    if not job:
+        return jsonify({"error": "Export job not found"}), 404
+    if job["status"] != "done":
+        return jsonify({"error": f"Export is {job['status']}"}), 409
+
+    path = artifact_path(job)
+    if not os.path.exists(path):
+        return jsonify({"error": "Export file has expired"}), 410
+    return send_file(path, mimetype=FORMATS[job["params"]["format"]], as_attachment=True,
+                     download_name=export_filename(job["params"]))
@@ -3,19 +3,28 @@ from datetime import datetime, timedelta
 from bson import ObjectId
 import pytz
 import os
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
+from werkzeug.utils import secure_filename
 from db import users_col, projects_col, tasks_col, updates_col, project_updates_col
 from auth_helpers import is_valid_email, normalize_email, create_user, check_password
 from validators import ProjectCreate, TaskCreate, BatchTaskCreate
-from createandget import create_project, create_project_update, create_task, create_task_update, fetch_priority, get_latest_progress, get_member_tasks, get_project_by_company_and_name, get_project_tasks, create_tasks_batch, get_task_by_name, get_project_by_name, get_task_state
-from helpers import format_duration, parse_duration, save_uploaded_file
-from views import generate_timetable, generate_gantt_chart
+from createandget import create_project, create_task, create_task_update, fetch_priority, get_latest_progress, get_member_tasks, get_project_by_company_and_name, get_project_tasks, create_tasks_batch, postpone_projects, reschedule_task, get_task_by_name, get_project_by_name, get_task_state, get_project_task_states, iter_project_tasks, load_project_task_windows, get_portfolio_tasks, lookup_key
+from helpers import format_duration, parse_duration, parse_time, save_uploaded_file
+from views import generate_timetable, generate_gantt_chart, generate_portfolio_gantt, stream_gantt_chart, stream_timetable
 from Projects.views import projects_bp
 from Stripe.views import stripe_bp
 from Reports.views import reports_bp
 from Mpesa.views import mpesa_bp
 from subscription_helpers import get_subscription, create_free_subscription
+from migrations import run_migrations
+from snapshots import project_tasks_at
+from report_snapshots import start_worker as start_report_worker
+from rollups import apply_rollup_delta, rollup_delta
+from task_states import _as_utc, get_project_task_windows, project_versions, state_cache, states_valid_until
+from scheduler import CRITICAL_PATH_FIELDS, CycleError, critical_path
+from etags import etag_digest, not_modified, with_etag
+from gantt_render import MIMETYPES, RenderUnavailable, render_cache, render_gantt
 from flask_jwt_extended import (
     JWTManager, create_access_token, get_jwt, jwt_required, get_jwt_identity, set_access_cookies, unset_jwt_cookies, verify_jwt_in_request
 )
@@ -40,6 +49,12 @@ app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Apply pending schema migrations (indexes, backfills); the first worker to start runs them
+run_migrations()
+
+# Keep the materialized report snapshots fresh (one process at a time holds the worker lease)
+start_report_worker()
+
 jwt_secret = os.getenv("JWT_SECRET_KEY")
 if not jwt_secret:
     raise RuntimeError("JWT_SECRET_KEY environment variable is required. Set a strong secret in your environment.")
@@ -338,6 +353,8 @@ def delete_user(username):
                 {"$set": {"members.$[elem]": admin_email}},
                 array_filters=[{"elem": target_username}]
             )
+            # Task members changed; invalidate cached renders of the company's projects
+            projects_col.update_many({"company_name": company_name}, {"$inc": {"version": 1}})
             
             # Delete the user
             users_col.delete_one({"username": target_username})
@@ -527,8 +544,9 @@ def delete_project(project_name):
         # Delete project updates
         project_updates_col.delete_many({"project_id": project_id})
         
-        # Delete the project
+        # Delete the project and its cached renders
         projects_col.delete_one({"id": project_id})
+        render_cache.discard(project_id)
         
         return jsonify({"message": f"Project '{project_name}' deleted successfully"}), 200
         
@@ -545,12 +563,17 @@ def tasks_endpoint():
         try:
             batch_data = BatchTaskCreate(tasks=data)
             task_dicts = []
+            projects_by_name = {}
+            team_additions = {}
             
             for task in batch_data.tasks:
-                # Get project by name
-                project = get_project_by_name(task.project_name)
-                if not project:
-                    return jsonify({"error": f"Project '{task.project_name}' not found"}), 400
+                # Get project by name (once per distinct project)
+                project = projects_by_name.get(task.project_name)
+                if project is None:
+                    project = get_project_by_name(task.project_name)
+                    if not project:
+                        return jsonify({"error": f"Project '{task.project_name}' not found"}), 400
+                    projects_by_name[task.project_name] = project
                 
                 # FIXED: Parse duration with better error handling
                 try:
@@ -562,37 +585,29 @@ def tasks_endpoint():
                 except Exception as e:
                     return jsonify({"error": f"Invalid duration '{task.expected_duration}': {str(e)}"}), 400
                 
-                # Resolve dependencies
-                dependency_ids = []
-                for dep_name in task.dependencies:
-                    dep_task = get_task_by_name(project['id'], dep_name)
-                    if not dep_task:
-                        return jsonify({"error": f"Dependency task '{dep_name}' not found"}), 400
-                    dependency_ids.append(dep_task['id'])
-                
                 members_list = []
                 for m in (task.members or []):
                     m_norm = normalize_email(m)
                     if not is_valid_email(m_norm):
                         return jsonify({"error": f"Invalid member email in batch: {m}"}), 422
                     members_list.append(m_norm)
+                team_additions.setdefault(project['id'], set()).update(members_list)
 
                 task_dict = task.dict()
                 task_dict['members'] = members_list
                 task_dict['project_id'] = project['id']
+                task_dict['name'] = task.task_name
                 task_dict['expected_duration'] = duration_min
-                task_dict['dependencies'] = dependency_ids
+                # Dependency names are resolved by create_tasks_batch, including tasks in this batch
+                task_dict['dependencies'] = task.dependencies or []
                 task_dict['estimated_cost'] = task.estimated_cost
                 task_dicts.append(task_dict)
             
             tasks = create_tasks_batch(task_dicts)
-            # Auto-add all members from batch tasks to project team
-            proj_record = projects_col.find_one({"id": project['id']})
-            if proj_record:
-                team = set(proj_record.get('team', []))
-                for t in batch_data.tasks:
-                    team.update(t.members or [])
-                projects_col.update_one({"id": project['id']}, {"$set": {"team": list(team)}})
+            # Auto-add all members from batch tasks to their project teams
+            for project_id, members in team_additions.items():
+                if members:
+                    projects_col.update_one({"id": project_id}, {"$addToSet": {"team": {"$each": list(members)}}, "$inc": {"version": 1}})
             return jsonify({
              "message": f"{len(tasks)} tasks created successfully",
              "tasks": tasks
@@ -700,7 +715,7 @@ def tasks_endpoint():
         proj_rec = projects_col.find_one({"id": project['id']})
         team = set(proj_rec.get('team', []))
         team.update(members_clean or [])
-        projects_col.update_one({"id": project['id']}, {"$set": {"team": list(team)}})
+        projects_col.update_one({"id": project['id']}, {"$set": {"team": list(team)}, "$inc": {"version": 1}})
 
         # 8) Return
         return jsonify({
@@ -744,14 +759,12 @@ def delete_task(project_name, task_name):
         # Delete task updates
         updates_col.delete_many({"task_id": task_id})
         
-        # Remove task from project's task list
-        projects_col.update_one(
-            {"id": project['id']},
-            {"$pull": {"tasks": task_id}}
-        )
+        # Remove task from project's task list and its counters
+        apply_rollup_delta(project['id'], rollup_delta(before=task), **{"$pull": {"tasks": task_id}})
         
         # Delete the task
         tasks_col.delete_one({"id": task_id})
+        state_cache.invalidate(task_id)
         
         return jsonify({"message": f"Task '{task_name}' deleted successfully"}), 200
         
@@ -802,22 +815,21 @@ def create_task_update_endpoint():
         except ValueError:
             return jsonify({"error": "Invalid expenditure value"}), 400
 
-        if get_task_state(task['id']) == 'complete':
-            return jsonify({"error": "Task is complete. Restore the task before creating updates."}), 400
-
-        # Create update, storing expenditure
-        update_id = create_task_update(
-            task_id=task['id'],
-            status_percentage=status_perc,
-            description=description,
-            image_filenames=image_filenames
-        )
+        # Create update, storing expenditure; completed tasks are rejected in the same write
+        try:
+            update_id = create_task_update(
+                task_id=task['id'],
+                status_percentage=status_perc,
+                description=description,
+                image_filenames=image_filenames,
+                expenditure=expenditure,
+                allow_complete=False
+            )
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
         if not update_id:
             # Defensive: should not happen if task exists, but return a clear error
             return jsonify({"error": "Failed to create update (internal)"}), 500
-        # Persist expenditure in updates_db
-        if expenditure is not None:
-            updates_col.update_one({"id": update_id}, {"$set": {"expenditure": expenditure}})
 
         return jsonify ({
             "update_id": update_id,
@@ -872,6 +884,8 @@ def delete_task_update(update_id):
             {"id": task['id']},
             {"$set": {"latest_status": latest_status}}
         )
+        apply_rollup_delta(task['project_id'], rollup_delta(task, {**task, "latest_status": latest_status}))
+        state_cache.invalidate(task['id'])
         
         # Delete the update
         updates_col.delete_one({"id": update_id})
@@ -892,10 +906,36 @@ def timetable_view():
     project = get_project_by_name(project_name)
     if not project:
         return jsonify({"error": "Project not found"}), 404
+
+    try:
+        at_time = parse_time(data.get('time'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Unchanged since the client's copy: answer before loading any task
+    digest = etag_digest('views/timetable', [project], data.get('time'))
+    cached = not_modified(digest)
+    if cached:
+        return cached
     
-    tasks = get_project_tasks(project['id'])
-    timetable = generate_timetable(project, tasks)
-    return jsonify(timetable)
+    if data.get('stream') and not at_time:
+        # Large projects: states from a light pre-pass, rows streamed straight off the cursor
+        windows = load_project_task_windows(project['id'], version=project.get('version', 0))
+        states = {tid: window[0] for tid, window in windows.items()}
+        rows = stream_timetable(project, iter_project_tasks(project['id']), states)
+        response = Response(stream_with_context(rows), mimetype='application/json')
+        return with_etag(response, digest, states_valid_until(windows))
+
+    if at_time:
+        # Point in time: progress rebuilt from snapshots and the update history
+        tasks = project_tasks_at(project['id'], at_time)
+    else:
+        tasks = get_project_tasks(project['id'])
+    windows = get_project_task_windows(tasks, at_time, project_versions([project]))
+    states = {tid: window[0] for tid, window in windows.items()}
+    timetable = generate_timetable(project, tasks, at_time, states)
+    # States at a fixed time never expire
+    return with_etag(jsonify(timetable), digest, None if at_time else states_valid_until(windows))
 
 @app.route('/views/gantt', methods=['POST'])
 @jwt_required()  # FIXED: Add JWT protection  
@@ -908,10 +948,157 @@ def gantt_view():
     project = get_project_by_name(project_name)
     if not project:
         return jsonify({"error": "Project not found"}), 404
+
+    try:
+        at_time = parse_time(data.get('time'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Unchanged since the client's copy: answer before loading any task
+    digest = etag_digest('views/gantt', [project], data.get('time'))
+    cached = not_modified(digest)
+    if cached:
+        return cached
     
-    tasks = get_project_tasks(project['id'])
-    gantt = generate_gantt_chart(tasks)
-    return jsonify(gantt)
+    if data.get('stream') and not at_time:
+        # Large projects: states from a light pre-pass, rows streamed straight off the cursor
+        windows = load_project_task_windows(project['id'], version=project.get('version', 0))
+        states = {tid: window[0] for tid, window in windows.items()}
+        rows = stream_gantt_chart(iter_project_tasks(project['id']), states)
+        response = Response(stream_with_context(rows), mimetype='application/json')
+        return with_etag(response, digest, states_valid_until(windows))
+
+    if at_time:
+        # Point in time: progress rebuilt from snapshots and the update history
+        tasks = project_tasks_at(project['id'], at_time)
+    else:
+        tasks = get_project_tasks(project['id'])
+    windows = get_project_task_windows(tasks, at_time, project_versions([project]))
+    states = {tid: window[0] for tid, window in windows.items()}
+    gantt = generate_gantt_chart(tasks, at_time, states)
+    # States at a fixed time never expire
+    return with_etag(jsonify(gantt), digest, None if at_time else states_valid_until(windows))
+
+@app.route('/views/portfolio-gantt', methods=['POST'])
+@jwt_required()
+def portfolio_gantt_view():
+    """
+    Gantt timeline across all of the company's projects, in two queries (projects, then tasks).
+    Optional body fields from/to (ISO datetimes; naive ones are UTC) keep tasks starting in [from, to).
+    """
+    data = request.json or {}
+    company = get_jwt().get('company_name')
+    if not company:
+        return jsonify({"error": "company_name is required"}), 400
+    try:
+        start = _as_utc(datetime.fromisoformat(data['from'])) if data.get('from') else None
+        end = _as_utc(datetime.fromisoformat(data['to'])) if data.get('to') else None
+    except (TypeError, ValueError):
+        return jsonify({"error": "from and to must be ISO datetimes"}), 400
+    if start and end and end <= start:
+        return jsonify({"error": "to must be after from"}), 400
+
+    projects = list(projects_col.find(
+        {"company_key": lookup_key(company)}, {"_id": 0, "id": 1, "name": 1, "version": 1}
+    ).sort([("start_date", 1), ("id", 1)]))
+    digest = etag_digest('views/portfolio-gantt', projects, [data.get('from'), data.get('to')])
+    cached = not_modified(digest)
+    if cached:
+        return cached
+
+    tasks, upstream = get_portfolio_tasks([p['id'] for p in projects], start, end)
+    # One evaluator pass over every project's tasks
+    windows = get_project_task_windows(tasks + upstream, versions=project_versions(projects))
+    states = {tid: window[0] for tid, window in windows.items()}
+    portfolio = generate_portfolio_gantt(projects, tasks, states)
+    portfolio.update({
+        "from": start.isoformat() if start else None,
+        "to": end.isoformat() if end else None,
+    })
+    return with_etag((jsonify(portfolio), 200), digest, states_valid_until(windows))
+
+@app.route('/views/gantt.svg', methods=['POST'])
+@jwt_required()
+def gantt_svg_view():
+    return _gantt_export('svg')
+
+@app.route('/views/gantt.png', methods=['POST'])
+@jwt_required()
+def gantt_png_view():
+    return _gantt_export('png')
+
+def _gantt_export(fmt):
+    """Rendered Gantt chart, served from the render cache while the project is unchanged."""
+    data = request.json
+    if not data or 'project_name' not in data:
+        return jsonify({"error": "project_name is required"}), 400
+
+    company = get_jwt().get('company_name') or data.get('company_name')
+    project = get_project_by_company_and_name(company, data['project_name'])
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+
+    version = project.get('version', 0)
+    body = render_cache.get(project['id'], version, fmt)
+    cache_status = "hit"
+    if body is None:
+        cache_status = "miss"
+        tasks = get_project_tasks(project['id'])
+        windows = get_project_task_windows(tasks, versions=project_versions([project]))
+        states = {tid: window[0] for tid, window in windows.items()}
+        try:
+            body = render_gantt(project['name'], generate_gantt_chart(tasks, None, states), fmt)
+        except RenderUnavailable as e:
+            return jsonify({"error": str(e)}), 501
+        render_cache.put(project['id'], version, fmt, body, states_valid_until(windows))
+
+    filename = secure_filename(f"{project['name']}-gantt.{fmt}") or f"gantt.{fmt}"
+    return Response(body, mimetype=MIMETYPES[fmt], headers={
+        "Content-Disposition": f'attachment; filename="{filename}"',
+        "X-Render-Cache": cache_status
+    })
+
+@app.route('/views/critical-path', methods=['POST'])
+@jwt_required()
+def critical_path_view():
+    """Earliest/latest start, slack and the critical chain of a project's tasks."""
+    data = request.json
+    if not data or 'project_name' not in data:
+        return jsonify({"error": "project_name is required"}), 400
+
+    company = get_jwt().get('company_name') or data.get('company_name')
+    project = get_project_by_company_and_name(company, data['project_name'])
+    if not project:
+        return jsonify({"error": "Project not found"}), 404
+
+    tasks = get_project_tasks(project['id'], CRITICAL_PATH_FIELDS)
+    try:
+        cpm = critical_path(tasks, project.get('start_date'))
+    except CycleError as e:
+        return jsonify({"error": str(e), "cycle": e.task_ids}), 409
+
+    iso = lambda dt: _as_utc(dt).isoformat() if dt else None
+    names = {t['id']: t['name'] for t in tasks}
+    return jsonify({
+        "project_name": project['name'],
+        "start": iso(cpm['start']),
+        "finish": iso(cpm['finish']),
+        "duration": format_duration(cpm['duration_minutes']),
+        "duration_minutes": cpm['duration_minutes'],
+        "critical_path": [names[tid] for tid in cpm['critical_path']],
+        "tasks": [{
+            "id": tid,
+            "task": names[tid],
+            "earliest_start": iso(entry['earliest_start']),
+            "earliest_finish": iso(entry['earliest_finish']),
+            "latest_start": iso(entry['latest_start']),
+            "latest_finish": iso(entry['latest_finish']),
+            "slack": format_duration(entry['slack_minutes']),
+            "slack_minutes": entry['slack_minutes'],
+            "critical": entry['critical'],
+            "dependencies": [names[d] for d in entry['dependencies']]
+        } for tid, entry in cpm['tasks'].items()]
+    }), 200
 
 # Update image endpoint to use names
 # New endpoint to get all images for a task
@@ -959,16 +1146,22 @@ def get_task_images():
 @jwt_required()  # FIXED: Add JWT protection
 def states_endpoint(): 
     data = request.json or {}
-    now = datetime.now(pytz.UTC)
-    if 'time' in data:
-        t = datetime.fromisoformat(data['time'])
-        now = pytz.UTC.localize(t) if t.tzinfo is None else t
+    try:
+        at_time = parse_time(data.get('time'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    now = at_time or datetime.now(pytz.UTC)
 
     if data.get('type') == 'task':
         # require project_name + task_name
         proj = get_project_by_name(data.get('project_name'))
         task = get_task_by_name(proj['id'], data.get('task_name'))
-        state = get_task_state(task['id'], now)
+        if at_time:
+            # Progress as of that time, not the current latest_status
+            states = get_project_task_states(project_tasks_at(proj['id'], at_time), at_time)
+            state = states.get(task['id'])
+        else:
+            state = get_task_state(task['id'])
         return jsonify({"task": task['name'], "state": state}), 200
 
     elif data.get('type') == 'project':
@@ -979,18 +1172,20 @@ def states_endpoint():
             dep_proj = projects_col.find_one({"id": dep})
             if dep_proj and dep_proj.get('state') != 'complete':
                 return jsonify({"project": proj['name'], "state": "delayed"}), 200
-        # Evaluate task states
-        tasks = get_project_tasks(proj['id'])
-        states = [get_task_state(t['id'], now) for t in tasks]
+        # Evaluate task states (with the progress of that time when one is given)
+        tasks = project_tasks_at(proj['id'], at_time) if at_time else get_project_tasks(proj['id'])
+        states = list(get_project_task_states(tasks, at_time, project_versions([proj])).values())
         if not states or all(s == 'tentative' for s in states):
             st = 'tentative'
         elif all(s == 'complete' for s in states):
             st = 'complete'
-        elif now > max(t['start_time'] + timedelta(minutes=t.get('expected_duration', 0)) for t in tasks):
+        elif now > max(_as_utc(t['start_time']) + timedelta(minutes=t.get('expected_duration', 0)) for t in tasks):
             st = 'overdue'
         else:
             st = 'active'
-        projects_col.update_one({"id": proj['id']}, {"$set": {"state": st}})
+        if not at_time:
+            # Only the current state is stored
+            projects_col.update_one({"id": proj['id'], "state": {"$ne": st}}, {"$set": {"state": st}, "$inc": {"version": 1}})
         return jsonify({"project": proj['name'], "state": st}), 200
 
     else:
@@ -1092,28 +1287,13 @@ def postpone_to_endpoint():
         
         # Postpone entire project
         if not project_name:
-            projects = list(projects_col.find({"company_name": {"$regex": f"^{company_name}$", "$options": "i"}}))
+            projects = list(projects_col.find({"company_key": lookup_key(company_name)}, {"_id": 0, "id": 1, "start_date": 1}))
             
             if not projects:
                 return jsonify({"error": "No projects found for company"}), 404
             
-            for project in projects:
-                # Calculate time delta
-                delta = new_start - project['start_date']
-                projects_col.update_one({"id": project['id']}, {"$set": {"start_date": new_start}})
-                
-                # Update all tasks in project
-                tasks_col.update_many(
-                    {"project_id": project['id']},
-                    {"$inc": {"start_time": delta.total_seconds() * 1000}}  # MongoDB date math
-                )
-            
-            # Log each project's postponement
-            for project in projects:
-                create_project_update(
-                    project_id=project['id'],
-                    description=f"Project postponed to {new_start.isoformat()}"
-                )
+            # Shift every project and its tasks server-side; logs one update per project
+            postpone_projects(projects, new_start)
             return jsonify({
                 "message": "All projects postponed",
                 "new_start_time": new_start.isoformat(),
@@ -1124,23 +1304,11 @@ def postpone_to_endpoint():
         project = get_project_by_company_and_name(company_name, project_name)
         if not project:
             return jsonify({"error": "Project not found"}), 404
+        project.pop('_id', None)  # returned in the response; ObjectId is not JSON serializable
             
         # Postpone entire project
         if not task_name:
-            delta = new_start - project['start_date']
-            projects_col.update_one({"id": project['id']}, {"$set": {"start_date": new_start}})
-            
-            # Update all tasks in project
-            for task_id in project['tasks']:
-                task = tasks_col.find_one({"id": task_id})
-                if task:
-                    new_task_start = task['start_time'] + delta
-                    tasks_col.update_one({"id": task_id}, {"$set": {"start_time": new_task_start}})
-            
-            create_project_update(
-                project_id=project['id'],
-                description=f"Project postponed to {new_start.isoformat()}"
-            )
+            postpone_projects([project], new_start)
             return jsonify({
                 "message": "Project postponed",
                 "project": project,
@@ -1152,6 +1320,7 @@ def postpone_to_endpoint():
         task = get_task_by_name(project['id'], task_name)
         if not task:
             return jsonify({"error": "Task not found"}), 404
+        task.pop('_id', None)  # returned in the response; ObjectId is not JSON serializable
         
         new_duration = data.get('new_duration')
         if new_duration:
@@ -1160,17 +1329,27 @@ def postpone_to_endpoint():
             except Exception as e:
                 return jsonify({"error": f"Invalid duration: {str(e)}"}), 400
         else:
-            new_duration_min = task['duration']
-        
-        tasks_col.update_one(
-            {"id": task['id']},
-            {"$set": {
-                "start_time": new_start,
-                "duration": new_duration_min,
-                "postponed": False
-            }}
-        )
-        
+            new_duration_min = None
+
+        # Move the task and cascade to the dependents it now overlaps
+        try:
+            changes = reschedule_task(task['id'], new_start, new_duration_min, dry_run=bool(data.get('dry_run')))
+        except CycleError as e:
+            return jsonify({"error": str(e), "cycle": e.task_ids}), 409
+        rescheduled = [{
+            "task": c['name'],
+            "old_start_time": c['old_start'].isoformat() if c['old_start'] else None,
+            "new_start_time": c['new_start'].isoformat()
+        } for c in changes]
+
+        if data.get('dry_run'):
+            return jsonify({
+                "message": "Dry run: nothing was changed",
+                "task": task,
+                "new_start_time": new_start.isoformat(),
+                "rescheduled": rescheduled
+            }), 200
+
         # Log as a task update
         update_id = create_task_update(
             task_id=task['id'],
@@ -1183,6 +1362,7 @@ def postpone_to_endpoint():
             "message": "Task postponed",
             "task": task,
             "new_start_time": new_start.isoformat(),
+            "rescheduled": rescheduled,
             "timestamp": ts
         }), 200
         
@@ -0,0 +1,59 @@
+# scheduling-api/bench_views.py
+"""
+Benchmark for the timetable and Gantt generators on synthetic projects.
+Needs no database; run from the scheduling-api directory:
+
+    python bench_views.py            # 10,000 tasks
+    python bench_views.py 50000      # custom task count
+"""
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+import pytz
+from views import generate_gantt_chart, generate_timetable
+
+
+def synthetic_project(task_count: int, seed: int = 42):
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 5, 8, 0)  # naive UTC, as Mongo returns it
+    project = {"id": "bench", "name": "Benchmark", "start_date": start, "timezone": "Africa/Nairobi"}
+    tasks = []
+    for i in range(task_count):
+        # Chains of dependencies on recent tasks, like real schedules
+        deps = [f"t{j}" for j in rng.sample(range(max(0, i - 20), i), min(i, rng.randint(0, 2)))]
+        progress = rng.choice([0, 0, 25, 50, 100])
+        expected = rng.randint(30, 8 * 60)
+        tasks.append({
+            "id": f"t{i}",
+            "name": f"Task {i}",
+            "project_id": "bench",
+            "start_time": start + timedelta(minutes=15 * rng.randint(0, 4 * 24 * 90)),
+            "expected_duration": expected,
+            "duration": expected + rng.randint(-30, 120) if progress == 100 else 0,
+            "latest_status": progress,
+            "dependencies": deps,
+            "members": [f"member{i % 7}@example.com"],
+            "priority": rng.choice(["low", "medium", "high"]),
+            "estimated_cost": rng.randint(0, 500),
+            "postponed": False,
+        })
+    return project, tasks
+
+
+def timed(label: str, fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    elapsed = time.perf_counter() - started
+    print(f"[BENCH] {label}: {elapsed * 1000:.0f} ms")
+    return result
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    project, tasks = synthetic_project(count)
+    print(f"[BENCH] {count} tasks, evaluated at {datetime.now(pytz.UTC).isoformat()}")
+    # The first round fills the timezone/label/state caches; later rounds show steady state
+    for round_no in range(1, 4):
+        timed(f"round {round_no} gantt", generate_gantt_chart, [dict(t) for t in tasks])
+        timed(f"round {round_no} timetable", generate_timetable, project, [dict(t) for t in tasks])
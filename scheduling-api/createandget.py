@@ -1,9 +1,14 @@
 # scheduling-api/createandget.py
+import itertools
 from datetime import datetime, timedelta
-import re
 import pytz
 import shortuuid
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure
 from db import projects_col, tasks_col, updates_col, project_updates_col, db
+from task_states import _as_utc, dependency_states, evaluate_task_state_window, get_project_task_states, get_project_task_windows, project_versions, state_cache, topological_order
+from scheduler import CRITICAL_PATH_FIELDS, plan_reschedule
+from rollups import apply_rollup_delta, bump_project_version, empty_rollup, project_totals, rollup_delta, rollup_inc, sum_rollups
 
 # Short UUID generator (keeps IDs short and string-based)
 uuid = shortuuid.ShortUUID()
@@ -15,6 +20,12 @@ def generate_unique_id(length: int = 8) -> str:
 def _now():
     return datetime.now(pytz.UTC)
 
+def lookup_key(value: str):
+    """Normalized form of a name used for indexed case-insensitive lookups (company_key, name_key, ...)."""
+    if value is None:
+        return None
+    return str(value).lower()
+
 # ------------------------
 # Project functions
 # ------------------------
@@ -26,8 +37,8 @@ def create_project(name: str, start_date: datetime, company_name: str, timezone:
     """
     # Check for duplicate project names within the company
     existing = projects_col.find_one({
-        "company_name": {"$regex": f"^{company_name}$", "$options": "i"},
-        "name": {"$regex": f"^{name}$", "$options": "i"}
+        "company_key": lookup_key(company_name),
+        "name_key": lookup_key(name)
     })
     
     if existing:
@@ -46,16 +57,20 @@ def create_project(name: str, start_date: datetime, company_name: str, timezone:
     doc = {
         "id": proj_id,
         "name": name,
+        "name_key": lookup_key(name),
         "start_date": start_date,
         "timezone": timezone,
         "project_type": project_type,
         "objectives": objectives or [],
-        "expected_duration": None,  # Will be calculated from tasks
+        "expected_duration": 0,  # Sum of task expected durations, kept by rollups
         "duration": 0,  # Actual duration when complete
-        "total_estimated_cost": 0,  # Will be calculated from tasks
+        "total_estimated_cost": 0,  # Sum of task estimated costs, kept by rollups
+        "rollup": empty_rollup(),  # Task counters, see rollups.py
+        "version": 0,  # Bumped on every task change (rollups.bump_project_version)
         "state": "tentative",
         "team": [],  # FIXED: Initialize as empty list
         "company_name": company_name,
+        "company_key": lookup_key(company_name),
         "tasks": [],  # List of task IDs
         "role_allocations": {},  # Task ID -> list of role allocations
         "fund_allocations": [],  # List of fund allocations
@@ -79,17 +94,14 @@ def get_project(project_id: str):
 def get_project_by_name(project_name: str):
     if not project_name:
         return None
-    safe = re.escape(project_name)
-    return projects_col.find_one({"name": {"$regex": f"^{safe}$", "$options": "i"}})
+    return projects_col.find_one({"name_key": lookup_key(project_name)})
 
 def get_project_by_company_and_name(company_name: str, project_name: str):
     if not company_name or not project_name:
         return None
-    safe_company = re.escape(company_name)
-    safe_proj = re.escape(project_name)
     return projects_col.find_one({
-        "company_name": {"$regex": f"^{safe_company}$", "$options": "i"},
-        "name": {"$regex": f"^{safe_proj}$", "$options": "i"}
+        "company_key": lookup_key(company_name),
+        "name_key": lookup_key(project_name)
     })
 
 def create_task(project_id: str, name: str, start_time: datetime = None, expected_duration: int = 0,
@@ -107,7 +119,7 @@ def create_task(project_id: str, name: str, start_time: datetime = None, expecte
     # Validate uniqueness of task name within project
     existing = tasks_col.find_one({
         "project_id": project_id, 
-        "name": {"$regex": f"^{name}$", "$options": "i"}
+        "name_key": lookup_key(name)
     })
     if existing:
         print(f"Task {name} already exists in project {project_id}")
@@ -127,9 +139,8 @@ def create_task(project_id: str, name: str, start_time: datetime = None, expecte
         start_time = start_time.astimezone(tz)
 
     # Determine default start_time from dependencies or project start_date
-    project_start = project.get("start_date") or _now()
-    if project_start.tzinfo is None:
-        project_start = tz.localize(project_start)
+    # (datetimes read back from Mongo are naive UTC)
+    project_start = _as_utc(project.get("start_date") or _now())
 
     default_start = None
     valid_dependencies = []
@@ -138,9 +149,7 @@ def create_task(project_id: str, name: str, start_time: datetime = None, expecte
             dep_task = tasks_col.find_one({"id": dep})
             if dep_task:
                 valid_dependencies.append(dep)
-                dep_start = dep_task.get("start_time", project_start)
-                if dep_start.tzinfo is None:
-                    dep_start = tz.localize(dep_start)
+                dep_start = _as_utc(dep_task.get("start_time", project_start))
                 dep_end = dep_start + timedelta(minutes=dep_task.get("expected_duration", 0))
                 default_start = max(default_start, dep_end) if default_start else dep_end
 
@@ -155,10 +164,12 @@ def create_task(project_id: str, name: str, start_time: datetime = None, expecte
         "id": task_id,
         "project_id": project_id,
         "name": name,
+        "name_key": lookup_key(name),
         "start_time": start_time,
         "expected_duration": expected_duration,  # FIXED: Ensure this is set
         "duration": 0,  # Actual duration when complete
         "priority": priority,
+        "priority_key": lookup_key(priority),
         "members": members or [],
         "description": description,
         "updates": [],  # list of update ids
@@ -173,56 +184,273 @@ def create_task(project_id: str, name: str, start_time: datetime = None, expecte
     try:
         result = tasks_col.insert_one(task_doc)
         
-        # Add reference to project.tasks and update project totals
-        projects_col.update_one(
-            {"id": project_id}, 
-            {
-                "$push": {"tasks": task_id}, 
-                "$set": {"updated_at": _now()},
-                "$inc": {"total_estimated_cost": estimated_cost}
-            }
+        # Add reference to project.tasks and bump the project rollup
+        apply_rollup_delta(
+            project_id, rollup_delta(after=task_doc),
+            **{"$push": {"tasks": task_id}, "$set": {"updated_at": _now()}}
         )
         
-        # Update project expected_duration (sum of all task expected durations)
-        _update_project_expected_duration(project_id)
-        
         return task_doc
     except Exception as e:
         print(f"Error creating task: {e}")
         return None
 
-def _update_project_expected_duration(project_id: str):
-    """Helper function to update project's expected_duration based on task durations"""
-    try:
-        # Calculate total expected duration from all tasks
-        pipeline = [
-            {"$match": {"project_id": project_id}},
-            {"$group": {"_id": None, "total_duration": {"$sum": "$expected_duration"}}}
-        ]
-        result = list(tasks_col.aggregate(pipeline))
-        total_duration = result[0]["total_duration"] if result else 0
-        
-        projects_col.update_one(
-            {"id": project_id},
-            {"$set": {"expected_duration": total_duration, "updated_at": _now()}}
-        )
-    except Exception as e:
-        print(f"Error updating project expected duration: {e}")
-
 def get_task(task_id: str):
     return tasks_col.find_one({"id": task_id})
 
 def get_task_by_name(project_id: str, task_name: str):
+    if not task_name:
+        return None
     return tasks_col.find_one({
         "project_id": project_id, 
-        "name": {"$regex": f"^{task_name}$", "$options": "i"}
+        "name_key": lookup_key(task_name)
     })
 
-def get_project_tasks(project_id: str):
-    """Return list of tasks belonging to a project, ordered by start_time ascending."""
-    cursor = tasks_col.find({"project_id": project_id}).sort("start_time", 1)
+def get_project_tasks(project_id: str, projection: dict = None, limit: int = None, after: tuple = None):
+    """
+    Return list of tasks belonging to a project, ordered by start_time ascending (id breaks ties).
+    projection limits the fields loaded; limit/after page through the tasks, where after is the
+    (start_time, id) of the last task of the previous page.
+    """
+    query = {"project_id": project_id}
+    if after:
+        query.update(keyset_filter("start_time", after))
+    cursor = tasks_col.find(query, projection).sort([("start_time", 1), ("id", 1)])
+    if limit:
+        cursor = cursor.limit(limit)
     return list(cursor)
 
+def iter_project_tasks(project_id: str, batch_size: int = 500):
+    """Cursor over a project's tasks ordered by (start_time, id), fetched batch_size documents at a time."""
+    return tasks_col.find({"project_id": project_id}, {"_id": 0}).sort(
+        [("start_time", 1), ("id", 1)]
+    ).batch_size(batch_size)
+
+def iter_company_tasks(project_ids: list, projection: dict = None, batch_size: int = 500):
+    """
+    One cursor over the tasks of many projects, each project's tasks together: ordered by
+    (project_id, start_time, id) and fetched batch_size documents at a time.
+    """
+    return tasks_col.find({"project_id": {"$in": project_ids}}, projection or {"_id": 0}).sort(
+        [("project_id", 1), ("start_time", 1), ("id", 1)]
+    ).batch_size(batch_size)
+
+def iter_task_states(tasks):
+    """
+    (task, state) pairs for a cursor holding each project's tasks together (iter_company_tasks).
+    Dependencies stay within a project, so states are evaluated, and tasks held, one project at a time.
+    """
+    for _, project_tasks in itertools.groupby(tasks, key=lambda t: t.get("project_id")):
+        project_tasks = list(project_tasks)
+        states = get_project_task_states(project_tasks)
+        for task in project_tasks:
+            yield task, states.get(task.get("id"))
+
+def load_project_task_states(project_id: str, at_time: datetime = None, version: int = None) -> dict:
+    """
+    {task_id: state} for a project, loading only the fields the evaluator needs.
+    Pass the project's version to let live states use state_cache.
+    """
+    versions = {project_id: version} if version is not None else None
+    return get_project_task_states(get_project_tasks(project_id, _STATE_PROJECTION), at_time, versions)
+
+def load_project_task_windows(project_id: str, at_time: datetime = None, version: int = None) -> dict:
+    """load_project_task_states, returning {task_id: (state, valid_from, valid_until)}."""
+    versions = {project_id: version} if version is not None else None
+    return get_project_task_windows(get_project_tasks(project_id, _STATE_PROJECTION), at_time, versions)
+
+def get_company_projects(company_name: str, projection: dict = None, task_projection: dict = None,
+                         limit: int = None, after: tuple = None):
+    """
+    A company's projects ordered by (start_date, id), with their tasks embedded, in one aggregation.
+    projection/task_projection limit the project and task fields; with task_projection=None tasks
+    are not joined at all. Each task gets planned_end (start_time + expected_duration) and each
+    project the latest planned_end of its tasks. limit/after page on (start_date, id).
+    """
+    match = {"company_key": lookup_key(company_name)}
+    if after:
+        match.update(keyset_filter("start_date", after))
+
+    pipeline = [{"$match": match}, {"$sort": {"start_date": 1, "id": 1}}]
+    if limit:
+        pipeline.append({"$limit": limit})
+    if projection:
+        pipeline.append({"$project": projection})
+    if task_projection is not None:
+        pipeline.append({"$lookup": {
+            "from": tasks_col.name,
+            "let": {"project_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$project_id", "$$project_id"]}}},
+                {"$sort": {"start_time": 1, "id": 1}},
+                {"$project": task_projection},
+                {"$addFields": {"planned_end": {"$add": [
+                    "$start_time", {"$multiply": [{"$ifNull": ["$expected_duration", 0]}, 60000]}
+                ]}}},
+            ],
+            "as": "tasks"
+        }})
+        pipeline.append({"$addFields": {"planned_end": {"$max": "$tasks.planned_end"}}})
+    return list(projects_col.aggregate(pipeline))
+
+def get_company_summary(company_name: str) -> dict:
+    """
+    Company-wide report inputs:
+        {"total_projects", "total_tasks", "team_members", "versions", "tasks"}
+    One small aggregation over the company's projects collects each project's id, version and
+    rollup task count plus the distinct team emails; totals and versions ({project_id: version})
+    come from those. tasks is a cursor over every task's state fields with each project's tasks
+    together (iter_company_tasks), so neither a result document nor a list grows with the tasks.
+    """
+    summary = next(projects_col.aggregate([
+        {"$match": {"company_key": lookup_key(company_name)}},
+        {"$unwind": {"path": "$team", "preserveNullAndEmptyArrays": True}},
+        {"$group": {
+            "_id": None,
+            "projects": {"$addToSet": {
+                "id": "$id",
+                "version": {"$ifNull": ["$version", 0]},
+                "task_count": {"$ifNull": ["$rollup.task_count", 0]},
+            }},
+            "members": {"$addToSet": "$team"},
+        }},
+    ]), {})
+    projects = summary.get("projects", [])
+    versions = project_versions(projects)
+    return {
+        "total_projects": len(projects),
+        "total_tasks": sum(p["task_count"] for p in projects),
+        "team_members": sum(1 for m in summary.get("members", []) if m),
+        "versions": versions,
+        "tasks": iter_company_tasks(list(versions), _STATE_PROJECTION),
+    }
+
+# Task fields a Gantt row is built from (views.iter_gantt_rows), plus project_id
+_GANTT_PROJECTION = {
+    "_id": 0, "id": 1, "project_id": 1, "name": 1, "start_time": 1, "expected_duration": 1,
+    "duration": 1, "latest_status": 1, "postponed": 1, "dependencies": 1, "members": 1,
+    "priority": 1, "estimated_cost": 1, "description": 1
+}
+
+def get_progress_history(project_id: str, unit: str = "day", timezone: str = "Africa/Nairobi") -> list:
+    """
+    A project's tasks with their progress history bucketed by $dateTrunc (unit "day" or
+    "week", weeks starting Monday, in timezone), in one aggregation. Each task gets
+        "progress": [{"_id": bucket start (UTC), "status": last status_percentage in the bucket}]
+    ordered by bucket. The updates are read per task off the (task_id, timestamp) index.
+    """
+    pipeline = [
+        {"$match": {"project_id": project_id}},
+        {"$project": {"_id": 0, "id": 1, "start_time": 1, "expected_duration": 1, "latest_status": 1}},
+        {"$lookup": {
+            "from": updates_col.name,
+            "let": {"task_id": "$id"},
+            "pipeline": [
+                {"$match": {"$expr": {"$eq": ["$task_id", "$$task_id"]}}},
+                {"$sort": {"timestamp": 1}},
+                {"$group": {
+                    "_id": {"$dateTrunc": {
+                        "date": "$timestamp", "unit": unit, "timezone": timezone, "startOfWeek": "monday"
+                    }},
+                    "status": {"$last": "$status_percentage"},
+                }},
+                {"$sort": {"_id": 1}},
+            ],
+            "as": "progress"
+        }},
+    ]
+    return list(tasks_col.aggregate(pipeline))
+
+def get_member_assignments(project_ids: list, start: datetime = None, end: datetime = None, members: list = None) -> list:
+    """
+    One row per (member, task) for tasks of many projects scheduled to overlap [start, end),
+    ordered by (member, start_time), in one aggregation. Each row carries the task fields,
+    member (one of its members) and planned_end (start_time + expected_duration).
+    members limits the rows to those people (index members, project_id, start_time).
+    """
+    match = {"project_id": {"$in": project_ids}, "members.0": {"$exists": True}, "start_time": {"$ne": None}}
+    if members:
+        match["members"] = {"$in": members}
+    if end:
+        match["start_time"] = {"$lt": end}
+
+    pipeline = [
+        {"$match": match},
+        {"$project": {
+            "_id": 0, "id": 1, "project_id": 1, "name": 1, "start_time": 1,
+            "expected_duration": 1, "latest_status": 1, "members": 1,
+        }},
+        {"$addFields": {"planned_end": {"$add": [
+            "$start_time", {"$multiply": [{"$ifNull": ["$expected_duration", 0]}, 60000]}
+        ]}}},
+    ]
+    if start:
+        pipeline.append({"$match": {"planned_end": {"$gt": start}}})
+    pipeline += [
+        {"$unwind": "$members"},
+        {"$addFields": {"member": "$members"}},
+        {"$project": {"members": 0}},
+    ]
+    if members:
+        pipeline.append({"$match": {"member": {"$in": members}}})
+    pipeline.append({"$sort": {"member": 1, "start_time": 1, "id": 1}})
+    return list(tasks_col.aggregate(pipeline))
+
+def get_portfolio_tasks(project_ids: list, start: datetime = None, end: datetime = None):
+    """
+    Tasks of many projects starting in [start, end), ordered by (start_time, id), in one aggregation.
+    The window is matched on start_time (index project_id, start_time). States depend on
+    dependencies that may start outside the window, so those are pulled in by the same query
+    ($graphLookup, state fields only).
+    Returns (tasks, upstream): the windowed tasks and the outside dependencies they need.
+    """
+    match = {"project_id": {"$in": project_ids}}
+    window = {}
+    if start:
+        window["$gte"] = start
+    if end:
+        window["$lt"] = end
+    if window:
+        match["start_time"] = window
+
+    pipeline = [
+        {"$match": match},
+        {"$sort": {"start_time": 1, "id": 1}},
+        {"$project": _GANTT_PROJECTION},
+    ]
+    if window:
+        pipeline += [
+            {"$graphLookup": {
+                "from": tasks_col.name,
+                "startWith": "$dependencies",
+                "connectFromField": "dependencies",
+                "connectToField": "id",
+                "as": "upstream",
+                "restrictSearchWithMatch": {"project_id": {"$in": project_ids}}
+            }},
+            {"$addFields": {"upstream": {"$map": {
+                "input": "$upstream",
+                "in": {field: f"$$this.{field}" for field in _STATE_PROJECTION if field != "_id"}
+            }}}},
+        ]
+
+    tasks = list(tasks_col.aggregate(pipeline))
+    in_window = {t["id"] for t in tasks}
+    upstream = {}
+    for task in tasks:
+        for dep in task.pop("upstream", []):
+            if dep["id"] not in in_window:
+                upstream[dep["id"]] = dep
+    return tasks, list(upstream.values())
+
+def keyset_filter(sort_field: str, after: tuple) -> dict:
+    """Filter for documents sorting strictly after (sort_value, id) on (sort_field, id)."""
+    value, last_id = after
+    if value is None:
+        # Missing sort values sort first; continue among them, then everything that has one
+        return {"$or": [{sort_field: {"$ne": None}}, {sort_field: None, "id": {"$gt": last_id}}]}
+    return {"$or": [{sort_field: {"$gt": value}}, {sort_field: value, "id": {"$gt": last_id}}]}
+
 def get_latest_progress(task_id: str):
     """Return the most recent status_percentage for a task (0-100)."""
     task = get_task(task_id)
@@ -233,82 +461,201 @@ def get_latest_progress(task_id: str):
 # ------------------------
 # Update functions
 # ------------------------
-def create_task_update(task_id: str, status_percentage: int, description: str = None, image_filenames: list = None):
+# Task fields create_task_update needs back to move the project rollup
+_UPDATE_PROJECTION = {
+    "_id": 0, "project_id": 1, "start_time": 1, "latest_status": 1,
+    "duration": 1, "estimated_cost": 1, "expected_duration": 1
+}
+
+def create_task_update(task_id: str, status_percentage: int, description: str = None, image_filenames: list = None,
+                       expenditure: float = None, allow_complete: bool = True):
     """
     FIXED: Create an update for a task. Maintains task.latest_status and task.duration if completed.
+    One insert for the update plus one find_one_and_update on the task; the project rollup is
+    only touched when the task changes progress bucket (other updates just $inc its version),
+    and completion is read off its counters.
+    With allow_complete=False, raises ValueError if the task is closed (task_states.is_task_closed).
     Returns the new update id or None on error.
     """
-    task = get_task(task_id)
+    status = int(status_percentage)
+    update_id = generate_unique_id()
+    now = _now()
+    # Mongo keeps milliseconds; truncate so the duration computed here matches the stored one
+    now = now.replace(microsecond=now.microsecond // 1000 * 1000)
+
+    task_filter = {"id": task_id}
+    if not allow_complete:
+        # is_task_closed, checked in the same write
+        task_filter["$or"] = [{"latest_status": {"$ne": 100}}, {"postponed": True}]
+
+    fields = {
+        "latest_status": status,
+        "updated_at": now,
+        "updates": {"$concatArrays": [{"$ifNull": ["$updates", []]}, [update_id]]}
+    }
+    if status == 100:
+        # Actual duration in whole minutes, computed server-side from the stored start_time
+        elapsed_ms = {"$subtract": [now, {"$ifNull": ["$start_time", now]}]}
+        fields["duration"] = {"$toInt": {"$floor": {"$divide": [elapsed_ms, 60000]}}}
+
+    try:
+        task = tasks_col.find_one_and_update(
+            task_filter, [{"$set": fields}], projection=_UPDATE_PROJECTION,
+            return_document=ReturnDocument.BEFORE
+        )
+    except Exception as e:
+        print(f"Error creating task update: {e}")
+        return None
     if not task:
+        if not allow_complete and tasks_col.count_documents({"id": task_id}, limit=1):
+            raise ValueError("Task is complete. Restore the task before creating updates.")
         return None
 
-    update_id = generate_unique_id()
     update_doc = {
         "id": update_id,
         "task_id": task_id,
-        "status_percentage": int(status_percentage),
+        "status_percentage": status,
         "description": description,
         "image_filenames": image_filenames or [],
-        "timestamp": _now()
+        "timestamp": now
     }
-    
-    try:
-        result = updates_col.insert_one(update_doc)
-        
-        # Update task with new status and add update reference
-        update_data = {
-            "latest_status": int(status_percentage),
-            "updated_at": _now()
-        }
-        
-        tasks_col.update_one(
-            {"id": task_id}, 
-            {
-                "$push": {"updates": update_id},
-                "$set": update_data
-            }
-        )
+    if expenditure is not None:
+        update_doc["expenditure"] = expenditure
 
-        # If task is completed, calculate actual duration
-        if int(status_percentage) == 100:
-            now = _now()
-            task_doc = get_task(task_id)
-            start_time = task_doc.get("start_time", now)
-            actual_mins = int((now - start_time).total_seconds() // 60)
-            
-            tasks_col.update_one(
-                {"id": task_id}, 
-                {"$set": {"duration": actual_mins}}
-            )
-
-            # If all project tasks are now complete, update project.duration
-            project_id = task_doc.get("project_id")
-            if project_id:
-                # Count incomplete tasks
-                incomplete_count = tasks_col.count_documents({
-                    "project_id": project_id, 
-                    "latest_status": {"$lt": 100}
-                })
-                
-                if incomplete_count == 0:
-                    # Sum actual durations
-                    pipeline = [
-                        {"$match": {"project_id": project_id}},
-                        {"$group": {"_id": None, "total": {"$sum": "$duration"}}}
-                    ]
-                    agg_result = list(tasks_col.aggregate(pipeline))
-                    total_duration = agg_result[0]["total"] if agg_result else 0
-                    
-                    projects_col.update_one(
-                        {"id": project_id}, 
-                        {"$set": {"duration": total_duration, "state": "complete", "updated_at": _now()}}
-                    )
-
-        return update_id
+    try:
+        updates_col.insert_one(update_doc)
     except Exception as e:
         print(f"Error creating task update: {e}")
+        # Roll the task back to its BEFORE values: no rollup delta was applied for this update
+        rollback = {"$pull": {"updates": update_id}, "$set": {"latest_status": task.get("latest_status", 0)}}
+        if "duration" in task:
+            rollback["$set"]["duration"] = task["duration"]
+        else:
+            rollback["$unset"] = {"duration": ""}
+        tasks_col.update_one({"id": task_id}, rollback)
         return None
 
+    state_cache.invalidate(task_id)
+
+    after = {**task, "latest_status": status}
+    if status == 100:
+        start_time = _as_utc(task.get("start_time") or now)
+        after["duration"] = int((now - start_time).total_seconds() // 60)
+
+    # Move the project counters; completion is read off them instead of scanning tasks.
+    # Updates within a bucket only bump the version (ETags and render caches key on it)
+    delta = rollup_delta(task, after)
+    if delta or status == 100:
+        project = apply_rollup_delta(task.get("project_id"), delta)
+        if project and status == 100:
+            complete_project_if_done(project)
+    else:
+        bump_project_version(task.get("project_id"))
+
+    return update_id
+
+def reschedule_task(task_id: str, new_start: datetime, new_duration: int = None, dry_run: bool = False):
+    """
+    Move a task to new_start and push back every dependent whose start is now violated
+    (see scheduler.plan_reschedule). All moves are written with one bulk_write and summarized
+    in one project update. With dry_run=True nothing is written.
+    new_duration, when given, is the task's new planned duration and is stored as expected_duration;
+    a complete task's recorded actual duration is left alone.
+    Returns the list of changes, the moved task first. Raises ValueError (CycleError) on bad input.
+    """
+    task = tasks_col.find_one({"id": task_id}, {"_id": 0})
+    if not task:
+        raise ValueError("Task not found")
+
+    tasks = get_project_tasks(task["project_id"], CRITICAL_PATH_FIELDS)
+    changes = plan_reschedule(tasks, task_id, new_start, new_duration)
+    if dry_run:
+        return changes
+
+    resized = {} if new_duration is None else {"expected_duration": new_duration}
+
+    ops = []
+    for change in changes:
+        fields = {"start_time": change["new_start"], "updated_at": _now()}
+        if change["id"] == task_id:
+            fields.update(postponed=False, **resized)
+        ops.append(UpdateOne({"id": change["id"]}, {"$set": fields}))
+    tasks_col.bulk_write(ops, ordered=False)
+    state_cache.invalidate([change["id"] for change in changes])
+    delta = rollup_delta(task, {**task, **resized})
+    if delta:
+        apply_rollup_delta(task["project_id"], delta)
+    else:
+        bump_project_version(task["project_id"])
+
+    cascade = changes[1:]
+    description = f"Task '{task['name']}' rescheduled to {changes[0]['new_start'].isoformat()}"
+    if cascade:
+        moved = ", ".join(f"'{c['name']}' to {c['new_start'].isoformat()}" for c in cascade)
+        description += f"; {len(cascade)} dependent task(s) pushed back: {moved}"
+    create_project_update(task["project_id"], description)
+    return changes
+
+def postpone_projects(projects: list, new_start: datetime) -> int:
+    """
+    Move each project to start at new_start and shift all of its tasks by the same amount.
+    Tasks are shifted server-side with one pipeline update_many ($dateAdd) per project, the
+    projects with one update_many and the log entries with one insert_many, all in a single
+    transaction where the server supports it. Returns the number of tasks moved.
+    """
+    now = _now()
+    new_start = _as_utc(new_start)
+    shifts = []
+    for project in projects:
+        delta = new_start - _as_utc(project['start_date'])
+        shifts.append((project['id'], int(delta.total_seconds() * 1000)))
+    logs = [{
+        "id": generate_unique_id(),
+        "project_id": project_id,
+        "description": f"Project postponed to {new_start.isoformat()}",
+        "timestamp": now
+    } for project_id, _ in shifts]
+
+    def write(session=None):
+        moved = 0
+        for project_id, delta_ms in shifts:
+            if not delta_ms:
+                continue
+            result = tasks_col.update_many({"project_id": project_id}, [{"$set": {
+                "start_time": {"$dateAdd": {"startDate": "$start_time", "unit": "millisecond", "amount": delta_ms}},
+                "updated_at": now
+            }}], session=session)
+            moved += result.modified_count
+        projects_col.update_many(
+            {"id": {"$in": [project_id for project_id, _ in shifts]}},
+            {"$set": {"start_date": new_start, "updated_at": now}, "$inc": {"version": 1}},
+            session=session
+        )
+        project_updates_col.insert_many(logs, session=session)
+        return moved
+
+    return _in_transaction(write)
+
+def _in_transaction(write):
+    """Run write(session) in a transaction; standalone servers without transactions run it directly."""
+    try:
+        with db.client.start_session() as session:
+            return session.with_transaction(write)
+    except OperationFailure as e:
+        # IllegalOperation: standalone server without transaction support
+        if e.code != 20:
+            raise
+    return write()
+
+def complete_project_if_done(project: dict):
+    """Mark a project complete once its rollup shows every task at 100%."""
+    totals = project_totals(project)
+    if totals["task_count"] and totals["complete"] == totals["task_count"]:
+        projects_col.update_one(
+            {"id": project["id"]}, 
+            {"$set": {"duration": totals["actual_minutes"], "state": "complete", "updated_at": _now()}, "$inc": {"version": 1}}
+        )
+
 def create_project_update(project_id: str, description: str):
     """Create a project-level update/log entry"""
     puid = generate_unique_id()
@@ -326,136 +673,228 @@ def create_project_update(project_id: str, description: str):
         return None
 
 # ------------------------
-# Batch task creation (improved error reporting)
+# Batch task creation
 # ------------------------
-def create_tasks_batch(task_list: list, transactional: bool = False):
+def create_tasks_batch(task_list: list, transactional: bool = True):
     """
-    FIXED: Batch task creation with better error handling and validation.
-    task_list: list of dicts with keys required by create_task
-    Returns list of created tasks or raises exception on failure.
+    Create many tasks with one insert_many and one update per project.
+    task_list: list of dicts with the keys taken by create_task. Each entry of an item's
+    "dependencies" may be the id or name of a task already in the project, or the name
+    of another task in the same batch and project.
+    The whole batch is validated in memory first; writes run in a transaction when the
+    server supports one, otherwise created tasks are removed again on failure.
+    Returns the list of created tasks or raises ValueError.
     """
     if not task_list:
         return []
-        
-    created_tasks = []
-    
-    # Validate all tasks first
+
     for i, item in enumerate(task_list):
         required = ('project_id', 'name', 'expected_duration')
         for r in required:
             if r not in item:
                 raise ValueError(f"Task {i}: Missing required field: {r}")
-                
+
         if item['expected_duration'] <= 0:
             raise ValueError(f"Task {i}: expected_duration must be positive")
-    
-    if transactional and hasattr(db, 'client'):
-        # Use transaction if available
+
+    # Load every project and its existing tasks once
+    project_ids = list({item['project_id'] for item in task_list})
+    projects = {p['id']: p for p in projects_col.find({"id": {"$in": project_ids}})}
+    for pid in project_ids:
+        if pid not in projects:
+            raise ValueError(f"Project {pid} not found")
+
+    existing_by_id = {}
+    existing_by_key = {}
+    for t in tasks_col.find(
+        {"project_id": {"$in": project_ids}},
+        {"_id": 0, "id": 1, "project_id": 1, "name": 1, "name_key": 1, "start_time": 1, "expected_duration": 1}
+    ):
+        existing_by_id[t['id']] = t
+        existing_by_key[(t['project_id'], t.get('name_key') or lookup_key(t.get('name')))] = t
+
+    # Assign ids up front so tasks in the batch can depend on each other
+    batch_by_key = {}
+    drafts = []
+    for i, item in enumerate(task_list):
+        key = (item['project_id'], lookup_key(item['name']))
+        if key in existing_by_key or key in batch_by_key:
+            raise ValueError(f"Task {i}: Task '{item['name']}' already exists in project {item['project_id']}")
+        draft = {"id": generate_unique_id(), "index": i, "item": item, "dependencies": []}
+        batch_by_key[key] = draft
+        drafts.append(draft)
+
+    for draft in drafts:
+        item = draft['item']
+        for dep in item.get('dependencies') or []:
+            dep_key = (item['project_id'], lookup_key(dep))
+            existing = existing_by_id.get(dep)
+            if existing and existing['project_id'] == item['project_id']:
+                draft['dependencies'].append(dep)
+            elif dep_key in batch_by_key:
+                draft['dependencies'].append(batch_by_key[dep_key]['id'])
+            elif dep_key in existing_by_key:
+                draft['dependencies'].append(existing_by_key[dep_key]['id'])
+            else:
+                raise ValueError(f"Task {draft['index']}: Dependency task '{dep}' not found")
+
+    ordered, cyclic = topological_order(drafts)
+    if cyclic:
+        names = [d['item']['name'] for d in drafts if d['id'] in cyclic]
+        raise ValueError(f"Dependency cycle between tasks: {', '.join(names)}")
+
+    # Build the documents, deriving default start times from dependency end times
+    now = _now()
+    ends = {tid: _as_utc(t['start_time']) + timedelta(minutes=t.get('expected_duration', 0) or 0)
+            for tid, t in existing_by_id.items() if t.get('start_time')}
+    docs = {}
+    for draft in ordered:
+        item = draft['item']
+        project = projects[item['project_id']]
+        tz = pytz.timezone(project.get('timezone', 'Africa/Nairobi'))
+        project_start = _as_utc(project.get("start_date") or now)
+
+        start_time = item.get('start_time')
+        if start_time and start_time.tzinfo is None:
+            start_time = tz.localize(start_time)
+        elif start_time:
+            start_time = start_time.astimezone(tz)
+
+        dep_ends = [ends[d] for d in draft['dependencies'] if d in ends]
+        if not start_time:
+            start_time = max(dep_ends + [project_start])
+        elif start_time < project_start:
+            raise ValueError(f"Task {draft['index']}: Task start_time cannot be before project start_date")
+
+        expected_duration = item['expected_duration']
+        ends[draft['id']] = start_time + timedelta(minutes=expected_duration)
+        priority = item.get('priority', 'medium')
+        docs[draft['id']] = {
+            "id": draft['id'],
+            "project_id": item['project_id'],
+            "name": item['name'],
+            "name_key": lookup_key(item['name']),
+            "start_time": start_time,
+            "expected_duration": expected_duration,
+            "duration": 0,
+            "priority": priority,
+            "priority_key": lookup_key(priority),
+            "members": item.get('members') or [],
+            "description": item.get('description'),
+            "updates": [],
+            "estimated_cost": item.get('estimated_cost', 0.0) or 0.0,
+            "dependencies": draft['dependencies'],
+            "postponed": False,
+            "latest_status": 0,
+            "created_at": now,
+            "updated_at": now
+        }
+
+    # Keep the caller's order in the response and project.tasks
+    task_docs = [docs[d['id']] for d in drafts]
+    project_updates = {}
+    for pid in project_ids:
+        mine = [t for t in task_docs if t['project_id'] == pid]
+        project_updates[pid] = {
+            "$push": {"tasks": {"$each": [t['id'] for t in mine]}},
+            "$inc": {**rollup_inc(sum_rollups(mine)), "version": 1},
+            "$set": {"updated_at": now}
+        }
+
+    if transactional:
         try:
             with db.client.start_session() as session:
-                with session.start_transaction():
-                    for item in task_list:
-                        task = create_task(
-                            project_id=item['project_id'],
-                            name=item['name'],
-                            start_time=item.get('start_time'),
-                            expected_duration=item.get('expected_duration', 0),
-                            priority=item.get('priority', 'medium'),
-                            members=item.get('members', []),
-                            description=item.get('description'),
-                            dependencies=item.get('dependencies', []),
-                            estimated_cost=item.get('estimated_cost', 0.0)
-                        )
-                        if not task:
-                            raise ValueError(f"Failed to create task: {item['name']}")
-                        created_tasks.append(task)
+                session.with_transaction(lambda s: _write_tasks_batch(task_docs, project_updates, s))
+            return _strip_object_ids(task_docs)
+        except OperationFailure as e:
+            # IllegalOperation: standalone server without transaction support
+            if e.code != 20:
+                raise ValueError(f"Batch creation failed: {e}")
         except Exception as e:
-            raise ValueError(f"Batch creation failed: {str(e)}")
-    else:
-        # Non-transactional batch creation
-        for item in task_list:
-            try:
-                task = create_task(
-                    project_id=item['project_id'],
-                    name=item['name'],
-                    start_time=item.get('start_time'),
-                    expected_duration=item.get('expected_duration', 0),
-                    priority=item.get('priority', 'medium'),
-                    members=item.get('members', []),
-                    description=item.get('description'),
-                    dependencies=item.get('dependencies', []),
-                    estimated_cost=item.get('estimated_cost', 0.0)
+            raise ValueError(f"Batch creation failed: {e}")
+
+    applied = []
+    try:
+        _write_tasks_batch(task_docs, project_updates, applied=applied)
+    except Exception as e:
+        # Best effort cleanup of whatever was written
+        task_ids = [t['id'] for t in task_docs]
+        try:
+            tasks_col.delete_many({"id": {"$in": task_ids}})
+            for pid in applied:
+                projects_col.update_one(
+                    {"id": pid},
+                    {
+                        "$pull": {"tasks": {"$in": task_ids}},
+                        # Bump the version again rather than reuse a number other readers may have seen
+                        "$inc": {**{k: -v for k, v in project_updates[pid]["$inc"].items()}, "version": 1}
+                    }
                 )
-                if not task:
-                    raise ValueError(f"Failed to create task: {item['name']}")
-                created_tasks.append(task)
-            except Exception as e:
-                # Rollback created tasks on failure
-                for created_task in created_tasks:
-                    try:
-                        tasks_col.delete_one({"id": created_task['id']})
-                        projects_col.update_one(
-                            {"id": created_task['project_id']},
-                            {"$pull": {"tasks": created_task['id']}}
-                        )
-                    except:
-                        pass  # Best effort cleanup
-                raise ValueError(f"Batch creation failed at task '{item['name']}': {str(e)}")
-    
-    return created_tasks
+        except Exception:
+            pass
+        raise ValueError(f"Batch creation failed: {e}")
+
+    return _strip_object_ids(task_docs)
+
+def _write_tasks_batch(task_docs: list, project_updates: dict, session=None, applied: list = None):
+    tasks_col.insert_many(task_docs, ordered=True, session=session)
+    for pid, update in project_updates.items():
+        projects_col.update_one({"id": pid}, update, session=session)
+        if applied is not None:
+            applied.append(pid)
+
+def _strip_object_ids(docs: list):
+    """insert_many adds Mongo's ObjectId _id to the dicts; callers return them as JSON."""
+    for doc in docs:
+        doc.pop("_id", None)
+    return docs
 
 # ------------------------
 # Task & Project state helpers
 # ------------------------
+# Fields get_task_state needs to evaluate a task
+_STATE_PROJECTION = {
+    "_id": 0, "id": 1, "project_id": 1, "start_time": 1, "expected_duration": 1,
+    "latest_status": 1, "postponed": 1, "dependencies": 1
+}
+
 def get_task_state(task_id: str, at_time: datetime = None):
     """
-    FIXED: Determine state of a task with better logic.
+    Determine the state of a single task, loading it and its dependencies by id.
     Returns: 'postponed','delayed','tentative','incipient','in progress','overdue','complete'
+    Live states are served from state_cache while still valid, so dependencies are usually not
+    reloaded; states at a given at_time are always evaluated and never cached.
+    Use get_project_task_states when the project's tasks are already loaded.
     """
-    if not at_time:
-        at_time = _now()
+    return _task_state_window(task_id, at_time or _now(), {} if not at_time else None)[0]
 
-    task = get_task(task_id)
+def _task_state_window(task_id: str, at_time: datetime, versions: dict = None):
+    """
+    (state, valid_from, valid_until) of a task. With versions (a {project_id: version} memo,
+    filled as projects are looked up) it is served from / stored in the cache under the same
+    dependency_states and project version key as get_project_task_windows uses.
+    """
+    task = tasks_col.find_one({"id": task_id}, _STATE_PROJECTION)
     if not task:
-        return None
-
-    task_start = task.get("start_time") or _now()
-    if task_start.tzinfo is None:
-        task_start = pytz.UTC.localize(task_start)
-
-    expected_duration = task.get("expected_duration", 0)
-    planned_end = task_start + timedelta(minutes=expected_duration)
-    
-    # Convert at_time to same timezone as task_start
-    if at_time.tzinfo is None:
-        at_time = pytz.UTC.localize(at_time)
-
-    if task.get("postponed", False):
-        return "postponed"
-
-    # Check dependencies
-    deps = task.get("dependencies", []) or []
-    for dep_id in deps:
-        dep_state = get_task_state(dep_id, at_time)
-        if dep_state in ["delayed", "overdue"]:
-            return "delayed"
-        if dep_state != "complete":
-            return "tentative"
-
-    progress = get_latest_progress(task_id)
-    if progress == 100:
-        return "complete"
-
-    if at_time < task_start:
-        return "tentative"
-
-    if at_time > planned_end:
-        return "overdue"
-
-    if progress == 0:
-        return "incipient"
-
-    return "in progress"
+        return None, None, None
+
+    dep_windows = {dep_id: _task_state_window(dep_id, at_time, versions)
+                   for dep_id in dict.fromkeys(task.get("dependencies", []) or [])}
+    if versions is None:
+        return evaluate_task_state_window(task, dep_windows.__getitem__, at_time)
+
+    project_id = task.get("project_id")
+    if project_id not in versions:
+        project = projects_col.find_one({"id": project_id}, {"_id": 0, "version": 1}) or {}
+        versions[project_id] = project.get("version", 0)
+    version = versions[project_id]
+    dep_states = dependency_states(task, lambda dep_id: dep_windows[dep_id][0])
+    cached = state_cache.get(task, at_time, dep_states, version)
+    if cached:
+        return cached
+    window = evaluate_task_state_window(task, dep_windows.__getitem__, at_time)
+    state_cache.put(task, *window, dep_states=dep_states, version=version)
+    return window
 
 # ------------------------
 # Convenience queries
@@ -466,7 +905,7 @@ def fetch_priority(project_name: str, priority: str):
         return []
     return list(tasks_col.find({
         "project_id": project["id"], 
-        "priority": {"$regex": f"^{priority}$", "$options": "i"}
+        "priority_key": lookup_key(priority)
     }))
 
 def get_member_tasks(project_name: str, member: str):
@@ -80,50 +80,11 @@ project_updates_col = db['project_updates']
 teams_col = db['teams']
 subscriptions_col = db['subscriptions']
 stripe_events_col = db['stripe_events']
-
-# Create indexes for better performance
-def create_indexes():
-    """Create database indexes for optimal performance"""
-    try:
-        print("[DB] Creating database indexes...")
-
-        # Users collection indexes
-        users_col.create_index("username", unique=True)
-        users_col.create_index("company_name")
-
-        # Projects collection indexes
-        projects_col.create_index([("company_name", 1), ("name", 1)], unique=True)
-        projects_col.create_index("company_name")
-        projects_col.create_index("start_date")
-
-        # Tasks collection indexes
-        tasks_col.create_index([("project_id", 1), ("name", 1)], unique=True)
-        tasks_col.create_index("project_id")
-        tasks_col.create_index("start_time")
-        tasks_col.create_index("members")
-
-        # Updates collection indexes
-        updates_col.create_index("task_id")
-        updates_col.create_index("timestamp")
-
-        # Project updates collection indexes
-        project_updates_col.create_index("project_id")
-        project_updates_col.create_index("timestamp")
-
-        # Teams collection indexes
-        teams_col.create_index([("company_name", 1), ("name", 1)], unique=True)
-
-        # Subscriptions collection indexes
-        subscriptions_col.create_index("company_name", unique=True)
-        subscriptions_col.create_index("stripe_customer_id")
-
-        # Stripe events collection indexes
-        stripe_events_col.create_index("stripe_event_id", unique=True)
-
-        print("[DB] Indexes created successfully.")
-
-    except Exception as e:
-        print(f"[DB] Warning: Could not create indexes: {e}")
+migrations_col = db['schema_migrations']
+snapshots_col = db['task_snapshots']
+report_snapshots_col = db['report_snapshots']
+locks_col = db['locks']
+export_jobs_col = db['export_jobs']
 
 def ping():
     """Test database connection"""
@@ -211,21 +172,14 @@ def check_atlas_connection():
     print("="*50 + "\n")
     return True
 
-# Initialize indexes on startup
+# Indexes are created by the versioned migrations in migrations.py (run on app startup)
 if __name__ == "__main__":
-    create_indexes()
     check_atlas_connection()
-else:
-    # Create indexes when module is imported
-    try:
-        create_indexes()
-    except Exception as e:
-        print(f"[DB] Warning: Could not create indexes on import: {e}")
 
 # Export collections for easy importing
 __all__ = [
     'client', 'db', 'users_col', 'projects_col', 'tasks_col',
     'updates_col', 'teams_col', 'project_updates_col',
-    'subscriptions_col', 'stripe_events_col',
+    'subscriptions_col', 'stripe_events_col', 'migrations_col',
     'ping', 'get_db_stats'
 ]
\ No newline at end of file
@@ -0,0 +1,61 @@
+# scheduling-api/etags.py
+"""
+Conditional GET (ETag / If-None-Match) driven by project["version"].
+
+An ETag is W/"<digest>.<expiry>":
+    digest  hash of the endpoint, the request parameters that shape the response and
+            the (id, version) of every project the response is built from
+    expiry  epoch second at which the task states in the response stop holding
+            (task states also change with the clock), or "never"
+
+A client's ETag still matches while its digest is unchanged and its expiry has not
+passed, so endpoints can answer 304 after reading project versions only, before
+running any task query.
+"""
+import hashlib
+import json
+from datetime import datetime
+import pytz
+from flask import request, Response
+
+
+def etag_digest(scope: str, projects: list, params=None) -> str:
+    """Digest for a response built from projects (documents carrying id and version)."""
+    versions = sorted([p.get('id'), p.get('version', 0)] for p in projects)
+    raw = json.dumps([scope, params, versions], sort_keys=True, default=str)
+    return hashlib.sha1(raw.encode()).hexdigest()[:20]
+
+
+def make_etag(digest: str, valid_until: datetime = None) -> str:
+    expiry = "never" if valid_until is None else str(int(valid_until.timestamp()))
+    return f'W/"{digest}.{expiry}"'
+
+
+def _client_etags():
+    header = request.headers.get('If-None-Match', '')
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        yield tag.strip('"')
+
+
+def not_modified(digest: str, at_time: datetime = None):
+    """A 304 response if the client's If-None-Match still holds for digest, else None."""
+    now = (at_time or datetime.now(pytz.UTC)).timestamp()
+    for tag in _client_etags():
+        tag_digest, _, expiry = tag.rpartition('.')
+        if tag_digest != digest:
+            continue
+        if expiry == "never" or (expiry.isdigit() and now < int(expiry)):
+            return Response(status=304, headers={"ETag": f'W/"{tag}"', "Cache-Control": "private, no-cache"})
+    return None
+
+
+def with_etag(response, digest: str, valid_until: datetime = None):
+    """Attach the ETag to a response (a Response or a (body, status) tuple from jsonify)."""
+    body, status = response if isinstance(response, tuple) else (response, None)
+    if status in (None, 200):
+        body.headers["ETag"] = make_etag(digest, valid_until)
+        body.headers["Cache-Control"] = "private, no-cache"
+    return response
@@ -0,0 +1,219 @@
+# scheduling-api/export_jobs.py
+"""
+Background export jobs: POST /reports/exports queues an export, a worker process
+writes it to EXPORT_FOLDER and clients poll GET /reports/exports/<id> for progress
+until they can download it. Exports then never run inside a gunicorn worker.
+
+A job document in export_jobs:
+
+    {"id", "company_key", "company_name", "params": {"format", "table", "project"},
+     "status": "queued" | "running" | "done" | "failed" | "expired",
+     "rows", "total", "size", "error", "owner", "heartbeat_at",
+     "created_at", "started_at", "finished_at", "active_key"}
+
+active_key (company + params) is set while the job is queued or running and is
+unique, so identical in-flight requests from a company share one job. Workers claim
+queued jobs atomically, and a running job whose worker stopped heartbeating is
+claimed again. Artifacts are deleted ARTIFACT_TTL after the job finished.
+
+Run the worker from the scheduling-api directory:
+
+    python export_jobs.py worker
+
+In production it runs as its own container (export_worker in docker-compose.yml), which
+Docker restarts if it exits, and shares the exports volume with the backend.
+"""
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+from db import export_jobs_col
+from createandget import _now, generate_unique_id, lookup_key
+from exports import load_export_projects, stream_export
+from rollups import project_totals
+from task_states import _as_utc
+
+EXPORT_FOLDER = os.getenv("EXPORT_FOLDER", "exports")
+POLL_INTERVAL = 2  # seconds between polls of an idle worker
+# A running job not heartbeating for this long is claimed again
+JOB_STALE = timedelta(minutes=5)
+HEARTBEAT_EVERY = 5  # seconds between progress writes
+ARTIFACT_TTL = timedelta(hours=24)
+
+
+def _active_key(company_key: str, params: dict) -> str:
+    raw = json.dumps([company_key, params], sort_keys=True)
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def artifact_path(job: dict) -> str:
+    return os.path.join(EXPORT_FOLDER, f"{job['id']}.{job['params']['format']}")
+
+
+# ------------------------
+# API side
+# ------------------------
+def submit_job(company: str, params: dict):
+    """Queue an export, or return the identical job already in flight. Returns (job, created)."""
+    company_key = lookup_key(company)
+    now = _now()
+    job = {
+        "id": generate_unique_id(),
+        "company_key": company_key,
+        "company_name": company,
+        "params": params,
+        "status": "queued",
+        "rows": 0,
+        "total": None,
+        "size": None,
+        "error": None,
+        "created_at": now,
+        "active_key": _active_key(company_key, params),
+    }
+    try:
+        export_jobs_col.insert_one(job)
+        job.pop("_id", None)
+        return job, True
+    except DuplicateKeyError:
+        existing = export_jobs_col.find_one({"active_key": job["active_key"]}, {"_id": 0})
+        if existing:
+            return existing, False
+        # Finished between the insert and the lookup: queue a new one
+        return submit_job(company, params)
+
+
+def get_job(company: str, job_id: str):
+    return export_jobs_col.find_one({"id": job_id, "company_key": lookup_key(company)}, {"_id": 0})
+
+
+def job_view(job: dict) -> dict:
+    """The job as returned to clients."""
+    view = {
+        "id": job["id"],
+        "status": job["status"],
+        "params": job["params"],
+        "rows": job.get("rows", 0),
+        "total": job.get("total"),
+        "size": job.get("size"),
+        "error": job.get("error"),
+        "created_at": _as_utc(job["created_at"]).isoformat(),
+        "finished_at": _as_utc(job["finished_at"]).isoformat() if job.get("finished_at") else None,
+    }
+    if job["status"] == "done":
+        view["download_url"] = f"/reports/exports/{job['id']}/download"
+    return view
+
+
+# ------------------------
+# Worker side
+# ------------------------
+def claim_job(owner: str):
+    """Take the oldest queued job (or a running one whose worker died), or None."""
+    now = _now()
+    return export_jobs_col.find_one_and_update(
+        {"$or": [
+            {"status": "queued"},
+            {"status": "running", "heartbeat_at": {"$lt": now - JOB_STALE}},
+        ]},
+        {"$set": {"status": "running", "owner": owner, "started_at": now, "heartbeat_at": now, "rows": 0}},
+        sort=[("created_at", 1)],
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _finish(job: dict, owner: str, fields: dict):
+    export_jobs_col.update_one(
+        {"id": job["id"], "owner": owner},
+        {"$set": {**fields, "finished_at": _now()}, "$unset": {"active_key": ""}}
+    )
+
+
+def run_job(job: dict, owner: str):
+    """Write a claimed job's artifact, recording rows written as it goes."""
+    params = job["params"]
+    projects = load_export_projects(job["company_name"], params.get("project"))
+    total = None
+    if params["table"] == "tasks":
+        total = sum(project_totals(p)["task_count"] for p in projects)
+    elif params["table"] == "projects":
+        total = len(projects)
+    export_jobs_col.update_one({"id": job["id"], "owner": owner}, {"$set": {"total": total}})
+
+    progress = {"rows": 0, "reported_at": time.monotonic()}
+
+    def on_row():
+        progress["rows"] += 1
+
+    os.makedirs(EXPORT_FOLDER, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=EXPORT_FOLDER, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for chunk in stream_export(projects, params["format"], params["table"], on_row):
+                f.write(chunk.encode("utf-8") if isinstance(chunk, str) else chunk)
+                if time.monotonic() - progress["reported_at"] >= HEARTBEAT_EVERY:
+                    progress["reported_at"] = time.monotonic()
+                    export_jobs_col.update_one(
+                        {"id": job["id"], "owner": owner},
+                        {"$set": {"rows": progress["rows"], "heartbeat_at": _now()}}
+                    )
+        path = artifact_path(job)
+        os.replace(tmp, path)
+    except Exception as e:
+        print(f"[EXPORT] Job {job['id']} failed: {e}")
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        _finish(job, owner, {"status": "failed", "error": str(e), "rows": progress["rows"]})
+        return
+
+    _finish(job, owner, {"status": "done", "rows": progress["rows"], "size": os.path.getsize(path)})
+    print(f"[EXPORT] Job {job['id']} done: {progress['rows']} row(s)")
+
+
+def expire_artifacts() -> int:
+    """Delete artifacts of jobs finished more than ARTIFACT_TTL ago. Returns the number expired."""
+    expired = 0
+    for job in export_jobs_col.find(
+        {"status": "done", "finished_at": {"$lt": _now() - ARTIFACT_TTL}}, {"_id": 0, "id": 1, "params": 1}
+    ):
+        try:
+            os.remove(artifact_path(job))
+        except OSError:
+            pass  # already removed
+        export_jobs_col.update_one({"id": job["id"]}, {"$set": {"status": "expired"}})
+        expired += 1
+    return expired
+
+
+def run_worker(poll_interval: float = POLL_INTERVAL, stop: threading.Event = None):
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    stop = stop or threading.Event()
+    print(f"[EXPORT] Worker {owner} started (artifacts in {EXPORT_FOLDER})")
+    while not stop.is_set():
+        try:
+            job = claim_job(owner)
+            if job:
+                run_job(job, owner)
+                continue
+            expire_artifacts()
+        except Exception as e:
+            print(f"[EXPORT] Worker error: {e}")
+        stop.wait(poll_interval)
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "worker"
+    if command == "worker":
+        run_worker()
+    else:
+        print(f"Unknown command '{command}'. Use worker.")
+        sys.exit(1)
@@ -0,0 +1,274 @@
+# scheduling-api/exports.py
+"""
+Bulk exports of a company's data, shared by /reports/export and the export job worker
+(export_jobs.py):
+
+    csv       the tasks table as CSV text, in chunks of CSV_CHUNK_ROWS rows
+    parquet   a typed table (projects, tasks or task updates) as a Parquet file
+    arrow     the same as an Arrow IPC stream
+
+Rows are read off Mongo cursors and written in chunks (columnar: record batches of
+EXPORT_BATCH_ROWS, one Parquet row group each) that are handed on before the next
+one is read, so memory stays bounded by one chunk whatever the export size.
+pyarrow is an optional dependency, imported on first use.
+"""
+import csv
+import io
+import itertools
+from db import projects_col, updates_col
+from createandget import iter_company_tasks, iter_task_states, lookup_key
+from rollups import project_totals
+
+EXPORT_BATCH_ROWS = 50000
+# Task ids per updates_col query when exporting updates
+UPDATE_LOOKUP_IDS = 1000
+
+FORMATS = {
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "arrow": "application/vnd.apache.arrow.stream",
+}
+TABLES = ("tasks", "updates", "projects")
+
+CSV_HEADER = [
+    "Project", "Task", "Status", "Priority",
+    "Progress %", "Assigned Members", "Estimated Cost",
+    "Expected Duration (min)", "Actual Duration (min)"
+]
+CSV_CHUNK_ROWS = 500
+
+_TASK_PROJECTION = {
+    "_id": 0, "id": 1, "project_id": 1, "name": 1, "start_time": 1, "expected_duration": 1,
+    "duration": 1, "latest_status": 1, "postponed": 1, "dependencies": 1, "members": 1,
+    "priority": 1, "estimated_cost": 1, "created_at": 1
+}
+
+
+class ExportUnavailable(RuntimeError):
+    """Columnar export can't run here (pyarrow is not installed)."""
+
+
+def load_export_projects(company: str, project_name: str = None) -> list:
+    """The company's projects (or the one named), without their embedded id lists."""
+    query = {"company_key": lookup_key(company)}
+    if project_name:
+        query["name_key"] = lookup_key(project_name)
+    projects = []
+    for proj in projects_col.find(query, {"tasks": 0, "role_allocations": 0, "fund_allocations": 0}):
+        proj["id"] = proj.get("id") or str(proj.get("_id"))
+        projects.append(proj)
+    return projects
+
+
+def export_filename(params: dict) -> str:
+    if params["format"] == "csv":
+        return "zainpm_report.csv"
+    return f"zainpm_{params['table']}.{params['format']}"
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError as e:
+        print(f"[EXPORT] pyarrow unavailable: {e}")
+        raise ExportUnavailable("Parquet/Arrow export is unavailable on this server (pyarrow not installed)")
+    return pyarrow
+
+
+def _schema(pa, table: str):
+    timestamp = pa.timestamp("ms", tz="UTC")
+    strings = pa.list_(pa.string())
+    if table == "projects":
+        return pa.schema([
+            ("project_id", pa.string()), ("project", pa.string()), ("project_type", pa.string()),
+            ("state", pa.string()), ("timezone", pa.string()), ("start_date", timestamp),
+            ("team", strings), ("task_count", pa.int64()), ("complete_tasks", pa.int64()),
+            ("estimated_cost", pa.float64()), ("expected_minutes", pa.int64()),
+            ("actual_minutes", pa.int64()), ("created_at", timestamp),
+        ])
+    if table == "updates":
+        return pa.schema([
+            ("update_id", pa.string()), ("task_id", pa.string()), ("project_id", pa.string()),
+            ("status_percentage", pa.int64()), ("description", pa.string()),
+            ("expenditure", pa.float64()), ("image_filenames", strings), ("timestamp", timestamp),
+        ])
+    return pa.schema([
+        ("project_id", pa.string()), ("project", pa.string()), ("task_id", pa.string()),
+        ("task", pa.string()), ("state", pa.string()), ("priority", pa.string()),
+        ("progress", pa.int64()), ("members", strings), ("estimated_cost", pa.float64()),
+        ("expected_duration", pa.int64()), ("duration", pa.int64()), ("start_time", timestamp),
+        ("postponed", pa.bool_()), ("dependencies", strings), ("created_at", timestamp),
+    ])
+
+
+# ------------------------
+# Rows
+# ------------------------
+def _project_rows(projects: list):
+    for p in projects:
+        totals = project_totals(p)
+        yield {
+            "project_id": p["id"],
+            "project": p.get("name"),
+            "project_type": p.get("project_type"),
+            "state": p.get("state"),
+            "timezone": p.get("timezone"),
+            "start_date": p.get("start_date"),
+            "team": p.get("team", []),
+            "task_count": totals["task_count"],
+            "complete_tasks": totals["complete"],
+            "estimated_cost": totals["estimated_cost"],
+            "expected_minutes": totals["expected_minutes"],
+            "actual_minutes": totals["actual_minutes"],
+            "created_at": p.get("created_at"),
+        }
+
+
+def _task_rows(projects: list):
+    names = {p["id"]: p.get("name") for p in projects}
+    tasks = iter_company_tasks(list(names), _TASK_PROJECTION)
+    for t, state in iter_task_states(tasks):
+        yield {
+            "project_id": t.get("project_id"),
+            "project": names.get(t.get("project_id")),
+            "task_id": t.get("id"),
+            "task": t.get("name"),
+            "state": state,
+            "priority": t.get("priority"),
+            "progress": t.get("latest_status", 0),
+            "members": t.get("members", []),
+            "estimated_cost": t.get("estimated_cost", 0),
+            "expected_duration": t.get("expected_duration", 0),
+            "duration": t.get("duration", 0),
+            "start_time": t.get("start_time"),
+            "postponed": bool(t.get("postponed")),
+            "dependencies": t.get("dependencies", []),
+            "created_at": t.get("created_at"),
+        }
+
+
+def _update_rows(projects: list):
+    """updates_col has no project_id: updates are looked up for task ids in groups of UPDATE_LOOKUP_IDS."""
+    tasks = iter_company_tasks([p["id"] for p in projects], {"_id": 0, "id": 1, "project_id": 1})
+    while True:
+        project_of = {t["id"]: t.get("project_id") for t in itertools.islice(tasks, UPDATE_LOOKUP_IDS)}
+        if not project_of:
+            return
+        updates = updates_col.find({"task_id": {"$in": list(project_of)}}, {"_id": 0}).sort(
+            [("task_id", 1), ("timestamp", 1)]
+        )
+        for u in updates:
+            yield {
+                "update_id": u.get("id"),
+                "task_id": u.get("task_id"),
+                "project_id": project_of.get(u.get("task_id")),
+                "status_percentage": u.get("status_percentage", 0),
+                "description": u.get("description"),
+                "expenditure": u.get("expenditure"),
+                "image_filenames": u.get("image_filenames", []),
+                "timestamp": u.get("timestamp"),
+            }
+
+
+_ROWS = {"projects": _project_rows, "tasks": _task_rows, "updates": _update_rows}
+
+
+# ------------------------
+# Writers
+# ------------------------
+def _csv_rows(projects: list):
+    names = {p["id"]: p.get("name", "") for p in projects}
+    tasks = iter_company_tasks(list(names), _TASK_PROJECTION)
+    for t, state in iter_task_states(tasks):
+        yield [
+            names.get(t.get("project_id"), ""),
+            t.get("name", ""),
+            state,
+            t.get("priority", ""),
+            t.get("latest_status", 0),
+            ", ".join(t.get("members", [])),
+            t.get("estimated_cost", 0),
+            t.get("expected_duration", 0),
+            t.get("duration", 0),
+        ]
+
+
+def _write_csv(rows):
+    """CSV text in chunks of CSV_CHUNK_ROWS rows; the header goes out on its own first."""
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(CSV_HEADER)
+    for count, row in enumerate(rows, 1):
+        if count % CSV_CHUNK_ROWS == 1:
+            yield output.getvalue()
+            output.seek(0)
+            output.truncate()
+        writer.writerow(row)
+    yield output.getvalue()
+
+
+class _ChunkSink:
+    """Write-only file object that keeps what the writer wrote until it is drained."""
+
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self) -> bytes:
+        data = b"".join(self.chunks)
+        self.chunks = []
+        return data
+
+
+def _write(pa, schema, rows, fmt: str):
+    sink = _ChunkSink()
+    out = pa.PythonFile(sink, mode="w")
+    if fmt == "parquet":
+        writer = pa.parquet.ParquetWriter(out, schema)
+    else:
+        writer = pa.ipc.new_stream(out, schema)
+    while True:
+        batch = list(itertools.islice(rows, EXPORT_BATCH_ROWS))
+        if not batch:
+            break
+        writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+        yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def _counted(rows, on_row):
+    for row in rows:
+        on_row()
+        yield row
+
+
+def stream_export(projects: list, fmt: str, table: str = "tasks", on_row=None):
+    """
+    Chunks of an export of the given projects: CSV text (tasks only) or the bytes of a
+    Parquet file / Arrow IPC stream of table ("tasks", "updates" or "projects").
+    on_row is called for every row written (progress). Raises ExportUnavailable up
+    front when a columnar format is asked for and pyarrow is missing.
+    """
+    if fmt == "csv":
+        rows = _csv_rows(projects)
+        return _write_csv(_counted(rows, on_row) if on_row else rows)
+    pa = _pyarrow()
+    rows = _ROWS[table](projects)
+    return _write(pa, _schema(pa, table), _counted(rows, on_row) if on_row else rows, fmt)
@@ -0,0 +1,218 @@
+# scheduling-api/gantt_render.py
+"""
+Server-side Gantt export: SVG built from generate_gantt_chart data, PNG through
+cairosvg (optional dependency, needs libcairo), and an on-disk render cache.
+
+Renders are cached per (project id, project version, format). project["version"]
+is bumped by every task write (see rollups.py), and task states also change with
+the clock, so each file records when its states stop holding and is only served
+until then. Files live in RENDER_CACHE_FOLDER, shared by all worker processes.
+"""
+import glob
+import os
+import tempfile
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape, quoteattr
+import pytz
+
+RENDER_FOLDER = os.getenv("RENDER_CACHE_FOLDER", "renders")
+
+MIMETYPES = {"svg": "image/svg+xml", "png": "image/png"}
+
+# Layout, in pixels
+LABEL_WIDTH = 260
+PLOT_WIDTH = 900
+MARGIN = 20
+HEADER_HEIGHT = 64
+ROW_HEIGHT = 24
+BAR_HEIGHT = 14
+LABEL_CHARS = 38
+
+STATE_COLORS = {
+    "complete": "#2e7d32",
+    "in progress": "#1976d2",
+    "incipient": "#4fc3f7",
+    "overdue": "#d32f2f",
+    "delayed": "#f57c00",
+    "tentative": "#9e9e9e",
+    "postponed": "#6d4c41",
+}
+DEFAULT_COLOR = "#607d8b"
+
+
+class RenderUnavailable(RuntimeError):
+    """The requested format can't be rendered here (e.g. cairosvg is not installed)."""
+
+
+# ------------------------
+# SVG
+# ------------------------
+def _ticks(start: datetime, end: datetime):
+    """Axis ticks (datetime, label) for the span, at a step that keeps them readable."""
+    span = end - start
+    if span <= timedelta(days=2):
+        step, fmt = timedelta(hours=6), "%d %b %H:%M"
+        tick = start.replace(minute=0, second=0, microsecond=0, hour=start.hour - start.hour % 6)
+    elif span <= timedelta(days=45):
+        step, fmt = timedelta(days=1), "%d %b"
+        tick = start.replace(hour=0, minute=0, second=0, microsecond=0)
+    elif span <= timedelta(days=210):
+        step, fmt = timedelta(weeks=1), "%d %b"
+        tick = start.replace(hour=0, minute=0, second=0, microsecond=0) - timedelta(days=start.weekday())
+    else:
+        step, fmt = None, "%b %Y"
+        tick = start.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+    ticks = []
+    while tick <= end:
+        if tick >= start:
+            ticks.append((tick, tick.strftime(fmt)))
+        if step:
+            tick += step
+        else:
+            tick = tick.replace(year=tick.year + tick.month // 12, month=tick.month % 12 + 1)
+    # Keep at most ~20 labels on the axis
+    stride = max(1, len(ticks) // 20 + (len(ticks) % 20 > 0))
+    return ticks[::stride]
+
+
+def render_gantt_svg(project_name: str, chart: dict) -> str:
+    """SVG document for a generate_gantt_chart result."""
+    rows = chart.get("tasks", [])
+    height = HEADER_HEIGHT + max(len(rows), 1) * ROW_HEIGHT + MARGIN
+    width = LABEL_WIDTH + PLOT_WIDTH + 2 * MARGIN
+    title = f"{project_name} — {len(rows)} task(s)"
+
+    out = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'viewBox="0 0 {width} {height}" font-family="Helvetica, Arial, sans-serif" font-size="11">',
+        f'<rect width="{width}" height="{height}" fill="#ffffff"/>',
+        f'<text x="{MARGIN}" y="{MARGIN + 6}" font-size="15" font-weight="bold">{escape(title)}</text>',
+    ]
+    if not rows:
+        out.append(f'<text x="{MARGIN}" y="{HEADER_HEIGHT + 12}" fill="#666666">No tasks found</text>')
+        out.append("</svg>")
+        return "\n".join(out)
+
+    spans = [(datetime.fromisoformat(r["start"]), datetime.fromisoformat(r["end"])) for r in rows]
+    start = min(s for s, _ in spans)
+    end = max(e for _, e in spans)
+    if end <= start:
+        end = start + timedelta(hours=1)
+    total = (end - start).total_seconds()
+    plot_x = MARGIN + LABEL_WIDTH
+
+    def x_of(moment):
+        return plot_x + (moment - start).total_seconds() / total * PLOT_WIDTH
+
+    # Axis: gridlines and labels in the chart's own timezone
+    timezone = start.tzinfo or pytz.UTC
+    local_start, local_end = start.astimezone(timezone), end.astimezone(timezone)
+    for tick, label in _ticks(local_start, local_end):
+        x = x_of(tick)
+        out.append(f'<line x1="{x:.1f}" y1="{HEADER_HEIGHT - 6}" x2="{x:.1f}" y2="{height - MARGIN}" stroke="#e0e0e0"/>')
+        out.append(f'<text x="{x + 2:.1f}" y="{HEADER_HEIGHT - 10}" fill="#555555">{escape(label)}</text>')
+
+    for i, (row, (row_start, row_end)) in enumerate(zip(rows, spans)):
+        y = HEADER_HEIGHT + i * ROW_HEIGHT
+        if i % 2:
+            out.append(f'<rect x="{MARGIN}" y="{y}" width="{LABEL_WIDTH + PLOT_WIDTH}" height="{ROW_HEIGHT}" fill="#f7f7f7"/>')
+
+        name = row["task"]
+        label = name if len(name) <= LABEL_CHARS else name[:LABEL_CHARS - 1] + "…"
+        out.append(f'<text x="{MARGIN + 4}" y="{y + ROW_HEIGHT / 2 + 4:.1f}">{escape(label)}</text>')
+
+        bar_x = x_of(row_start)
+        bar_w = max(x_of(row_end) - bar_x, 2)
+        bar_y = y + (ROW_HEIGHT - BAR_HEIGHT) / 2
+        color = STATE_COLORS.get(row.get("state"), DEFAULT_COLOR)
+        tooltip = f"{name}: {row['start_formatted']} – {row['end_formatted']} ({row.get('state') or 'unknown'}, {row['progress']}%)"
+        out.append(f'<g><title>{escape(tooltip)}</title>')
+        out.append(f'<rect x="{bar_x:.1f}" y="{bar_y:.1f}" width="{bar_w:.1f}" height="{BAR_HEIGHT}" rx="2" '
+                   f'fill={quoteattr(color)} fill-opacity="0.35"/>')
+        progress = min(max(row.get("progress") or 0, 0), 100)
+        if progress:
+            out.append(f'<rect x="{bar_x:.1f}" y="{bar_y:.1f}" width="{bar_w * progress / 100:.1f}" '
+                       f'height="{BAR_HEIGHT}" rx="2" fill={quoteattr(color)}/>')
+        out.append("</g>")
+
+    out.append("</svg>")
+    return "\n".join(out)
+
+
+def svg_to_png(svg: str) -> bytes:
+    try:
+        import cairosvg
+    except (ImportError, OSError) as e:
+        # OSError: the package is installed but libcairo is missing
+        print(f"[RENDER] cairosvg unavailable: {e}")
+        raise RenderUnavailable("PNG export is unavailable on this server (cairosvg/libcairo not installed)")
+    return cairosvg.svg2png(bytestring=svg.encode("utf-8"))
+
+
+def render_gantt(project_name: str, chart: dict, fmt: str) -> bytes:
+    svg = render_gantt_svg(project_name, chart)
+    if fmt == "png":
+        return svg_to_png(svg)
+    return svg.encode("utf-8")
+
+
+# ------------------------
+# Render cache
+# ------------------------
+class RenderCache:
+    """
+    Rendered files named {project_id}-v{version}-{expiry}.{fmt}, where expiry is the
+    epoch second the rendered states stop holding ("never" if they can't change).
+    Writes are atomic (temp file + rename) so concurrent workers never read partial files.
+    """
+
+    def __init__(self, folder: str):
+        self.folder = folder
+
+    def _matches(self, project_id: str, pattern: str):
+        return glob.glob(os.path.join(glob.escape(self.folder), glob.escape(project_id) + pattern))
+
+    def get(self, project_id: str, version: int, fmt: str, at_time: datetime = None):
+        """Cached bytes for this project version and format, or None."""
+        now = (at_time or datetime.now(pytz.UTC)).timestamp()
+        for path in self._matches(project_id, f"-v{version}-*.{fmt}"):
+            expiry = os.path.basename(path)[:-len(fmt) - 1].rsplit("-", 1)[-1]
+            if expiry != "never" and (not expiry.isdigit() or now >= int(expiry)):
+                continue
+            try:
+                with open(path, "rb") as f:
+                    return f.read()
+            except OSError:
+                return None  # replaced or pruned by another worker
+        return None
+
+    def put(self, project_id: str, version: int, fmt: str, data: bytes, valid_until: datetime = None):
+        """Store a render and prune the project's older renders in this format."""
+        try:
+            os.makedirs(self.folder, exist_ok=True)
+            expiry = "never" if valid_until is None else str(int(valid_until.timestamp()))
+            path = os.path.join(self.folder, f"{project_id}-v{version}-{expiry}.{fmt}")
+            fd, tmp = tempfile.mkstemp(dir=self.folder, suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as e:
+            print(f"[RENDER] Could not cache render for project {project_id}: {e}")
+            return
+        self._remove(old for old in self._matches(project_id, f"-v*.{fmt}") if old != path)
+
+    def discard(self, project_id: str):
+        """Drop every cached render of a project (e.g. when it is deleted)."""
+        self._remove(self._matches(project_id, "-v*"))
+
+    @staticmethod
+    def _remove(paths):
+        for path in paths:
+            try:
+                os.remove(path)
+            except OSError:
+                pass  # already pruned by another worker
+
+
+render_cache = RenderCache(RENDER_FOLDER)
@@ -1,7 +1,11 @@
 # scheduling-api/helpers.py
+import base64
+import json
 import os
 import uuid
 import re
+import zlib
+from datetime import datetime, timezone
 from flask import current_app
 from werkzeug.utils import secure_filename 
 
@@ -38,6 +42,44 @@ def save_uploaded_file(file, task_id=None, update_count=None, image_count=None):
     
     return filename
 
+def encode_cursor(sort_value, last_id: str) -> str:
+    """Opaque page cursor for keyset pagination on (sort_value, id)."""
+    if isinstance(sort_value, datetime):
+        sort_value = sort_value.isoformat()
+    raw = json.dumps([sort_value, last_id]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple:
+    """Inverse of encode_cursor; raises ValueError on a malformed cursor."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, last_id = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if sort_value is not None:
+            sort_value = datetime.fromisoformat(sort_value)
+        return sort_value, last_id
+    except Exception:
+        raise ValueError("Invalid cursor")
+
+def parse_fields(fields) -> set:
+    """fields= parameter (list or comma-separated string) -> set of field names, or None for all."""
+    if not fields:
+        return None
+    if isinstance(fields, str):
+        fields = fields.split(",")
+    return {f.strip() for f in fields if f and f.strip()}
+
+def parse_time(value):
+    """ISO8601 string -> timezone-aware datetime (naive values are UTC), None when empty; raises ValueError."""
+    if not value:
+        return None
+    if not isinstance(value, str):
+        raise ValueError("Invalid time format, use ISO8601")
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError("Invalid time format, use ISO8601")
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
 def format_duration(minutes: int) -> str:
     """Convert minutes to human-readable format: Xmonths Xdays Xhours Xminutes"""
     if not isinstance(minutes, (int, float)) or minutes < 0:
@@ -154,4 +196,16 @@ def get_task_images(task_id: str):
         if update and update.get('image_filenames'):
             images.extend(update['image_filenames'])
             
-    return images
\ No newline at end of file
+    return images
+
+def gzip_stream(chunks, level: int = 6):
+    """
+    Gzip a stream of text chunks on the fly. Each chunk is sync-flushed, so the client
+    can decompress what it has received so far.
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)  # wbits 31: gzip container
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8")) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        if data:
+            yield data
+    yield compressor.flush()
@@ -0,0 +1,391 @@
+# scheduling-api/migrations.py
+"""
+Versioned schema migrations (indexes and data backfills).
+
+Every migration runs once and is recorded in the schema_migrations collection.
+The app applies pending migrations on startup; they can also be run by hand
+from the scheduling-api directory:
+
+    python migrations.py            # apply pending migrations
+    python migrations.py status     # list applied / pending migrations
+    python migrations.py audit      # report unused and missing indexes
+"""
+import sys
+import time
+from datetime import datetime, timedelta
+import pytz
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from db import db, projects_col, tasks_col, migrations_col
+from createandget import lookup_key
+from rollups import rebuild_rollups
+
+BATCH_SIZE = 1000
+LOCK_ID = "lock"
+LOCK_TIMEOUT = timedelta(minutes=10)
+
+
+def _now():
+    return datetime.now(pytz.UTC)
+
+
+# ------------------------
+# Data backfills
+# ------------------------
+class MigrationError(RuntimeError):
+    """A migration could not complete; it is not recorded, so it runs again once the cause is fixed."""
+
+
+def _backfill(collection, fields: dict):
+    """
+    Set normalized keys on every document of a collection.
+    fields maps the key field to the source field, e.g. {"name_key": "name"}.
+    Raises MigrationError listing the documents whose keys collide on a unique index
+    (names that only differ by case); they must be renamed before the migration can finish.
+    """
+    projection = {"_id": 1, **{src: 1 for src in fields.values()}}
+    missing = {"$or": [{key: {"$exists": False}} for key in fields]}
+
+    updated = 0
+    collisions = []
+    ids, ops = [], []
+    for doc in collection.find(missing, projection, batch_size=BATCH_SIZE):
+        keys = {key: lookup_key(doc.get(src)) for key, src in fields.items()}
+        ids.append((doc["_id"], {src: doc.get(src) for src in fields.values()}))
+        ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": keys}))
+        if len(ops) >= BATCH_SIZE:
+            updated += _flush(collection, ids, ops, collisions)
+            ids, ops = [], []
+    if ops:
+        updated += _flush(collection, ids, ops, collisions)
+
+    if collisions:
+        report = "\n".join(f"  _id {doc_id} {values}: {message}" for (doc_id, values), message in collisions)
+        raise MigrationError(
+            f"{len(collisions)} {collection.name} document(s) collide with another one whose name "
+            f"only differs by case; rename them and run the migrations again:\n{report}"
+        )
+    return updated
+
+
+def _flush(collection, ids: list, ops: list, collisions: list):
+    """Write a batch (ops[i] updates the document ids[i] describes); duplicate-key failures go to collisions."""
+    try:
+        return collection.bulk_write(ops, ordered=False).modified_count
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            if err.get("code") != 11000:
+                raise
+            collisions.append((ids[err["index"]], err.get("errmsg")))
+        return e.details.get("nModified", 0)
+
+
+def backfill_lookup_keys():
+    """Backfill company_key/name_key/priority_key on projects and tasks created before they existed."""
+    projects = _backfill(projects_col, {"company_key": "company_name", "name_key": "name"})
+    tasks = _backfill(tasks_col, {"name_key": "name", "priority_key": "priority"})
+    print(f"[MIGRATE] Lookup keys set on {projects} projects and {tasks} tasks.")
+
+
+def backfill_rollups():
+    """Compute the rollup counters of every project from its tasks."""
+    count = rebuild_rollups()
+    print(f"[MIGRATE] Rollups rebuilt for {count} projects.")
+
+
+# ------------------------
+# Migration registry
+# ------------------------
+# Each migration has a unique, increasing version. "indexes" lists
+# (collection, keys, options) tuples to create, "drop_indexes" (collection, keys)
+# pairs of indexes made redundant by later ones; "run" is an optional callable
+# for data changes. Never edit a migration once it has shipped — add a new one.
+MIGRATIONS = [
+    {
+        "version": 1,
+        "name": "initial indexes",
+        "indexes": [
+            ("users", [("username", 1)], {"unique": True}),
+            ("users", [("company_name", 1)], {}),
+            ("projects", [("company_name", 1), ("name", 1)], {"unique": True}),
+            ("projects", [("company_name", 1)], {}),
+            ("projects", [("start_date", 1)], {}),
+            ("tasks", [("project_id", 1), ("name", 1)], {"unique": True}),
+            ("tasks", [("project_id", 1)], {}),
+            ("tasks", [("start_time", 1)], {}),
+            ("tasks", [("members", 1)], {}),
+            ("updates", [("task_id", 1)], {}),
+            ("updates", [("timestamp", 1)], {}),
+            ("project_updates", [("project_id", 1)], {}),
+            ("project_updates", [("timestamp", 1)], {}),
+            ("teams", [("company_name", 1), ("name", 1)], {"unique": True}),
+            ("subscriptions", [("company_name", 1)], {"unique": True}),
+            ("subscriptions", [("stripe_customer_id", 1)], {}),
+            ("stripe_events", [("stripe_event_id", 1)], {"unique": True}),
+        ],
+    },
+    {
+        "version": 2,
+        "name": "case-insensitive lookup keys",
+        "indexes": [
+            # Partial so documents that have not been backfilled yet don't collide on a missing key
+            ("projects", [("company_key", 1), ("name_key", 1)], {
+                "unique": True,
+                "partialFilterExpression": {"company_key": {"$exists": True}, "name_key": {"$exists": True}},
+            }),
+            ("projects", [("name_key", 1)], {}),
+            ("tasks", [("project_id", 1), ("name_key", 1)], {
+                "unique": True,
+                "partialFilterExpression": {"name_key": {"$exists": True}},
+            }),
+            ("tasks", [("project_id", 1), ("priority_key", 1)], {}),
+        ],
+        "run": backfill_lookup_keys,
+    },
+    {
+        "version": 3,
+        "name": "unique id indexes and hot-query compound indexes",
+        "indexes": [
+            ("projects", [("id", 1)], {"unique": True}),
+            ("tasks", [("id", 1)], {"unique": True}),
+            ("updates", [("id", 1)], {"unique": True}),
+            ("project_updates", [("id", 1)], {"unique": True}),
+            # get_project_tasks: filter on project_id, sort on start_time
+            ("tasks", [("project_id", 1), ("start_time", 1)], {}),
+            # latest update per task / latest_updates feed
+            ("updates", [("task_id", 1), ("timestamp", -1)], {}),
+            ("project_updates", [("project_id", 1), ("timestamp", -1)], {}),
+            # create_team upserts on (company_name, project_id)
+            ("teams", [("company_name", 1), ("project_id", 1)], {}),
+        ],
+    },
+    {
+        "version": 4,
+        "name": "project rollup counters",
+        "run": backfill_rollups,
+    },
+    {
+        "version": 5,
+        "name": "keyset pagination indexes",
+        "indexes": [
+            # /projects/view pages on (start_date, id) within a company
+            ("projects", [("company_key", 1), ("start_date", 1), ("id", 1)], {}),
+            # /projects/tasks pages on (start_time, id) within a project
+            ("tasks", [("project_id", 1), ("start_time", 1), ("id", 1)], {}),
+        ],
+    },
+    {
+        "version": 6,
+        "name": "task progress snapshots",
+        "indexes": [
+            # snapshots.project_tasks_at: nearest snapshot at or before a time
+            ("task_snapshots", [("project_id", 1), ("taken_at", -1)], {}),
+            ("task_snapshots", [("id", 1)], {"unique": True}),
+        ],
+    },
+    {
+        "version": 7,
+        "name": "materialized report snapshots",
+        "indexes": [
+            # One document per company/project and day; history reads scan a key's days
+            ("report_snapshots", [("kind", 1), ("key", 1), ("day", 1)], {"unique": True}),
+            # The worker loads the day's snapshots in one query
+            ("report_snapshots", [("day", 1)], {}),
+        ],
+    },
+    {
+        "version": 8,
+        "name": "export jobs",
+        "indexes": [
+            ("export_jobs", [("id", 1)], {"unique": True}),
+            # Set only while a job is queued/running: identical in-flight requests share a job
+            ("export_jobs", [("active_key", 1)], {"unique": True, "sparse": True}),
+            # Workers claim the oldest queued job; finished jobs' artifacts expire
+            ("export_jobs", [("status", 1), ("created_at", 1)], {}),
+            ("export_jobs", [("status", 1), ("finished_at", 1)], {}),
+        ],
+    },
+    {
+        "version": 9,
+        "name": "member workload index",
+        "indexes": [
+            # /reports/workload?member=: members (multikey) first, then the company's projects and window
+            ("tasks", [("members", 1), ("project_id", 1), ("start_time", 1)], {}),
+        ],
+    },
+    {
+        "version": 10,
+        "name": "drop redundant task index",
+        # (project_id, start_time) is a prefix of (project_id, start_time, id) from version 5
+        "drop_indexes": [
+            ("tasks", [("project_id", 1), ("start_time", 1)]),
+        ],
+    },
+]
+
+
+def _create_indexes(indexes: list):
+    for collection, keys, options in indexes:
+        db[collection].create_index(keys, **options)
+
+
+def _drop_indexes(indexes: list):
+    for collection, keys in indexes:
+        names = [info["name"] for info in db[collection].list_indexes()
+                 if _key_pattern(info["key"].items()) == _key_pattern(keys)]
+        for name in names:
+            db[collection].drop_index(name)
+
+
+# ------------------------
+# Runner
+# ------------------------
+def _acquire_lock() -> bool:
+    """Take the migration lock so concurrent workers don't migrate at the same time."""
+    now = _now()
+    try:
+        migrations_col.insert_one({"_id": LOCK_ID, "locked_at": now})
+        return True
+    except DuplicateKeyError:
+        # Steal the lock if its holder died mid-run
+        stale = migrations_col.find_one_and_update(
+            {"_id": LOCK_ID, "locked_at": {"$lt": now - LOCK_TIMEOUT}},
+            {"$set": {"locked_at": now}}
+        )
+        return stale is not None
+
+
+def _release_lock():
+    migrations_col.delete_one({"_id": LOCK_ID})
+
+
+def applied_versions() -> set:
+    return {doc["_id"] for doc in migrations_col.find({"_id": {"$ne": LOCK_ID}}, {"_id": 1})}
+
+
+def pending_migrations() -> list:
+    done = applied_versions()
+    return [m for m in sorted(MIGRATIONS, key=lambda m: m["version"]) if m["version"] not in done]
+
+
+def run_migrations():
+    """
+    Apply pending migrations in version order. Returns the list of versions applied;
+    a failing migration is re-raised (after releasing the lock) and is not recorded.
+    """
+    pending = pending_migrations()
+    if not pending:
+        return []
+
+    if not _acquire_lock():
+        print("[MIGRATE] Another process is applying migrations; skipping.")
+        return []
+
+    applied = []
+    try:
+        for migration in pending_migrations():
+            version, name = migration["version"], migration["name"]
+            print(f"[MIGRATE] Applying {version:04d} {name}...")
+            started = time.monotonic()
+            _create_indexes(migration.get("indexes", []))
+            _drop_indexes(migration.get("drop_indexes", []))
+            if migration.get("run"):
+                migration["run"]()
+            migrations_col.insert_one({
+                "_id": version,
+                "name": name,
+                "applied_at": _now(),
+                "duration_ms": int((time.monotonic() - started) * 1000)
+            })
+            applied.append(version)
+        print(f"[MIGRATE] Applied {len(applied)} migration(s).")
+    except Exception as e:
+        # Don't let the app start on a half-migrated schema
+        print(f"[MIGRATE] Migration failed: {e}")
+        raise
+    finally:
+        _release_lock()
+    return applied
+
+
+def migration_status() -> list:
+    records = {doc["_id"]: doc for doc in migrations_col.find({"_id": {"$ne": LOCK_ID}})}
+    return [{
+        "version": m["version"],
+        "name": m["name"],
+        "applied_at": records[m["version"]]["applied_at"] if m["version"] in records else None
+    } for m in sorted(MIGRATIONS, key=lambda m: m["version"])]
+
+
+# ------------------------
+# Index audit
+# ------------------------
+def _key_pattern(keys) -> tuple:
+    return tuple((k, int(d) if isinstance(d, (int, float)) else d) for k, d in keys)
+
+
+def expected_indexes() -> dict:
+    """collection name -> list of key patterns declared by the migrations."""
+    expected = {}
+    for migration in sorted(MIGRATIONS, key=lambda m: m["version"]):
+        for collection, keys, _ in migration.get("indexes", []):
+            expected.setdefault(collection, []).append(_key_pattern(keys))
+        for collection, keys in migration.get("drop_indexes", []):
+            expected[collection].remove(_key_pattern(keys))
+    return expected
+
+
+def audit_indexes() -> dict:
+    """
+    Compare the indexes declared by the migrations with the ones that exist.
+    Returns {collection: {"missing": [...], "unused": [...], "undeclared": [...]}};
+    "unused" are indexes with no recorded accesses since the server last restarted.
+    """
+    report = {}
+    for collection, patterns in expected_indexes().items():
+        col = db[collection]
+        existing = {}
+        for info in col.list_indexes():
+            existing[_key_pattern(info["key"].items())] = info["name"]
+
+        usage = {}
+        try:
+            for stat in col.aggregate([{"$indexStats": {}}]):
+                usage[stat["name"]] = stat.get("accesses", {}).get("ops", 0)
+        except Exception as e:
+            print(f"[MIGRATE] $indexStats unavailable for {collection}: {e}")
+
+        report[collection] = {
+            "missing": [list(p) for p in patterns if p not in existing],
+            "unused": [name for name, ops in usage.items() if ops == 0 and name != "_id_"],
+            "undeclared": [name for key, name in existing.items() if key not in patterns and name != "_id_"],
+        }
+    return report
+
+
+def _print_audit(report: dict):
+    for collection, findings in sorted(report.items()):
+        print(f"[AUDIT] {collection}")
+        for pattern in findings["missing"]:
+            print(f"[AUDIT]   missing:    {pattern}")
+        for name in findings["unused"]:
+            print(f"[AUDIT]   unused:     {name}")
+        for name in findings["undeclared"]:
+            print(f"[AUDIT]   undeclared: {name}")
+        if not any(findings.values()):
+            print("[AUDIT]   ok")
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "migrate"
+    if command == "migrate":
+        run_migrations()
+    elif command == "status":
+        for entry in migration_status():
+            applied = entry["applied_at"].isoformat() if entry["applied_at"] else "pending"
+            print(f"{entry['version']:04d} {entry['name']}: {applied}")
+    elif command == "audit":
+        _print_audit(audit_indexes())
+    else:
+        print(f"Unknown command '{command}'. Use migrate, status or audit.")
+        sys.exit(1)
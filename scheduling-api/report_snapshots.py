@@ -0,0 +1,319 @@
+# scheduling-api/report_snapshots.py
+"""
+Materialized reports: the /reports/summary and /reports/project payloads, stored in
+report_snapshots with one document per company / project and UTC day:
+
+    {"kind": "company" | "project", "key": company_key | project_id, "day": "YYYY-MM-DD",
+     "company_key", "report": {...}, "version", "valid_until", "refreshed_at"}
+
+The day's document is overwritten on every refresh, so earlier days stay behind as a
+daily history for trend charts.
+
+A background worker (one per deployment, elected through a lease in locks_col)
+refreshes a project's snapshot when its version changes or its task states expire,
+and a company's when any of its projects' versions changes (or its states expire). A new day has no
+snapshots yet, so the first pass after midnight is a full rebuild. Every
+SNAPSHOT_CHECK_EVERY the worker also takes the due point-in-time progress snapshots
+(snapshots.take_due_snapshots). It can also be run by hand from the scheduling-api directory:
+
+    python report_snapshots.py refresh    # refresh what changed
+    python report_snapshots.py rebuild    # rebuild every snapshot for today
+    python report_snapshots.py worker     # run the worker loop in the foreground
+"""
+import itertools
+import os
+import sys
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from pymongo.errors import DuplicateKeyError
+from db import locks_col, projects_col, report_snapshots_col
+from etags import etag_digest
+from createandget import _now, get_company_summary, get_project_tasks, lookup_key
+from rollups import project_totals
+from snapshots import take_due_snapshots
+from task_states import _as_utc, get_project_task_windows, project_versions, states_valid_until
+
+WORKER_INTERVAL = 60  # seconds between refresh passes
+WORKER_LOCK_ID = "report_worker"
+WORKER_LEASE = timedelta(minutes=3)
+SNAPSHOT_CHECK_EVERY = 15 * 60  # seconds between take_due_snapshots passes of the worker
+# Snapshots older than this are not served (e.g. the worker is down); reports are computed instead
+STALE_AFTER = timedelta(minutes=5)
+
+_PROJECT_FIELDS = {"_id": 0, "id": 1, "name": 1, "company_name": 1, "company_key": 1, "version": 1, "rollup": 1,
+                   "total_estimated_cost": 1}
+
+
+def _day(at_time: datetime) -> str:
+    return at_time.strftime("%Y-%m-%d")
+
+
+# ------------------------
+# Report builders
+# ------------------------
+def build_company_summary(company: str):
+    """Company-wide stats for /reports/summary. Returns (report, valid_until)."""
+    # Totals and member count, plus a cursor over every task's state fields
+    data = get_company_summary(company)
+    total_tasks = data["total_tasks"]
+
+    # Time-dependent states: dependencies stay within a project, so one project's tasks at a time
+    completed_tasks = 0
+    overdue_tasks = 0
+    in_progress_tasks = 0
+    active_projects = 0
+    completed_projects = 0
+    valid_until = []
+    for _, tasks in itertools.groupby(data["tasks"], key=lambda t: t.get("project_id")):
+        tasks = list(tasks)
+        windows = get_project_task_windows(tasks, versions=data["versions"])
+        valid_until.append(states_valid_until(windows))
+        states = [windows[t["id"]][0] for t in tasks]
+        completed_tasks += states.count("complete")
+        overdue_tasks += states.count("overdue")
+        in_progress_tasks += sum(1 for s in states if s in ("in progress", "incipient"))
+        active_projects += any(s in ("in progress", "incipient") for s in states)
+        completed_projects += all(s == "complete" for s in states)
+    completion_rate = round((completed_tasks / total_tasks * 100) if total_tasks else 0, 1)
+
+    return {
+        "total_projects": data["total_projects"],
+        "active_projects": active_projects,
+        "completed_projects": completed_projects,
+        "total_tasks": total_tasks,
+        "completed_tasks": completed_tasks,
+        "overdue_tasks": overdue_tasks,
+        "in_progress_tasks": in_progress_tasks,
+        "completion_rate": completion_rate,
+        "team_members": data["team_members"],
+    }, min((until for until in valid_until if until is not None), default=None)
+
+
+def build_project_report(proj: dict):
+    """Stats for /reports/project/<name>. Returns (report, valid_until)."""
+    proj_id = proj.get("id") or str(proj.get("_id"))
+    tasks = get_project_tasks(proj_id) or []
+
+    task_breakdown = {"complete": 0, "in_progress": 0, "overdue": 0, "tentative": 0, "other": 0}
+    member_contribution = {}
+
+    windows = get_project_task_windows(tasks, versions=project_versions([proj]))
+    states = {tid: window[0] for tid, window in windows.items()}
+    for t in tasks:
+        if not t:
+            continue
+        state = states.get(t.get("id"))
+        if state == "complete":
+            task_breakdown["complete"] += 1
+        elif state in ("in progress", "incipient"):
+            task_breakdown["in_progress"] += 1
+        elif state == "overdue":
+            task_breakdown["overdue"] += 1
+        elif state == "tentative":
+            task_breakdown["tentative"] += 1
+        else:
+            task_breakdown["other"] += 1
+
+        for m in t.get("members", []):
+            if m not in member_contribution:
+                member_contribution[m] = {"assigned": 0, "completed": 0}
+            member_contribution[m]["assigned"] += 1
+            if state == "complete":
+                member_contribution[m]["completed"] += 1
+
+    total_tasks = len(tasks)
+    completed_tasks = task_breakdown["complete"]
+    completion_rate = round((completed_tasks / total_tasks * 100) if total_tasks else 0, 1)
+
+    return {
+        "project": proj.get("name"),
+        "total_tasks": total_tasks,
+        "task_breakdown": task_breakdown,
+        "completion_rate": completion_rate,
+        "total_estimated_cost": project_totals(proj)["estimated_cost"],
+        "member_contribution": member_contribution,
+    }, states_valid_until(windows)
+
+
+# ------------------------
+# Snapshot storage
+# ------------------------
+def save_snapshot(kind: str, key: str, company_key: str, report: dict, valid_until=None, version=None):
+    now = _now()
+    report_snapshots_col.update_one(
+        {"kind": kind, "key": key, "day": _day(now)},
+        {"$set": {
+            "company_key": company_key,
+            "report": report,
+            "version": version,
+            "valid_until": valid_until,
+            "refreshed_at": now,
+        }},
+        upsert=True
+    )
+
+
+def latest_snapshot(kind: str, key: str, version=None):
+    """
+    Today's snapshot of a company/project, or None when missing, stale, past its
+    valid_until or (when version is given) built from another version.
+    """
+    now = _now()
+    doc = report_snapshots_col.find_one({"kind": kind, "key": key, "day": _day(now)}, {"_id": 0})
+    if not doc or _as_utc(doc["refreshed_at"]) < now - STALE_AFTER:
+        return None
+    if version is not None and doc.get("version") != version:
+        return None
+    if doc.get("valid_until"):
+        doc["valid_until"] = _as_utc(doc["valid_until"])
+        if doc["valid_until"] <= now:
+            return None
+    return doc
+
+
+def snapshot_history(kind: str, key: str, days: int = 30) -> list:
+    """Daily snapshots of the last days, oldest first: [{"day", "report"}, ...]."""
+    since = _day(_now() - timedelta(days=days - 1))
+    return list(report_snapshots_col.find(
+        {"kind": kind, "key": key, "day": {"$gte": since}}, {"_id": 0, "day": 1, "report": 1}
+    ).sort("day", 1))
+
+
+def refresh_project(proj: dict):
+    """Build and store a project's report. Returns (report, valid_until)."""
+    report, valid_until = build_project_report(proj)
+    save_snapshot("project", proj["id"], proj.get("company_key") or lookup_key(proj.get("company_name")),
+                  report, valid_until, proj.get("version", 0))
+    return report, valid_until
+
+
+def _company_version(projects: list) -> str:
+    """Version stamp of a company summary: a digest of its projects' (id, version) pairs."""
+    return etag_digest("company", projects)
+
+
+def company_version(company: str) -> str:
+    """The current version stamp of a company's summary (one light projects query)."""
+    projects = projects_col.find({"company_key": lookup_key(company)}, {"_id": 0, "id": 1, "version": 1})
+    return _company_version(list(projects))
+
+
+def refresh_company(company: str, version: str = None):
+    """Build and store a company's summary. Returns (report, valid_until)."""
+    if version is None:
+        version = company_version(company)
+    report, valid_until = build_company_summary(company)
+    save_snapshot("company", lookup_key(company), lookup_key(company), report, valid_until, version)
+    return report, valid_until
+
+
+def refresh_changed(full: bool = False) -> int:
+    """
+    Refresh the snapshots of projects whose version changed or whose states expired,
+    then those of companies whose project versions changed (full=True refreshes everything).
+    Unchanged snapshots get their refreshed_at touched so readers keep serving them.
+    Returns the number of snapshots written.
+    """
+    now = _now()
+    current = {}
+    if not full:
+        for doc in report_snapshots_col.find({"day": _day(now)}, {"_id": 0, "kind": 1, "key": 1, "version": 1, "valid_until": 1}):
+            current[(doc["kind"], doc["key"])] = doc
+
+    def is_stale(kind, key, version):
+        doc = current.get((kind, key))
+        if doc is None or doc.get("version") != version:
+            return True
+        return doc.get("valid_until") is not None and _as_utc(doc["valid_until"]) <= now
+
+    written = 0
+    unchanged = {"project": [], "company": []}
+    companies = {}
+    for proj in projects_col.find({}, _PROJECT_FIELDS):
+        company_key = proj.get("company_key") or lookup_key(proj.get("company_name"))
+        companies.setdefault(company_key, (proj.get("company_name"), []))[1].append(proj)
+        if is_stale("project", proj["id"], proj.get("version", 0)):
+            refresh_project(proj)
+            written += 1
+        else:
+            unchanged["project"].append(proj["id"])
+
+    for company_key, (company, projects) in companies.items():
+        version = _company_version(projects)
+        if not company:
+            continue
+        if is_stale("company", company_key, version):
+            refresh_company(company, version)
+            written += 1
+        else:
+            unchanged["company"].append(company_key)
+
+    for kind, keys in unchanged.items():
+        if keys:
+            report_snapshots_col.update_many(
+                {"kind": kind, "key": {"$in": keys}, "day": _day(now)}, {"$set": {"refreshed_at": now}}
+            )
+    return written
+
+
+# ------------------------
+# Background worker
+# ------------------------
+def _hold_lease(owner: str) -> bool:
+    """Take or renew the worker lease; only one process in the deployment refreshes snapshots."""
+    now = _now()
+    try:
+        locks_col.find_one_and_update(
+            {"_id": WORKER_LOCK_ID, "$or": [{"owner": owner}, {"expires_at": {"$lt": now}}]},
+            {"$set": {"owner": owner, "expires_at": now + WORKER_LEASE}},
+            upsert=True
+        )
+        return True
+    except DuplicateKeyError:
+        return False  # held by another live process
+
+
+def run_worker(interval: int = WORKER_INTERVAL, stop: threading.Event = None):
+    owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+    stop = stop or threading.Event()
+    next_progress_check = 0.0
+    while not stop.is_set():
+        try:
+            if _hold_lease(owner):
+                started = time.monotonic()
+                written = refresh_changed()
+                if written:
+                    print(f"[REPORTS] Refreshed {written} snapshot(s) in {time.monotonic() - started:.1f}s")
+                # Point-in-time progress snapshots (snapshots.py) on their own, slower cadence
+                if started >= next_progress_check:
+                    next_progress_check = started + SNAPSHOT_CHECK_EVERY
+                    taken = take_due_snapshots()
+                    if taken:
+                        print(f"[SNAPSHOT] Took {taken} snapshot(s).")
+        except Exception as e:
+            print(f"[REPORTS] Snapshot refresh failed: {e}")
+        stop.wait(interval)
+
+
+def start_worker():
+    """Run the worker in a daemon thread of this process (set REPORT_WORKER=0 to disable)."""
+    if os.getenv("REPORT_WORKER", "1") == "0":
+        return None
+    thread = threading.Thread(target=run_worker, name="report-snapshots", daemon=True)
+    thread.start()
+    return thread
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "refresh"
+    if command == "refresh":
+        print(f"[REPORTS] Refreshed {refresh_changed()} snapshot(s).")
+    elif command == "rebuild":
+        print(f"[REPORTS] Rebuilt {refresh_changed(full=True)} snapshot(s).")
+    elif command == "worker":
+        run_worker()
+    else:
+        print(f"Unknown command '{command}'. Use refresh, rebuild or worker.")
+        sys.exit(1)
@@ -0,0 +1,155 @@
+# scheduling-api/rollups.py
+"""
+Per-project rollup counters, kept up to date with $inc on every task write.
+
+project["rollup"] holds:
+    task_count                 number of tasks
+    not_started / in_progress / complete
+                               tasks per progress bucket (latest_status 0, 1-99, 100)
+    estimated_cost             summed estimated_cost
+    completed_estimated_cost   estimated_cost of complete tasks
+    expected_minutes           summed expected_duration
+    actual_minutes             summed duration (actual minutes of finished tasks)
+
+The legacy project fields total_estimated_cost and expected_duration are moved
+by the same $inc so existing readers keep working.
+
+project["version"] is bumped by every task write that goes through apply_rollup_delta
+(and by bump_project_version for the rest); render caches and ETags key on it.
+"""
+from pymongo import ReturnDocument, UpdateOne
+from db import projects_col, tasks_col
+
+ROLLUP_FIELDS = (
+    "task_count", "not_started", "in_progress", "complete",
+    "estimated_cost", "completed_estimated_cost", "expected_minutes", "actual_minutes",
+)
+
+# rollup counter -> legacy top-level project field mirroring it
+LEGACY_FIELDS = {
+    "estimated_cost": "total_estimated_cost",
+    "expected_minutes": "expected_duration",
+}
+
+
+def empty_rollup() -> dict:
+    return {field: 0 for field in ROLLUP_FIELDS}
+
+
+def progress_bucket(latest_status) -> str:
+    status = latest_status or 0
+    if status >= 100:
+        return "complete"
+    if status <= 0:
+        return "not_started"
+    return "in_progress"
+
+
+def task_rollup(task: dict) -> dict:
+    """A single task's contribution to its project's rollup."""
+    if not task:
+        return {}
+    bucket = progress_bucket(task.get("latest_status", 0))
+    cost = task.get("estimated_cost", 0) or 0
+    return {
+        "task_count": 1,
+        bucket: 1,
+        "estimated_cost": cost,
+        "completed_estimated_cost": cost if bucket == "complete" else 0,
+        "expected_minutes": task.get("expected_duration", 0) or 0,
+        "actual_minutes": task.get("duration", 0) or 0,
+    }
+
+
+def sum_rollups(tasks, sign: int = 1) -> dict:
+    total = {}
+    for task in tasks:
+        for field, value in task_rollup(task).items():
+            total[field] = total.get(field, 0) + sign * value
+    return total
+
+
+def rollup_delta(before=None, after=None) -> dict:
+    """
+    Counter changes for tasks going from `before` to `after`. Each side is a task,
+    a list of tasks, or None (task created / deleted).
+    """
+    befores = before if isinstance(before, list) else [before] if before else []
+    afters = after if isinstance(after, list) else [after] if after else []
+    delta = sum_rollups(afters)
+    for field, value in sum_rollups(befores).items():
+        delta[field] = delta.get(field, 0) - value
+    return {field: value for field, value in delta.items() if value}
+
+
+def rollup_inc(delta: dict) -> dict:
+    """Turn a counter delta into the $inc document for a project update."""
+    inc = {}
+    for field, value in delta.items():
+        if not value:
+            continue
+        inc[f"rollup.{field}"] = value
+        if field in LEGACY_FIELDS:
+            inc[LEGACY_FIELDS[field]] = value
+    return inc
+
+
+def apply_rollup_delta(project_id: str, delta: dict, session=None, **update):
+    """
+    $inc a project's counters by delta, merged with any extra update operators
+    (e.g. $push/$set), and bump its version. Returns the updated project.
+    """
+    update["$inc"] = {**update.get("$inc", {}), **rollup_inc(delta), "version": 1}
+    return projects_col.find_one_and_update(
+        {"id": project_id}, update, return_document=ReturnDocument.AFTER, session=session
+    )
+
+
+def bump_project_version(project_ids, session=None):
+    """Bump the version of one or more projects whose tasks changed outside apply_rollup_delta."""
+    if isinstance(project_ids, str):
+        project_ids = [project_ids]
+    project_ids = [pid for pid in project_ids if pid]
+    if project_ids:
+        projects_col.update_many({"id": {"$in": project_ids}}, {"$inc": {"version": 1}}, session=session)
+
+
+def project_totals(project: dict) -> dict:
+    """The project's rollup with every counter present (missing ones read as 0)."""
+    return {**empty_rollup(), **(project.get("rollup") or {})}
+
+
+def rebuild_rollups(project_ids: list = None):
+    """Recompute rollups from tasks_col (backfill / repair). Returns the number of projects updated."""
+    match = {"project_id": {"$in": project_ids}} if project_ids is not None else {}
+    status = {"$ifNull": ["$latest_status", 0]}
+    cost = {"$ifNull": ["$estimated_cost", 0]}
+    pipeline = [
+        {"$match": match},
+        {"$group": {
+            "_id": "$project_id",
+            "task_count": {"$sum": 1},
+            "not_started": {"$sum": {"$cond": [{"$lte": [status, 0]}, 1, 0]}},
+            "complete": {"$sum": {"$cond": [{"$gte": [status, 100]}, 1, 0]}},
+            "estimated_cost": {"$sum": cost},
+            "completed_estimated_cost": {"$sum": {"$cond": [{"$gte": [status, 100]}, cost, 0]}},
+            "expected_minutes": {"$sum": {"$ifNull": ["$expected_duration", 0]}},
+            "actual_minutes": {"$sum": {"$ifNull": ["$duration", 0]}},
+        }},
+    ]
+    rollups = {}
+    for row in tasks_col.aggregate(pipeline, allowDiskUse=True):
+        row["in_progress"] = row["task_count"] - row["not_started"] - row["complete"]
+        rollups[row.pop("_id")] = {field: row.get(field, 0) for field in ROLLUP_FIELDS}
+
+    query = {"id": {"$in": project_ids}} if project_ids is not None else {}
+    ops = []
+    for project in projects_col.find(query, {"id": 1}):
+        rollup = rollups.get(project.get("id"), empty_rollup())
+        ops.append(UpdateOne({"_id": project["_id"]}, {"$set": {
+            "rollup": rollup,
+            **{legacy: rollup[field] for field, legacy in LEGACY_FIELDS.items()},
+        }}))
+    if ops:
+        projects_col.bulk_write(ops, ordered=False)
+    return len(ops)
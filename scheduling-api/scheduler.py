@@ -0,0 +1,204 @@
+# scheduling-api/scheduler.py
+"""
+Schedule analysis over a project's task dependency graph.
+
+Pure functions over already-loaded task documents (no database access), so they can be
+reused by endpoints, reports and background jobs alike.
+"""
+from datetime import datetime, timedelta
+import pytz
+from task_states import _as_utc, topological_order
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+# Task fields critical_path needs (projection for get_project_tasks)
+CRITICAL_PATH_FIELDS = {
+    "_id": 0, "id": 1, "name": 1, "start_time": 1, "expected_duration": 1,
+    "duration": 1, "latest_status": 1, "dependencies": 1
+}
+
+
+class CycleError(ValueError):
+    """The dependency graph contains a cycle; task_ids lists the tasks caught in it."""
+
+    def __init__(self, task_ids: list, names: list = None):
+        self.task_ids = task_ids
+        super().__init__(f"Dependency cycle between tasks: {', '.join(names or task_ids)}")
+
+
+def task_duration(task: dict) -> int:
+    """Minutes a task takes: its actual duration once complete, else the expected one."""
+    if task.get("latest_status", 0) == 100 and (task.get("duration") or 0) > 0:
+        return task["duration"]
+    return task.get("expected_duration", 0) or 0
+
+
+def _minutes(value: datetime) -> float:
+    return (_as_utc(value) - _EPOCH).total_seconds() / 60
+
+
+def _datetime(minutes: float) -> datetime:
+    return _EPOCH + timedelta(minutes=minutes)
+
+
+def critical_path(tasks: list, project_start: datetime = None) -> dict:
+    """
+    Forward/backward pass (CPM) over the tasks' dependency DAG in O(tasks + dependencies).
+
+    A task starts no earlier than its own start_time (or project_start when it has none)
+    and no earlier than all of its dependencies have finished. Dependencies outside the
+    list are ignored. Raises CycleError if the dependencies contain a cycle.
+
+    Returns {"start", "finish", "duration_minutes", "tasks": {task_id: {...}}, "critical_path": [task_id, ...]}
+    where each task entry carries earliest/latest start and finish, slack_minutes and critical.
+    """
+    ordered, cyclic_ids = topological_order(tasks)
+    if cyclic_ids:
+        by_id = {t["id"]: t for t in tasks}
+        raise CycleError(cyclic_ids, [by_id[tid].get("name", tid) for tid in cyclic_ids])
+    if not ordered:
+        return {"start": project_start, "finish": project_start, "duration_minutes": 0, "tasks": {}, "critical_path": []}
+
+    default_start = _minutes(project_start) if project_start else None
+    deps_of = {}
+    successors = {t["id"]: [] for t in ordered}
+    duration = {}
+    earliest_start, earliest_finish = {}, {}
+    driver = {}
+
+    # Forward pass: earliest start/finish in topological order
+    for task in ordered:
+        tid = task["id"]
+        deps = [d for d in dict.fromkeys(task.get("dependencies", []) or []) if d in successors]
+        deps_of[tid] = deps
+        for dep in deps:
+            successors[dep].append(tid)
+        duration[tid] = task_duration(task)
+
+        start = _minutes(task["start_time"]) if task.get("start_time") else default_start
+        driver[tid] = None
+        for dep in deps:
+            if start is None or earliest_finish[dep] >= start:
+                start, driver[tid] = earliest_finish[dep], dep
+        if start is None:
+            start = _minutes(datetime.now(pytz.UTC))
+        earliest_start[tid] = start
+        earliest_finish[tid] = start + duration[tid]
+
+    project_begin = min(earliest_start.values())
+    finish = max(earliest_finish.values())
+
+    # Backward pass: latest finish/start in reverse topological order
+    latest_start, latest_finish = {}, {}
+    for task in reversed(ordered):
+        tid = task["id"]
+        latest_finish[tid] = min((latest_start[s] for s in successors[tid]), default=finish)
+        latest_start[tid] = latest_finish[tid] - duration[tid]
+
+    # Float comparisons: anything under a second of slack counts as none
+    slack = {tid: latest_start[tid] - earliest_start[tid] for tid in earliest_start}
+    critical = {tid for tid, s in slack.items() if s < 1 / 60}
+
+    # Walk back from the last-finishing critical task along the dependencies that drove each start
+    chain = []
+    tid = max((t for t in critical), key=lambda t: (earliest_finish[t], t), default=None)
+    while tid is not None:
+        chain.append(tid)
+        tid = driver[tid] if driver[tid] in critical else None
+    chain.reverse()
+
+    return {
+        "start": _datetime(project_begin),
+        "finish": _datetime(finish),
+        "duration_minutes": round(finish - project_begin),
+        "tasks": {
+            tid: {
+                "earliest_start": _datetime(earliest_start[tid]),
+                "earliest_finish": _datetime(earliest_finish[tid]),
+                "latest_start": _datetime(latest_start[tid]),
+                "latest_finish": _datetime(latest_finish[tid]),
+                "duration_minutes": duration[tid],
+                "slack_minutes": max(0, round(slack[tid])),
+                "critical": tid in critical,
+                "dependencies": deps_of[tid],
+            }
+            for tid in earliest_start
+        },
+        "critical_path": chain,
+    }
+
+
+def plan_reschedule(tasks: list, task_id: str, new_start: datetime, new_duration: int = None) -> list:
+    """
+    Move one task to new_start (optionally with a new duration) and cascade through its successors.
+
+    Successors are visited in topological order. A successor moves only when it would now start
+    before one of its dependencies finishes, and then only as far as the latest such finish.
+    Dependencies without a start_time are unscheduled and hold nothing back. Tasks that stay
+    put end the cascade along their branch. Nothing is written.
+    new_duration replaces the expected duration, so a complete task keeps its actual one.
+
+    Returns the changes, the moved task first: [{"id", "name", "old_start", "new_start"}, ...].
+    Raises CycleError on a dependency cycle and ValueError if task_id is not in tasks.
+    """
+    by_id = {t["id"]: t for t in tasks}
+    if task_id not in by_id:
+        raise ValueError("Task not found")
+
+    successors = {tid: [] for tid in by_id}
+    for t in tasks:
+        for dep in set(t.get("dependencies", []) or []):
+            if dep in successors:
+                successors[dep].append(t["id"])
+
+    # Only the tasks reachable from the moved one can be affected
+    reachable, stack = {task_id}, [task_id]
+    while stack:
+        for succ in successors[stack.pop()]:
+            if succ not in reachable:
+                reachable.add(succ)
+                stack.append(succ)
+
+    ordered, cyclic_ids = topological_order([by_id[tid] for tid in reachable])
+    if cyclic_ids:
+        raise CycleError(cyclic_ids, [by_id[tid].get("name", tid) for tid in cyclic_ids])
+
+    new_start = _as_utc(new_start)
+    starts = {task_id: new_start}
+    moved = by_id[task_id] if new_duration is None else {**by_id[task_id], "expected_duration": new_duration}
+    durations = {task_id: task_duration(moved)}
+
+    def finish(tid):
+        """When a task finishes, or None if it is unscheduled."""
+        start = starts.get(tid)
+        if start is None:
+            if not by_id[tid].get("start_time"):
+                return None
+            start = _as_utc(by_id[tid]["start_time"])
+        minutes = durations[tid] if tid in durations else task_duration(by_id[tid])
+        return start + timedelta(minutes=minutes)
+
+    for task in ordered:
+        tid = task["id"]
+        if tid == task_id:
+            continue
+        finishes = [finish(dep) for dep in task.get("dependencies", []) or [] if dep in by_id]
+        earliest = max((f for f in finishes if f is not None), default=None)
+        if earliest is None:
+            continue
+        current = _as_utc(task["start_time"]) if task.get("start_time") else None
+        if current is None or current < earliest:
+            starts[tid] = earliest
+
+    changes = []
+    for tid in [task_id] + [t["id"] for t in ordered if t["id"] != task_id]:
+        if tid not in starts:
+            continue
+        old = by_id[tid].get("start_time")
+        changes.append({
+            "id": tid,
+            "name": by_id[tid].get("name"),
+            "old_start": _as_utc(old) if old else None,
+            "new_start": starts[tid],
+        })
+    return changes
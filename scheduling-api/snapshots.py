@@ -0,0 +1,106 @@
+# scheduling-api/snapshots.py
+"""
+Point-in-time task progress ("what did the project look like last Friday").
+
+A snapshot stores the progress of every task of a project at one moment:
+    {"id", "project_id", "taken_at", "version", "tasks": {task_id: [latest_status, duration]}}
+Progress at any earlier-than-now time is the nearest snapshot at or before it, with
+the updates_col entries logged since then replayed on top. Snapshots are taken
+periodically by the report worker (report_snapshots.run_worker calls take_due_snapshots)
+and after status writes that leave no update record (restores). Reads never write one.
+
+Only progress is reconstructed; start times, durations and dependencies are the
+current ones. Take due snapshots by hand from the scheduling-api directory with:
+
+    python snapshots.py
+"""
+from datetime import datetime, timedelta
+import pytz
+from db import projects_col, updates_col, snapshots_col
+from createandget import _now, generate_unique_id, get_project_tasks
+from task_states import _as_utc
+
+SNAPSHOT_INTERVAL = timedelta(days=1)
+
+
+def _completed_duration(task: dict, completed_at: datetime) -> int:
+    """Actual minutes of a task completed at completed_at, as create_task_update computes them."""
+    return int((_as_utc(completed_at) - _as_utc(task["start_time"])).total_seconds() // 60)
+
+
+def take_snapshot(project_id: str, version: int = None):
+    """Store a snapshot of a project's current task progress, stamped with its version."""
+    at_time = _now()
+    tasks = get_project_tasks(project_id, {"_id": 0, "id": 1, "latest_status": 1, "duration": 1})
+    if version is None:
+        project = projects_col.find_one({"id": project_id}, {"_id": 0, "version": 1}) or {}
+        version = project.get("version", 0)
+    snapshot = {
+        "id": generate_unique_id(),
+        "project_id": project_id,
+        "taken_at": _as_utc(at_time),
+        "version": version,
+        "tasks": {t["id"]: [t.get("latest_status", 0), t.get("duration", 0)] for t in tasks},
+    }
+    snapshots_col.insert_one(snapshot)
+    return snapshot
+
+
+def take_due_snapshots(interval: timedelta = SNAPSHOT_INTERVAL) -> int:
+    """Snapshot every project changed since its last snapshot, if that is older than interval."""
+    cutoff = _now() - interval
+    taken = 0
+    for project in projects_col.find({}, {"_id": 0, "id": 1, "version": 1}):
+        last = snapshots_col.find_one(
+            {"project_id": project["id"]}, {"_id": 0, "taken_at": 1, "version": 1}, sort=[("taken_at", -1)]
+        )
+        if last and (_as_utc(last["taken_at"]) > cutoff or last.get("version") == project.get("version", 0)):
+            continue
+        take_snapshot(project["id"], version=project.get("version", 0))
+        taken += 1
+    return taken
+
+
+def project_tasks_at(project_id: str, at_time: datetime, projection: dict = None) -> list:
+    """
+    The project's tasks (get_project_tasks, with projection) as of at_time: tasks created
+    later are left out and latest_status/duration are rebuilt from the nearest snapshot
+    plus the updates logged since. at_time in the future returns the current tasks.
+    """
+    at_time = _as_utc(at_time)
+    if projection:
+        projection = {**projection, "id": 1, "start_time": 1, "created_at": 1, "latest_status": 1, "duration": 1}
+    tasks = get_project_tasks(project_id, projection)
+    if at_time >= datetime.now(pytz.UTC):
+        return tasks
+    tasks = [t for t in tasks if not t.get("created_at") or _as_utc(t["created_at"]) <= at_time]
+    by_id = {t["id"]: t for t in tasks}
+
+    snapshot = snapshots_col.find_one(
+        {"project_id": project_id, "taken_at": {"$lte": at_time}}, {"_id": 0, "taken_at": 1, "tasks": 1},
+        sort=[("taken_at", -1)]
+    )
+    progress = {tid: list(entry) for tid, entry in (snapshot or {}).get("tasks", {}).items()}
+
+    window = {"$lte": at_time}
+    if snapshot:
+        window["$gt"] = snapshot["taken_at"]
+    updates = updates_col.find(
+        {"task_id": {"$in": list(by_id)}, "timestamp": window},
+        {"_id": 0, "task_id": 1, "status_percentage": 1, "timestamp": 1}
+    ).sort([("timestamp", 1)])
+
+    for update in updates:
+        status = update.get("status_percentage", 0)
+        entry = progress.setdefault(update["task_id"], [0, 0])
+        entry[0] = status
+        if status == 100:
+            entry[1] = _completed_duration(by_id[update["task_id"]], update["timestamp"])
+
+    for task in tasks:
+        task["latest_status"], task["duration"] = progress.get(task["id"], (0, 0))
+    return tasks
+
+
+if __name__ == "__main__":
+    print(f"[SNAPSHOT] Took {take_due_snapshots()} snapshot(s).")
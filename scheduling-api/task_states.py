@@ -0,0 +1,265 @@
+# scheduling-api/task_states.py
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime, timedelta
+import pytz
+
+# Task states, in the order get_task_state checks for them
+POSTPONED = "postponed"
+DELAYED = "delayed"
+TENTATIVE = "tentative"
+COMPLETE = "complete"
+OVERDUE = "overdue"
+INCIPIENT = "incipient"
+IN_PROGRESS = "in progress"
+
+
+def _as_utc(value: datetime) -> datetime:
+    """Mongo hands back naive UTC datetimes; make them timezone-aware."""
+    if value.tzinfo is None:
+        return pytz.UTC.localize(value)
+    return value
+
+
+def evaluate_task_state(task: dict, state_of, at_time: datetime = None):
+    """
+    Determine the state of an already-loaded task document.
+    state_of(dep_id) must return the state of a dependency (or None if unknown);
+    dependencies are checked in order and the first incomplete one decides.
+    """
+    state, _, _ = evaluate_task_state_window(task, lambda dep_id: (state_of(dep_id), None, None), at_time)
+    return state
+
+
+def evaluate_task_state_window(task: dict, window_of, at_time: datetime = None):
+    """
+    Like evaluate_task_state, but also returns the interval the state holds for:
+    (state, valid_from, valid_until), valid for valid_from <= t < valid_until as long as
+    the task and its dependencies are not written. None bounds are open-ended.
+    window_of(dep_id) must return the same triple for a dependency.
+    """
+    if not at_time:
+        at_time = datetime.now(pytz.UTC)
+    at_time = _as_utc(at_time)
+
+    task_start = _as_utc(task.get("start_time") or datetime.now(pytz.UTC))
+    planned_end = task_start + timedelta(minutes=task.get("expected_duration", 0) or 0)
+
+    if task.get("postponed", False):
+        return POSTPONED, None, None
+
+    # The result holds only while every dependency looked at keeps its state
+    valid_from, valid_until = None, None
+    for dep_id in task.get("dependencies", []) or []:
+        dep_state, dep_from, dep_until = window_of(dep_id)
+        valid_from, valid_until = _intersect(valid_from, valid_until, dep_from, dep_until)
+        if dep_state in (DELAYED, OVERDUE):
+            return DELAYED, valid_from, valid_until
+        if dep_state != COMPLETE:
+            return TENTATIVE, valid_from, valid_until
+
+    progress = task.get("latest_status", 0)
+    if progress == 100:
+        return COMPLETE, valid_from, valid_until
+
+    if at_time < task_start:
+        return (TENTATIVE, *_intersect(valid_from, valid_until, None, task_start))
+
+    if at_time > planned_end:
+        return (OVERDUE, *_intersect(valid_from, valid_until, planned_end + _TICK, None))
+
+    window = _intersect(valid_from, valid_until, task_start, planned_end + _TICK)
+    if progress == 0:
+        return (INCIPIENT, *window)
+
+    return (IN_PROGRESS, *window)
+
+
+def is_task_closed(task: dict) -> bool:
+    """
+    A task at 100% that is not postponed. It takes no more updates until restored,
+    whatever its dependencies' states (its evaluated state may still be tentative or delayed).
+    """
+    return (task.get("latest_status", 0) or 0) == 100 and not task.get("postponed", False)
+
+
+# Smallest datetime step; "after planned_end" starts one tick past it
+_TICK = timedelta(microseconds=1)
+
+
+def _intersect(from_a, until_a, from_b, until_b):
+    """Intersect two [from, until) intervals whose None bounds are open-ended."""
+    valid_from = max((b for b in (from_a, from_b) if b is not None), default=None)
+    valid_until = min((b for b in (until_a, until_b) if b is not None), default=None)
+    return valid_from, valid_until
+
+
+def topological_order(tasks: list):
+    """
+    Order tasks so every task comes after the dependencies it has in the list (Kahn's algorithm).
+    Returns (ordered_tasks, cyclic_ids); tasks caught in a dependency cycle are appended
+    at the end in their original order and their ids reported in cyclic_ids.
+    """
+    by_id = {t["id"]: t for t in tasks if t and t.get("id")}
+    indegree = {tid: 0 for tid in by_id}
+    dependents = {tid: [] for tid in by_id}
+    for tid, task in by_id.items():
+        for dep in set(task.get("dependencies", []) or []):
+            if dep in by_id:
+                indegree[tid] += 1
+                dependents[dep].append(tid)
+
+    queue = deque(tid for tid in by_id if indegree[tid] == 0)
+    ordered = []
+    while queue:
+        tid = queue.popleft()
+        ordered.append(by_id[tid])
+        for child in dependents[tid]:
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                queue.append(child)
+
+    cyclic_ids = [tid for tid in by_id if indegree[tid] > 0]
+    ordered.extend(by_id[tid] for tid in cyclic_ids)
+    return ordered, cyclic_ids
+
+
+def get_project_task_states(tasks: list, at_time: datetime = None, versions: dict = None) -> dict:
+    """
+    Evaluate every task of a project in one pass, without touching the database.
+    tasks is the list returned by get_project_tasks; returns {task_id: state}.
+    Dependencies missing from the list (or stuck in a cycle) count as not complete.
+    versions ({project_id: version}, see project_versions) lets live states use state_cache.
+    """
+    return {tid: window[0] for tid, window in get_project_task_windows(tasks, at_time, versions).items()}
+
+
+def get_project_task_windows(tasks: list, at_time: datetime = None, versions: dict = None) -> dict:
+    """
+    get_project_task_states, returning {task_id: (state, valid_from, valid_until)}.
+    Only live evaluations of tasks whose project version is in versions use state_cache:
+    tasks evaluated at a given at_time may be rebuilt from history (snapshots.project_tasks_at)
+    and must not be cached under the live ids.
+    """
+    live = not at_time
+    at_time = _as_utc(at_time or datetime.now(pytz.UTC))
+    versions = versions or {}
+
+    ordered, _ = topological_order(tasks)
+    windows = {}
+    for task in ordered:
+        version = versions.get(task.get("project_id")) if live else None
+        dep_states = dependency_states(task, lambda dep_id: windows.get(dep_id, (None,))[0])
+        cached = state_cache.get(task, at_time, dep_states, version) if version is not None else None
+        if cached:
+            windows[task["id"]] = cached
+            continue
+        windows[task["id"]] = evaluate_task_state_window(
+            task, lambda dep_id: windows.get(dep_id, (None, None, None)), at_time
+        )
+        if version is not None:
+            state_cache.put(task, *windows[task["id"]], dep_states=dep_states, version=version)
+    return windows
+
+
+def dependency_states(task: dict, state_of) -> tuple:
+    """The states of all of a task's dependencies, in order: the state_cache key for them."""
+    return tuple(state_of(dep_id) for dep_id in task.get("dependencies", []) or [])
+
+
+def project_versions(projects) -> dict:
+    """{project_id: version} of loaded project documents, for get_project_task_windows."""
+    return {p["id"]: p.get("version", 0) for p in projects if p and p.get("id")}
+
+
+def states_valid_until(windows: dict):
+    """The first moment any of the windows' states changes (None if none ever will)."""
+    return min((w[2] for w in windows.values() if w[2] is not None), default=None)
+
+
+# ------------------------
+# State cache
+# ------------------------
+class TaskStateCache:
+    """
+    Per-process cache of task states, each stored with the interval it holds for
+    (see evaluate_task_state_window). An entry is served while
+      - at_time falls inside [valid_from, valid_until),
+      - the task's state-relevant fields are unchanged (fingerprint),
+      - its dependencies' states are those it was computed from (dependency_states),
+      - its project's version is the one it was computed under, and
+      - it is younger than max_age.
+    Every task write bumps its project's version, so writes in other worker processes
+    invalidate entries too; writes in this one also call invalidate(), which drops every
+    cached dependent. max_age bounds how long a change elsewhere can go unnoticed otherwise.
+    """
+
+    def __init__(self, max_entries: int = 10000, max_age: timedelta = timedelta(seconds=30)):
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._entries = OrderedDict()
+        self._dependents = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(task: dict) -> tuple:
+        return (
+            task.get("start_time"), task.get("expected_duration", 0), task.get("latest_status", 0),
+            bool(task.get("postponed", False)), tuple(task.get("dependencies", []) or []),
+        )
+
+    def get(self, task: dict, at_time: datetime, dep_states: tuple, version):
+        """Cached (state, valid_from, valid_until) for the task at at_time, or None.
+        dep_states and version must match the ones the entry was computed from."""
+        at_time = _as_utc(at_time)
+        now = datetime.now(pytz.UTC)
+        with self._lock:
+            entry = self._entries.get(task.get("id"))
+            if entry is None:
+                return None
+            fingerprint, state, valid_from, valid_until, cached_deps, cached_version, stored_at = entry
+            if (fingerprint != self.fingerprint(task) or now - stored_at > self.max_age
+                    or (valid_from is not None and at_time < valid_from)
+                    or (valid_until is not None and at_time >= valid_until)
+                    or dep_states != cached_deps or version != cached_version):
+                return None
+            self._entries.move_to_end(task["id"])
+            return state, valid_from, valid_until
+
+    def put(self, task: dict, state: str, valid_from: datetime, valid_until: datetime, dep_states: tuple, version):
+        task_id = task.get("id")
+        if not task_id:
+            return
+        with self._lock:
+            self._entries[task_id] = (
+                self.fingerprint(task), state, valid_from, valid_until, dep_states, version, datetime.now(pytz.UTC)
+            )
+            self._entries.move_to_end(task_id)
+            for dep_id in task.get("dependencies", []) or []:
+                self._dependents.setdefault(dep_id, set()).add(task_id)
+            while len(self._entries) > self.max_entries:
+                evicted, _ = self._entries.popitem(last=False)
+                self._dependents.pop(evicted, None)
+
+    def invalidate(self, task_ids):
+        """Drop the given tasks and, transitively, every task depending on them."""
+        if isinstance(task_ids, str):
+            task_ids = [task_ids]
+        with self._lock:
+            pending = list(task_ids)
+            seen = set()
+            while pending:
+                task_id = pending.pop()
+                if task_id in seen:
+                    continue
+                seen.add(task_id)
+                self._entries.pop(task_id, None)
+                pending.extend(self._dependents.pop(task_id, ()))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dependents.clear()
+
+
+state_cache = TaskStateCache()
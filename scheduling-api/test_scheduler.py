@@ -0,0 +1,43 @@
+# scheduling-api/test_scheduler.py
+from datetime import datetime, timedelta
+import pytz
+from scheduler import plan_reschedule
+
+T0 = datetime(2026, 3, 1, 8, 0, tzinfo=pytz.UTC)
+
+
+def _task(task_id, start, expected=60, deps=(), **fields):
+    return {"id": task_id, "name": task_id, "start_time": start, "expected_duration": expected,
+            "latest_status": 0, "dependencies": list(deps), **fields}
+
+
+def _starts(changes):
+    return {c["id"]: c["new_start"] for c in changes}
+
+
+def test_cascade_pushes_back_violated_dependents():
+    tasks = [_task("a", T0), _task("b", T0 + timedelta(hours=1), deps=["a"])]
+    changes = plan_reschedule(tasks, "a", T0 + timedelta(hours=2))
+    assert _starts(changes) == {"a": T0 + timedelta(hours=2), "b": T0 + timedelta(hours=3)}
+
+
+def test_unscheduled_dependency_holds_nothing_back():
+    # c depends on the moved task and on a task without a start_time
+    tasks = [
+        _task("a", T0),
+        _task("u", None),
+        _task("c", T0 + timedelta(hours=1), deps=["u", "a"]),
+        _task("d", T0 + timedelta(hours=1), deps=["u"]),
+    ]
+    changes = plan_reschedule(tasks, "a", T0 + timedelta(hours=2))
+    assert _starts(changes) == {"a": T0 + timedelta(hours=2), "c": T0 + timedelta(hours=3)}
+
+
+def test_new_duration_keeps_complete_task_actual_duration():
+    tasks = [
+        _task("a", T0, latest_status=100, duration=30),
+        _task("b", T0 + timedelta(minutes=30), deps=["a"]),
+    ]
+    # The cascade plans with the recorded 30 actual minutes, not the new planned 120
+    changes = plan_reschedule(tasks, "a", T0 + timedelta(hours=1), new_duration=120)
+    assert _starts(changes)["b"] == T0 + timedelta(minutes=90)
@@ -0,0 +1,40 @@
+# scheduling-api/test_task_states.py
+from datetime import datetime, timedelta
+import pytz
+from task_states import (
+    DELAYED, TENTATIVE, TaskStateCache, dependency_states, get_project_task_states, is_task_closed,
+)
+
+NOW = datetime(2026, 3, 2, 12, 0, tzinfo=pytz.UTC)
+
+
+def _task(task_id, start, **fields):
+    return {"id": task_id, "start_time": start, "expected_duration": 60, "latest_status": 0, **fields}
+
+
+def test_closed_task_with_incomplete_dependency():
+    # A task at 100% whose dependency is not done evaluates as tentative/delayed, yet it
+    # refuses updates, so restore has to accept it
+    dep = _task("dep", NOW + timedelta(days=1))
+    done = _task("done", NOW - timedelta(hours=3), latest_status=100, dependencies=["dep"])
+    assert get_project_task_states([dep, done], NOW)["done"] == TENTATIVE
+    assert is_task_closed(done)
+
+    late_dep = _task("dep", NOW - timedelta(days=1))
+    assert get_project_task_states([late_dep, done], NOW)["done"] == DELAYED
+    assert is_task_closed(done)
+
+
+def test_postponed_or_unfinished_task_is_not_closed():
+    assert not is_task_closed(_task("a", NOW, latest_status=100, postponed=True))
+    assert not is_task_closed(_task("b", NOW, latest_status=90))
+
+
+def test_state_cache_entry_needs_same_dependency_states_and_version():
+    cache = TaskStateCache()
+    task = _task("t", NOW - timedelta(hours=1), dependencies=["dep"])
+    dep_states = dependency_states(task, {"dep": "complete"}.get)
+    cache.put(task, "in progress", None, None, dep_states=dep_states, version=3)
+    assert cache.get(task, NOW, dep_states, 3) == ("in progress", None, None)
+    assert cache.get(task, NOW, ("in progress",), 3) is None
+    assert cache.get(task, NOW, dep_states, 4) is None
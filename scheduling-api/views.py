@@ -1,150 +1,550 @@
 # scheduling-api/views.py
-from datetime import timedelta
-from createandget import get_latest_progress, get_task_state
+import bisect
+import heapq
+import itertools
+import json
+from datetime import datetime, timedelta
+from functools import lru_cache
 import pytz
 from helpers import format_duration
+from task_states import _as_utc, get_project_task_states
 
+DEFAULT_TIMEZONE = 'Africa/Nairobi'
+DISPLAY_FORMAT = "%A, %B %d, %Y at %I:%M %p"
 
-def generate_timetable(project, tasks):
+
+@lru_cache(maxsize=64)
+def _timezone(name: str):
+    """pytz timezone objects are expensive to build; build each one once."""
+    return pytz.timezone(name)
+
+
+# UTC offsets only change on the hour or half hour, so conversions are cached per half-hour slot
+_SLOT_MINUTES = 30
+
+
+def _slot(naive) -> tuple:
+    return naive.year, naive.month, naive.day, naive.hour, naive.minute // _SLOT_MINUTES
+
+
+@lru_cache(maxsize=65536)
+def _tzinfo_at(timezone, slot):
+    year, month, day, hour, part = slot
+    return timezone.localize(datetime(year, month, day, hour, part * _SLOT_MINUTES)).tzinfo
+
+
+@lru_cache(maxsize=65536)
+def _offset_at(timezone, slot):
+    year, month, day, hour, part = slot
+    return pytz.UTC.localize(datetime(year, month, day, hour, part * _SLOT_MINUTES)).astimezone(timezone).utcoffset()
+
+
+def _localize(naive, timezone):
+    """timezone.localize(naive), without pytz's per-call search for the right offset."""
+    return naive.replace(tzinfo=_tzinfo_at(timezone, _slot(naive)))
+
+
+def _local(dt, timezone):
+    """Wall-clock time in timezone, as a naive datetime (the cache key for _date_labels)."""
+    utc = dt.replace(tzinfo=None) - dt.utcoffset()
+    return utc + _offset_at(timezone, _slot(utc))
+
+
+@lru_cache(maxsize=16384)
+def _date_labels(local_dt) -> tuple:
     """
-    FIXED: Generate timetable with proper date formatting including month/day names
+    Display strings for a naive local datetime, from a single strftime call.
+    Returns (formatted, date, time, day_of_week, month). Rows share start/end
+    minutes often enough that caching the labels pays off.
     """
+    day, month, day_num, year, clock, iso_date = local_dt.strftime("%A|%B|%d|%Y|%I:%M %p|%Y-%m-%d").split("|")
+    return f"{day}, {month} {day_num}, {year} at {clock}", iso_date, clock, day, month
+
+
+@lru_cache(maxsize=4096)
+def _duration_label(minutes) -> str:
+    return format_duration(minutes)
+
+
+def _row_duration(task, progress):
+    """Expected duration, or the actual one once the task is complete."""
+    if progress == 100 and task.get('duration', 0) > 0:
+        return task['duration']
+    return task.get('expected_duration', 0)
+
+
+def _timetable_header(project):
     # Get project timezone (default to Africa/Nairobi if not specified)
-    timezone_str = project.get('timezone', 'Africa/Nairobi')
-    timezone = pytz.timezone(timezone_str)
-    
+    timezone_str = project.get('timezone', DEFAULT_TIMEZONE)
+    timezone = _timezone(timezone_str)
+
     # Make project start date timezone-aware if it isn't already
     project_start = project['start_date']
     if project_start.tzinfo is None:
         project_start = timezone.localize(project_start)
-    
-    # Ensure all task start_times are timezone-aware BEFORE sorting
-    for t in tasks:
-        if t['start_time'].tzinfo is None:
-            t['start_time'] = timezone.localize(t['start_time'])
-
-    sorted_tasks = sorted(tasks, key=lambda t: t['start_time'])
-    timetable = []
+
+    return {
+        "project_name": project['name'],
+        "project_start": project_start.isoformat(),
+        "project_start_formatted": project_start.astimezone(timezone).strftime(DISPLAY_FORMAT),
+        "timezone": timezone_str,
+    }, project_start, timezone
+
+
+def iter_timetable_rows(project_start, timezone, sorted_tasks, states):
+    """Timetable rows for tasks already sorted by start time; each row starts after the previous one ends."""
     current_time = project_start
 
     for task in sorted_tasks:
-        # task['start_time'] is now guaranteed to be timezone-aware
+        # Ensure the task start_time is timezone-aware before comparing
         task_start = task['start_time']
+        if task_start.tzinfo is None:
+            task_start = _localize(task_start, timezone)
         start = max(task_start, current_time)
-        
+
         # Use expected_duration if task not complete, otherwise use actual duration
-        task_progress = get_latest_progress(task['id'])
-        if task_progress == 100 and task.get('duration', 0) > 0:
-            duration_to_use = task['duration']
-        else:
-            duration_to_use = task.get('expected_duration', 0)
-            
-        end = start + timedelta(minutes=duration_to_use)
-        state = get_task_state(task['id'])
+        task_progress = task.get('latest_status', 0)
+        end = start + timedelta(minutes=_row_duration(task, task_progress))
 
         # FIXED: Format dates with month and day names
-        start_local = start.astimezone(timezone)
-        end_local = end.astimezone(timezone)
+        start_formatted, start_date, start_clock, day_of_week, month = _date_labels(_local(start, timezone))
+        end_formatted, end_date, end_clock, _, _ = _date_labels(_local(end, timezone))
 
-        timetable.append({
+        yield {
             "task": task['name'],
             "start": start.isoformat(),
             "end": end.isoformat(),
             # FIXED: Add human-readable date formats
-            "start_formatted": start_local.strftime("%A, %B %d, %Y at %I:%M %p"),
-            "end_formatted": end_local.strftime("%A, %B %d, %Y at %I:%M %p"),
-            "start_date": start_local.strftime("%Y-%m-%d"),
-            "start_time": start_local.strftime("%I:%M %p"),
-            "end_date": end_local.strftime("%Y-%m-%d"),
-            "end_time": end_local.strftime("%I:%M %p"),
-            "day_of_week": start_local.strftime("%A"),
-            "month": start_local.strftime("%B"),
-            "expected_duration": format_duration(task['expected_duration']),
-            **({"actual_duration": format_duration(task['duration'])}
-                if get_latest_progress(task['id']) == 100 else {}),
+            "start_formatted": start_formatted,
+            "end_formatted": end_formatted,
+            "start_date": start_date,
+            "start_time": start_clock,
+            "end_date": end_date,
+            "end_time": end_clock,
+            "day_of_week": day_of_week,
+            "month": month,
+            "expected_duration": _duration_label(task['expected_duration']),
+            **({"actual_duration": _duration_label(task['duration'])}
+                if task_progress == 100 else {}),
             "members": task.get('members', []),
-            "progress": get_latest_progress(task['id']),
-            "state": state,
+            "progress": task_progress,
+            "state": states.get(task['id']),
             "priority": task.get('priority', 'medium'),
             "estimated_cost": task.get('estimated_cost', 0)
-        })
+        }
         current_time = end
 
-    return {
-        "project_name": project['name'],
-        "project_start": project_start.isoformat(),
-        "project_start_formatted": project_start.astimezone(timezone).strftime("%A, %B %d, %Y at %I:%M %p"),
-        "timezone": timezone_str,
-        "tasks": timetable
-    }
 
-def generate_gantt_chart(tasks):
+def generate_timetable(project, tasks, at_time=None, states=None):
     """
-    FIXED: Generate gantt chart with proper data from database (no dummy data)
+    FIXED: Generate timetable with proper date formatting including month/day names
+    Progress and state come from the loaded task documents (one pre-pass, no per-task queries).
+    at_time evaluates the states at another moment (see snapshots.project_tasks_at).
+    states, when the caller already evaluated them, is used as is.
     """
-    chart = []
-    
-    if not tasks:
-        return {
-            "message": "No tasks found",
-            "tasks": []
-        }
-    
+    header, project_start, timezone = _timetable_header(project)
+
+    # Evaluate states from the stored (UTC) start times
+    if states is None:
+        states = get_project_task_states(tasks, at_time)
+
+    # Sort on timezone-aware start times
+    def aware_start(t):
+        start_time = t['start_time']
+        return _localize(start_time, timezone) if start_time.tzinfo is None else start_time
+
+    sorted_tasks = sorted(tasks, key=aware_start)
+    return {**header, "tasks": list(iter_timetable_rows(project_start, timezone, sorted_tasks, states))}
+
+
+def iter_gantt_rows(tasks, states):
+    # Default to Africa/Nairobi: tasks carry no timezone of their own
+    timezone = _timezone(DEFAULT_TIMEZONE)
+
     for task in tasks:
         # Make task start time timezone-aware if it isn't already
         task_start = task['start_time']
         if task_start.tzinfo is None:
-            # Default to Africa/Nairobi if no timezone info available
-            timezone = pytz.timezone('Africa/Nairobi')
-            task_start = timezone.localize(task_start)
-        
+            task_start = _localize(task_start, timezone)
+
         # Use expected_duration if task not complete, otherwise use actual duration
-        task_progress = get_latest_progress(task['id'])
-        if task_progress == 100 and task.get('duration', 0) > 0:
-            duration_to_use = task['duration']
-            duration_label = "actual_duration"
-        else:
-            duration_to_use = task.get('expected_duration', 0)
-            duration_label = "expected_duration"
-            
-        end_time = task_start + timedelta(minutes=duration_to_use)
-        state = get_task_state(task['id'])
-        
-        # Format dates for display
-        task_start_local = task_start.astimezone(pytz.timezone('Africa/Nairobi'))
-        end_time_local = end_time.astimezone(pytz.timezone('Africa/Nairobi'))
-        
+        task_progress = task.get('latest_status', 0)
+        end_time = task_start + timedelta(minutes=_row_duration(task, task_progress))
+
+        members = task.get('members', [])
         chart_item = {
             "id": task['id'],
             "task": task['name'],
             "start": task_start.isoformat(),
             "end": end_time.isoformat(),
-            "start_formatted": task_start_local.strftime("%A, %B %d, %Y at %I:%M %p"),
-            "end_formatted": end_time_local.strftime("%A, %B %d, %Y at %I:%M %p"),
-            "expected_duration": format_duration(task.get('expected_duration', 0)),
+            # Format dates for display
+            "start_formatted": _date_labels(_local(task_start, timezone))[0],
+            "end_formatted": _date_labels(_local(end_time, timezone))[0],
+            "expected_duration": _duration_label(task.get('expected_duration', 0)),
             "priority": task.get('priority', 'medium'),
             "progress": task_progress,
-            "members": task.get('members', []),
-            "members_display": ", ".join(task.get('members', [])) if task.get('members') else "No members assigned",
-            "state": state,
+            "members": members,
+            "members_display": ", ".join(members) if members else "No members assigned",
+            "state": states.get(task['id']),
             "estimated_cost": task.get('estimated_cost', 0),
             "description": task.get('description', ''),
             "dependencies": task.get('dependencies', [])
         }
-        
+
         # Add actual duration if task is complete
         if task_progress == 100 and task.get('duration', 0) > 0:
-            chart_item["actual_duration"] = format_duration(task['duration'])
+            chart_item["actual_duration"] = _duration_label(task['duration'])
             chart_item["duration_variance"] = task['duration'] - task.get('expected_duration', 0)
-            chart_item["duration_variance_formatted"] = format_duration(abs(chart_item["duration_variance"]))
+            chart_item["duration_variance_formatted"] = _duration_label(abs(chart_item["duration_variance"]))
             chart_item["is_overdue"] = chart_item["duration_variance"] > 0
-        
-        chart.append(chart_item)
-    
+
+        yield chart_item
+
+
+class GanttCounts:
+    """Running progress counts for the Gantt summary."""
+
+    def __init__(self):
+        self.total = self.completed = self.in_progress = self.not_started = 0
+
+    def add(self, progress):
+        self.total += 1
+        if progress == 100:
+            self.completed += 1
+        elif progress == 0:
+            self.not_started += 1
+        elif 0 < progress < 100:
+            self.in_progress += 1
+
+    def summary(self) -> dict:
+        return {
+            "total_tasks": self.total,
+            "completed_tasks": self.completed,
+            "in_progress_tasks": self.in_progress,
+            "not_started_tasks": self.not_started,
+        }
+
+
+def generate_gantt_chart(tasks, at_time=None, states=None):
+    """
+    FIXED: Generate gantt chart with proper data from database (no dummy data)
+    Progress and state come from the loaded task documents (one pre-pass, no per-task queries).
+    at_time evaluates the states at another moment (see snapshots.project_tasks_at).
+    states, when the caller already evaluated them, is used as is.
+    """
+    if not tasks:
+        return {
+            "message": "No tasks found",
+            "tasks": []
+        }
+
+    if states is None:
+        states = get_project_task_states(tasks, at_time)
+    counts = GanttCounts()
+    chart = []
+    for row in iter_gantt_rows(tasks, states):
+        counts.add(row['progress'])
+        chart.append(row)
+
+    return {**counts.summary(), "tasks": chart}
+
+
+def generate_portfolio_gantt(projects, tasks, states):
+    """
+    One timeline across a company's projects: Gantt rows for tasks of every project (already
+    ordered by start time), each tagged with its project, plus a span and counts per project.
+    states must also cover dependencies that are not in tasks.
+    """
+    names = {p['id']: p.get('name') for p in projects}
+    spans = {p['id']: {"start": None, "end": None, "counts": GanttCounts()} for p in projects}
+    counts = GanttCounts()
+    chart = []
+    for task, row in zip(tasks, iter_gantt_rows(tasks, states)):
+        project_id = task.get('project_id')
+        row["project_id"] = project_id
+        row["project_name"] = names.get(project_id)
+        counts.add(row['progress'])
+        span = spans.get(project_id)
+        if span:
+            span["counts"].add(row['progress'])
+            # Rows come in start order, so the first one starts the span
+            span["start"] = span["start"] or row["start"]
+            end = datetime.fromisoformat(row["end"])
+            if span["end"] is None or end > span["end"]:
+                span["end"] = end
+        chart.append(row)
+
     return {
-        "total_tasks": len(chart),
-        "completed_tasks": len([t for t in chart if t['progress'] == 100]),
-        "in_progress_tasks": len([t for t in chart if 0 < t['progress'] < 100]),
-        "not_started_tasks": len([t for t in chart if t['progress'] == 0]),
-        "tasks": chart
-    }
\ No newline at end of file
+        **counts.summary(),
+        "projects": [{
+            "id": p['id'],
+            "name": p.get('name'),
+            "start": spans[p['id']]["start"],
+            "end": spans[p['id']]["end"].isoformat() if spans[p['id']]["end"] else None,
+            **spans[p['id']]["counts"].summary(),
+        } for p in projects],
+        "tasks": chart,
+    }
+
+
+# ------------------------
+# Burndown
+# ------------------------
+BURNDOWN_INTERVALS = {"day": timedelta(days=1), "week": timedelta(weeks=1)}
+MAX_BURNDOWN_BUCKETS = 730
+
+
+def _bucket_starts(first, last, interval, timezone):
+    """Starts of the day/week buckets (local midnight, weeks from Monday) covering [first, last]."""
+    local = first.astimezone(timezone)
+    day = datetime(local.year, local.month, local.day)
+    if interval == "week":
+        day -= timedelta(days=day.weekday())
+    starts = []
+    while True:
+        start = timezone.localize(day)
+        starts.append(start)
+        if start > last:
+            return starts  # the last entry only closes the final bucket
+        if len(starts) > MAX_BURNDOWN_BUCKETS + 1:
+            raise ValueError(f"Too many {interval} buckets; use a shorter range or interval=week")
+        day += BURNDOWN_INTERVALS[interval]
+
+
+def generate_burndown(project, tasks, interval="day", at_time=None):
+    """
+    Planned vs actual progress per day/week bucket, for tasks from get_progress_history.
+    Work is weighted by expected_duration (by task count if no task has one):
+        planned  share of work that should be done by the bucket's end, with each task
+                 progressing linearly from start_time to start_time + expected_duration
+        actual   share done by the bucket's end: each task's last status in or before the
+                 bucket (forward-filled), its current latest_status from the bucket holding
+                 at_time on; None for buckets that have not started yet
+    Returns the series and, as valid_until, the end of the current bucket.
+    """
+    timezone = _timezone(project.get('timezone', DEFAULT_TIMEZONE))
+    now = at_time or datetime.now(pytz.UTC)
+    header = {"project": project['name'], "interval": interval}
+    if not tasks:
+        return {**header, "unit": "minutes", "total": 0, "series": []}, None
+
+    starts = [_as_utc(t['start_time']) for t in tasks]
+    ends = [start + timedelta(minutes=t.get('expected_duration') or 0) for start, t in zip(starts, tasks)]
+    first = min(starts + ([_as_utc(project['start_date'])] if project.get('start_date') else []))
+    edges = _bucket_starts(first, max(ends + [now]), interval, timezone)
+    bucket_ends = [_as_utc(edge) for edge in edges[1:]]
+    current = bisect.bisect_right(bucket_ends, now)  # bucket holding now
+
+    unit = "minutes"
+    weights = [max(t.get('expected_duration') or 0, 0) for t in tasks]
+    if not any(weights):
+        unit, weights = "tasks", [1] * len(tasks)
+    total = sum(weights)
+
+    count = len(bucket_ends)
+    planned = [0.0] * count
+    planned_from = [0.0] * (count + 1)  # work planned to be complete from bucket i on (prefix sums)
+    actual = [0.0] * (count + 1)  # changes in actual work done, summed into a running total
+    completed = [0] * (count + 1)
+    for task, start, end, weight in zip(tasks, starts, ends, weights):
+        # Buckets ending inside the task window get a partial share; later ones the full weight
+        first_partial = bisect.bisect_right(bucket_ends, start)
+        done_from = bisect.bisect_left(bucket_ends, end)
+        for i in range(first_partial, min(done_from, count)):
+            planned[i] += weight * (bucket_ends[i] - start) / (end - start)
+        planned_from[min(done_from, count)] += weight
+
+        status = 0
+        for entry in task.get('progress', []):
+            i = bisect.bisect_right(bucket_ends, _as_utc(entry['_id']))
+            if i >= current:
+                continue
+            new_status = entry.get('status') or 0
+            actual[i] += weight * (new_status - status) / 100
+            completed[i] += (new_status >= 100) - (status >= 100)
+            status = new_status
+        latest = task.get('latest_status') or 0
+        actual[current] += weight * (latest - status) / 100
+        completed[current] += (latest >= 100) - (status >= 100)
+
+    series = []
+    planned_done = actual_done = done_tasks = 0
+    for i, (edge, end) in enumerate(zip(edges, edges[1:])):
+        planned_done += planned_from[i]
+        actual_done += actual[i]
+        done_tasks += completed[i]
+        started = i <= current
+        planned_value = planned_done + planned[i]
+        series.append({
+            "start": edge.isoformat(),
+            "end": end.isoformat(),
+            "planned_percent": round(planned_value / total * 100, 1),
+            "actual_percent": round(actual_done / total * 100, 1) if started else None,
+            "planned_remaining": round(total - planned_value, 1),
+            "actual_remaining": round(total - actual_done, 1) if started else None,
+            "completed_tasks": done_tasks if started else None,
+        })
+
+    valid_until = bucket_ends[current] if current < count else None
+    return {**header, "unit": unit, "total": total, "series": series}, valid_until
+
+
+# ------------------------
+# Member workload
+# ------------------------
+MAX_LISTED_OVERLAPS = 50
+
+
+def _member_workload(member, rows, window_start, window_end, bucket_ends, names):
+    """Bucketed minutes, overlaps and completion for one member's rows (ordered by start_time)."""
+    minutes = [0.0] * len(bucket_ends)
+    overlaps = []
+    overlap_count = 0
+    events = []
+    active = []  # heap of (planned_end, row index) of assignments still running
+    max_concurrent = completed = 0
+    for index, row in enumerate(rows):
+        start, end = _as_utc(row['start_time']), _as_utc(row['planned_end'])
+        if (row.get('latest_status') or 0) >= 100:
+            completed += 1
+
+        # Scheduled minutes, clipped to the window and split across buckets
+        clip_start, clip_end = max(start, window_start), min(end, window_end)
+        i = bisect.bisect_right(bucket_ends, clip_start)
+        bucket_start = clip_start
+        while clip_start < clip_end and i < len(bucket_ends):
+            part_end = min(bucket_ends[i], clip_end)
+            minutes[i] += (part_end - bucket_start).total_seconds() / 60
+            if part_end == clip_end:
+                break
+            bucket_start = part_end
+            i += 1
+
+        if end <= start:
+            continue
+
+        # Sweep: every assignment still running when this one starts overlaps it
+        while active and active[0][0] <= start:
+            heapq.heappop(active)
+        for other_end, other in active:
+            overlap_count += 1
+            if len(overlaps) < MAX_LISTED_OVERLAPS:
+                overlaps.append({
+                    "tasks": [_assignment(rows[other], names), _assignment(row, names)],
+                    "from": start.isoformat(),
+                    "until": min(end, other_end).isoformat(),
+                    "minutes": round((min(end, other_end) - start).total_seconds() / 60),
+                })
+        heapq.heappush(active, (end, index))
+        events += [(start, 1), (end, -1)]
+        max_concurrent = max(max_concurrent, len(active))
+
+    # Time with two or more assignments running at once
+    overlap_minutes = 0.0
+    running = 0
+    previous = None
+    for moment, change in sorted(events):
+        if running >= 2:
+            overlap_minutes += (moment - previous).total_seconds() / 60
+        running += change
+        previous = moment
+
+    return {
+        "member": member,
+        "tasks": len(rows),
+        "completed_tasks": completed,
+        "completion_rate": round(completed / len(rows) * 100, 1) if rows else 0,
+        "scheduled_minutes": round(sum(minutes)),
+        "minutes": [round(m) for m in minutes],
+        "max_concurrent": max_concurrent,
+        "overlap_minutes": round(overlap_minutes),
+        "overlap_count": overlap_count,
+        "overlaps": overlaps,
+    }
+
+
+def _assignment(row, names):
+    return {"id": row['id'], "name": row.get('name'), "project": names.get(row.get('project_id'))}
+
+
+def generate_workload(projects, rows, window_start, window_end, interval="day", timezone_str=DEFAULT_TIMEZONE):
+    """
+    Per-member workload over [window_start, window_end) for rows from get_member_assignments
+    (ordered by member, start_time): scheduled minutes per day/week bucket (start_time to
+    start_time + expected_duration), overlapping assignments and completion rates, from one
+    sweep over each member's assignments. Members are listed busiest first.
+    """
+    timezone = _timezone(timezone_str)
+    edges = _bucket_starts(window_start, window_end, interval, timezone)
+    # The window starts and ends on its own bounds, not on bucket boundaries
+    while len(edges) > 1 and edges[-2] >= window_end:
+        edges.pop()
+    bucket_ends = [_as_utc(edge) for edge in edges[1:]]
+    names = {p['id']: p.get('name') for p in projects}
+
+    members = [
+        _member_workload(member, list(member_rows), _as_utc(window_start), _as_utc(window_end), bucket_ends, names)
+        for member, member_rows in itertools.groupby(rows, key=lambda r: r['member'])
+    ]
+    members.sort(key=lambda m: (-m["scheduled_minutes"], m["member"]))
+    return {
+        "interval": interval,
+        "from": window_start.isoformat(),
+        "to": window_end.isoformat(),
+        "timezone": timezone_str,
+        "buckets": [edge.isoformat() for edge in edges[:-1]],
+        "members": members,
+    }
+
+
+# ------------------------
+# Streaming responses
+# ------------------------
+STREAM_CHUNK_ROWS = 500
+
+
+def _stream_array(rows, on_row=None):
+    """Yield a JSON array of rows in chunks of STREAM_CHUNK_ROWS elements."""
+    yield "["
+    chunk = []
+    first = True
+    for row in rows:
+        if on_row:
+            on_row(row)
+        chunk.append(json.dumps(row))
+        if len(chunk) >= STREAM_CHUNK_ROWS:
+            yield ("" if first else ",") + ",".join(chunk)
+            first = False
+            chunk = []
+    if chunk:
+        yield ("" if first else ",") + ",".join(chunk)
+    yield "]"
+
+
+def stream_gantt_chart(tasks, states):
+    """
+    generate_gantt_chart as a stream of JSON text, for tasks read lazily from a cursor.
+    states must cover the whole project (dependencies may sit anywhere in it).
+    Same document shape; the summary counts are written after the task list.
+    """
+    rows = iter_gantt_rows(tasks, states)
+    first = next(rows, None)
+    if first is None:
+        yield json.dumps({"message": "No tasks found", "tasks": []})
+        return
+
+    counts = GanttCounts()
+    yield '{"tasks":'
+    yield from _stream_array(itertools.chain([first], rows), on_row=lambda row: counts.add(row['progress']))
+    yield "," + json.dumps(counts.summary())[1:]
+
+
+def stream_timetable(project, sorted_tasks, states):
+    """
+    generate_timetable as a stream of JSON text; sorted_tasks must come ordered by start_time.
+    states must cover the whole project.
+    """
+    header, project_start, timezone = _timetable_header(project)
+    yield json.dumps(header)[:-1] + ',"tasks":'
+    yield from _stream_array(iter_timetable_rows(project_start, timezone, sorted_tasks, states))
+    yield "}"